@@ -0,0 +1,81 @@
+'''
+Measures the board commands of one image capture ("m a", "l i", "l o" and "h")
+sent with the previous sleeping send, sent one at a time, and sent as the two
+batches the camera now uses, over the fake board on a pseudo-terminal. The
+fake board reads newline terminated commands, so the light commands of a
+batch are not waited for. Logs go to a temporary directory that is removed
+afterwards.
+
+Run from the src directory:
+    python -m benchmarks.capture_benchmark [num_captures] [board_delay]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+log_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = log_dir
+
+from serial import Serial
+from benchmarks.fake_arduino import FakeArduino
+from benchmarks.serial_benchmark import legacy_send
+from production_files import logger
+from production_files.receivers.camera_communicator import BoardCommunicator
+
+def capture_messages(i):
+    
+    return ["m a %d %d 0" %(i, i), "l i %d" %(i % 12), "l o", "h"]
+
+def legacy(connection, i):
+    
+    for message in capture_messages(i):
+        assert legacy_send(connection, message) == 0
+
+def single(board_comm, i):
+
+    for message in capture_messages(i):
+        assert board_comm.send(message) == 0
+
+def batched(board_comm, i):
+
+    messages = capture_messages(i)
+    
+    assert board_comm.send_batch(messages[:2]) == [0, 0]
+    assert board_comm.send_batch(messages[2:]) == [0, 0]
+
+def run(capture, connection, num_captures):
+    """
+    Returns the mean board time of a capture in milliseconds.
+    """
+
+    start = time.time()
+    for i in xrange(num_captures):
+        capture(connection, i)
+
+    return (time.time() - start) / num_captures * 1000
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+
+    board = FakeArduino(response_delay = delay)
+
+    try:
+        connection = Serial(board.port, 115200)
+        print "Sleeping send:         %8.2f ms/capture" %run(legacy, connection, 2)
+        connection.close()
+        
+        #connects at the fake board's port, with the real handshake delays
+        board_comm = BoardCommunicator(board.port, request_terminator = "\n")
+
+        print "One command at a time: %8.2f ms/capture" %run(single, board_comm, num)
+        print "Batched:               %8.2f ms/capture" %run(batched, board_comm, num)
+
+        board_comm.close()
+    finally:
+        board.close()
+        logger.flush_all()
+        shutil.rmtree(log_dir)
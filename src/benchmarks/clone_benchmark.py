@@ -0,0 +1,120 @@
+'''
+Measures the cost of fanning a multi-sample tweet out into transactions, as
+the translator does for "sample(1,2,3,4,5,6,7,8,9,10,11,12) -a -b". Compares
+Transaction.clone against the copy.deepcopy of the previous __dict__ based
+transaction, in clones per second, objects allocated per clone and bytes per
+transaction.
+
+Run from the src directory:
+    python -m benchmarks.clone_benchmark [num_tweets]
+'''
+
+import datetime
+import gc
+import sys
+import time
+from copy import deepcopy
+from production_files.transaction import Transaction
+
+SAMPLES = range(1, 13)
+FLAGS = ['a', 'b']
+
+class NullLogger(object):
+    
+    def log(self, *messages):
+        pass
+
+class LegacyTransaction(object):
+    """
+    The attributes of a transaction before it had slots, with its deepcopy.
+    """
+    
+    def __init__(self, logger, to_id, command, command_args, origin):
+        
+        self.to_id = to_id
+        self._logger = logger
+        self.command = command
+        self.command_args = command_args
+        self.processed = False
+        self.attempts = 0
+        self._origin = origin
+        self.finished = False
+        self.id = 1
+        self.created = time.time()
+        self.hops = []
+        
+    def __deepcopy__(self, memo):
+        
+        cls = self.__class__
+        result = cls.__new__(cls)
+        memo[id(self)] = result
+        
+        for k, v in self.__dict__.items():
+            if k == '_logger':
+                setattr(result, k, v)
+                continue
+            
+            setattr(result, k, deepcopy(v, memo))
+            
+        return result
+
+def deepcopy_clone(transaction, command_args):
+    """
+    The previous Router.clone_transaction.
+    """
+    
+    new_transaction = deepcopy(transaction)
+    new_transaction.command_args = command_args
+    new_transaction.finished = new_transaction.processed = False
+    new_transaction.attempts = 0
+    
+    return new_transaction
+
+def slots_clone(transaction, command_args):
+    
+    return transaction.clone(command_args = command_args)
+
+def fan_out(clone, transaction):
+    """
+    Makes one transaction per sample from a camera transaction, the way the
+    translator does.
+    """
+    
+    return [clone(transaction, [s, FLAGS]) for s in SAMPLES]
+
+def run(transaction_class, clone, num_tweets):
+    """
+    Returns the clones per second, the number of garbage-collector tracked
+    objects allocated per clone and the size in bytes of a transaction.
+    """
+    
+    transaction = transaction_class(NullLogger(), "camera", "get_image", 
+                                    [SAMPLES[0], FLAGS, datetime.datetime.now()],
+                                    "a_user")
+    size = sys.getsizeof(transaction)
+    if hasattr(transaction, '__dict__'):
+        size += sys.getsizeof(transaction.__dict__)
+    
+    start = time.time()
+    for i in xrange(num_tweets):
+        fan_out(clone, transaction)
+    rate = num_tweets * len(SAMPLES) / (time.time() - start)
+    
+    gc.collect()
+    gc.disable()
+    before = len(gc.get_objects())
+    kept = [fan_out(clone, transaction) for i in xrange(1000)]
+    allocated = len(gc.get_objects()) - before
+    gc.enable()
+    
+    return rate, float(allocated) / (len(kept) * len(SAMPLES)), size
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    
+    for name, transaction_class, clone in (
+                ("copy.deepcopy", LegacyTransaction, deepcopy_clone), 
+                ("Transaction.clone", Transaction, slots_clone)):
+        rate, objects, size = run(transaction_class, clone, num)
+        print "%-18s %10.0f clones/s %6.1f objects/clone %5d bytes" %(name, 
+                                                      rate, objects, size)
@@ -0,0 +1,111 @@
+'''
+Micro-benchmark of the router's dispatch cost per transaction. Times 
+Router._route, which finds the receivers of a transaction, for a batch of
+synthetic destinations, using stub receivers so no hardware or network access
+happens. The legacy linear scan over every receiver's check_id is measured
+alongside for comparison.
+
+The time of a whole Router.next() is printed too. It also covers the 
+scheduler, telemetry and latency statistics of every hop, which hide the
+lookup, so it is not what the dispatch table is meant to improve.
+
+Run from the src directory:
+    python -m benchmarks.dispatch_benchmark [num_transactions]
+'''
+
+import sys
+import time
+from production_files.router import Router
+from production_files.receivers.receiver import Receiver
+
+RECEIVER_IDS = ["gui", "twitter", "translator", "filemanager", "flickr", 
+                "camera"]
+
+class NullLogger(object):
+    """
+    Stands in for the Logger so the benchmark does not measure disk writes.
+    """
+    
+    def log(self, *messages):
+        pass
+
+class StubReceiver(Receiver):
+    """
+    A receiver that accepts every transaction without doing any work.
+    """
+    
+    def process_transaction(self, transaction):
+        transaction.process(success = True, allow_log = False)
+
+class StubRouter(Router):
+    """
+    A router whose receivers are all stubs.
+    """
+    
+    def _create_receivers(self, gui_communicator):
+        for r_id in RECEIVER_IDS:
+            self._add_receiver(StubReceiver(self, r_id))
+
+class LinearStubRouter(StubRouter):
+    """
+    Reproduces the previous dispatch, which asked every receiver in turn.
+    """
+    
+    def _route(self, to_id):
+        return [rec for rec in self._receivers if rec.check_id(to_id)]
+
+#Cycled through by the transactions: every receiver id, and a list of them
+DESTINATIONS = RECEIVER_IDS + [["flickr", "twitter"]]
+
+def route(router_class, num_transactions):
+    """
+    Times how long _route takes to find the receivers of num_transactions
+    transactions, cycling through the destinations. Returns the time per 
+    transaction in microseconds.
+    """
+    
+    router = router_class(logger = NullLogger(), journal = False)
+    to_ids = DESTINATIONS * (num_transactions // len(DESTINATIONS) + 1)
+    to_ids = to_ids[:num_transactions]
+    find = router._route
+    
+    start = time.time()
+    for to_id in to_ids:
+        find(to_id)
+    elapsed = time.time() - start
+    
+    router.close()
+    
+    return elapsed / num_transactions * 1e6
+
+def run(router_class, num_transactions):
+    """
+    Queues num_transactions transactions, cycling through the destinations, 
+    then times how long next() takes to drain them. Returns the time per 
+    transaction in microseconds.
+    """
+    
+    router = router_class(logger = NullLogger(), journal = False)
+    
+    for i in xrange(num_transactions):
+        router.create_transaction(to_id = DESTINATIONS[i % len(DESTINATIONS)],
+                                  command = "bench")
+    
+    start = time.time()
+    for i in xrange(num_transactions):
+        router.next()
+    elapsed = time.time() - start
+    
+    router.close()
+    
+    return elapsed / num_transactions * 1e6
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    
+    print "Routing"
+    print "  Linear scan:    %.2f us/transaction" %route(LinearStubRouter, num)
+    print "  Dispatch table: %.2f us/transaction" %route(StubRouter, num)
+    print "Router.next()"
+    print "  Linear scan:    %.2f us/transaction" %run(LinearStubRouter, num)
+    print "  Dispatch table: %.2f us/transaction" %run(StubRouter, num)
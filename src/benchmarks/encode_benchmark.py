@@ -0,0 +1,102 @@
+'''
+Measures the time to encode and write a camera frame in each image format,
+and how long a capture is held up by writing its image: the whole write when
+it is written inline, as Camera.get_image used to, against the hand off to
+the ImageWriter. Images go to a temporary directory that is removed
+afterwards.
+
+Run from the src directory:
+    python -m benchmarks.encode_benchmark [num_images] [width] [height]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+
+import cv2 #@UnresolvedImport
+import numpy
+from production_files import logger
+from production_files.receivers import image_writer
+from production_files.receivers.image_writer import ImageWriter
+
+settings = [("jpg", {}),
+            ("jpg", {'jpeg_progressive' : 1}),
+            ("jpg", {'jpeg_quality' : 80}),
+            ("png", {}),
+            ("webp", {})]
+
+def test_frame(width, height):
+    """
+    A smooth gradient with sensor-like noise, so it compresses like a photo.
+    """
+    
+    rows, cols = numpy.mgrid[0:height, 0:width]
+    frame = numpy.dstack([rows * 200 / height, cols * 200 / width, 
+                          (rows + cols) * 100 / (height + width)]).astype(numpy.int16)
+    frame += numpy.random.randint(-12, 12, frame.shape)
+    
+    return numpy.clip(frame, 0, 255).astype(numpy.uint8)
+
+def encode_times(frame, num, extension, settings):
+    """
+    Returns the mean milliseconds to write an image, and its size in KB.
+    """
+    
+    params = image_writer.encode_params(extension, settings)
+    filename = os.path.join(temp_dir, "encode." + extension)
+    
+    start = time.time()
+    for i in xrange(num):                               #@UnusedVariable
+        cv2.imwrite(filename, frame, params)
+        
+    return (time.time() - start) / num * 1000, os.path.getsize(filename) / 1024.0
+
+def hand_off(frame, num):
+    """
+    Returns the mean milliseconds a capture waits to hand off its image.
+    """
+    
+    writer = ImageWriter()
+    waited = 0
+    
+    for i in xrange(num):
+        submitted = time.time()
+        writer.submit(os.path.join(temp_dir, "%d.jpg" %i), frame)
+        waited += time.time() - submitted
+        
+        #the camera's own time to move, light and settle
+        time.sleep(0.1)
+        
+    writer.close()
+    
+    return waited / num * 1000
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1280
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 720
+    
+    frame = test_frame(width, height)
+    
+    try:
+        print "%-6s %-22s %10s %10s" %("format", "settings", "ms/image", "KB")
+        
+        for extension, changed in settings:
+            print "%-6s %-22s %10.1f %10.1f" %((extension, changed or "defaults") + 
+                                               encode_times(frame, num, extension, 
+                                                            changed))
+            
+        inline = encode_times(frame, num, "jpg", {})[0]
+        waited = hand_off(frame, num)
+        
+        print
+        print "Capture held up by an inline write: %8.2f ms" %inline
+        print "Capture held up by the hand off:    %8.2f ms" %waited
+    finally:
+        logger.flush_all()
+        shutil.rmtree(temp_dir)
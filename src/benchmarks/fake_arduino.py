@@ -0,0 +1,88 @@
+'''
+A stand-in for the Arduino control board on a pseudo-terminal, so the serial
+code can be exercised and timed without hardware. Open fake.port with a
+normal Serial connection.
+
+It answers the "connection" handshake with its handshake string, and every
+command with a result code on its own line after a configurable delay: 0 for
+the commands the real board knows ("h", "m a x y z", "l i n", "l o", 
+"l o n", "l c") and 1 for anything else.
+'''
+
+import os
+import pty
+import re
+import threading
+import time
+import tty
+
+_known_command = re.compile(r'^(h|m a -?\d+ -?\d+ -?\d+|l i \d+|l o( \d+)?|l c)$')
+
+class FakeArduino(object):
+    """
+    Attributes:
+        port: The device name of the terminal to connect to.
+        received: Every command received, in order.
+        handshake: The reply to "connection", "main" for the control board.
+        response_delay: Seconds taken to answer each command.
+        boot_delay: Seconds after start before the board answers anything, like
+            the bootloader delay after a real board is reset by opening the port.
+    """
+    
+    def __init__(self, handshake = "main", response_delay = 0.0, boot_delay = 0.0,
+                 terminator = "\r\n"):
+        
+        self.handshake = handshake
+        self.response_delay = response_delay
+        self.boot_delay = boot_delay
+        self.terminator = terminator
+        self.received = []
+        
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        
+        self._started = time.time()
+        self._running = True
+        self._thread = threading.Thread(target = self._serve, name = "fake arduino")
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def close(self):
+        
+        self._running = False
+        os.close(self._master)
+        os.close(self._slave)
+        
+    def _serve(self):
+        
+        while self._running:
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            
+            #commands sent before the board has booted are lost
+            if time.time() - self._started < self.boot_delay:
+                continue
+            
+            for command in data.splitlines() or [data]:
+                command = command.strip()
+                
+                if command:
+                    self.received.append(command)
+                    self._answer(command)
+                
+    def _answer(self, command):
+        
+        if command == "connection":
+            reply = self.handshake
+        else:
+            time.sleep(self.response_delay)
+            reply = "0" if _known_command.match(command) else "1"
+            
+        try:
+            os.write(self._master, reply + self.terminator)
+        except OSError:
+            pass
@@ -0,0 +1,108 @@
+'''
+Compares the previous Camera.get_image, which always read five frames and
+saved the last, with the FrameGrabber, which returns the first frame whose
+brightness has settled. The camera is simulated at 30 frames per second, with
+an exposure that closes a fixed fraction of the gap to the lit brightness
+every frame time after the light turns on. Like a V4L2 driver, it holds four
+dark frames taken before the light turned on, which are read first.
+
+Run from the src directory:
+    python -m benchmarks.frame_benchmark [num_captures] [exposure_rate]
+'''
+
+import sys
+import time
+import numpy
+from production_files.receivers.frame_grabber import FrameGrabber, brightness
+
+class FakeCapture(object):
+    """
+    A VideoCapture stand-in whose frames brighten after light_on, once the
+    frames buffered before it have been read.
+    """
+    
+    def __init__(self, exposure_rate, lit = 180.0, dark = 20.0, fps = 30.0,
+                 shape = (480, 640), buffers = 4):
+        
+        self.exposure_rate = exposure_rate
+        self.buffers = buffers
+        self.lit = lit
+        self.dark = dark
+        self.frame_time = 1 / fps
+        self.shape = shape
+        self.lit_at = time.time()
+        self._stale = 0
+        
+    def light_on(self):
+        
+        self.lit_at = time.time()
+        self._stale = self.buffers
+        
+    def read(self, image = None):
+        
+        #taken while the light was off, and read at once
+        if self._stale > 0:
+            self._stale -= 1
+            level = self.dark
+        else:
+            time.sleep(self.frame_time)
+            frames = (time.time() - self.lit_at) / self.frame_time
+            level = self.lit - (self.lit - self.dark) * (1 - self.exposure_rate) ** frames
+        
+        if image is None or image.shape != self.shape:
+            image = numpy.empty(self.shape, numpy.uint8)
+            
+        image.fill(int(round(level)))
+        
+        return True, image
+    
+def legacy_capture(capture):
+    
+    for i in xrange(4):                                 #@UnusedVariable
+        capture.read()
+        
+    return capture.read()[1], 4
+
+def grabber_capture(grabber):
+    
+    image = grabber.capture()
+    grabber.idle()
+    
+    return image, grabber.discarded
+
+def run(capture, take, num_captures):
+    """
+    Returns the mean milliseconds per capture, frames discarded per capture,
+    and brightness error of the saved frame in percent.
+    """
+    
+    elapsed = discarded = error = 0.0
+    
+    for i in xrange(num_captures):                      #@UnusedVariable
+        capture.light_on()
+        start = time.time()
+        image, dropped = take()
+        elapsed += time.time() - start
+        discarded += dropped
+        error += abs(capture.lit - brightness(image)) / capture.lit * 100
+        
+    return (elapsed / num_captures * 1000, discarded / num_captures, 
+            error / num_captures)
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rates = [float(sys.argv[2])] if len(sys.argv) > 2 else [0.9, 0.6, 0.3]
+    
+    print "%-9s %-12s %10s %10s %8s" %("exposure", "capture", "ms", "discarded", 
+                                       "error %")
+    
+    for rate in rates:
+        capture = FakeCapture(rate)
+        grabber = FrameGrabber(capture)
+        
+        for name, take in (("five reads", lambda: legacy_capture(capture)), 
+                           ("settled", lambda: grabber_capture(grabber))):
+            print "%-9.1f %-12s %10.1f %10.1f %8.1f" %((rate, name) + 
+                                                      run(capture, take, num))
+        
+        grabber.stop()
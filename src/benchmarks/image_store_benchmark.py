@@ -0,0 +1,101 @@
+'''
+Measures the image store with a few weeks of images: the time to add an image,
+to find the latest image of a sample and the images of a sample over a day,
+and to evict images down to half of their size. The lookups are compared with
+scanning a flat directory of the previous filenames, which held no sample and
+had to be listed and parsed. Files hold a few bytes and go to a temporary
+directory that is removed afterwards.
+
+Run from the src directory:
+    python -m benchmarks.image_store_benchmark [num_images] [num_lookups]
+'''
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+
+from production_files import logger
+from production_files.image_store import ImageStore
+
+def fill(store, flat_dir, num):
+    """
+    Adds num images of 12 samples, one every 5 minutes, to the store and to the
+    flat directory. Returns the mean milliseconds to add one to the store.
+    """
+    
+    first = datetime.datetime(2026, 9, 1)
+    elapsed = 0
+    
+    for i in xrange(num):
+        timestamp = first + datetime.timedelta(minutes = 5 * i)
+        
+        start = time.time()
+        filename = store.new_image(i % 12 + 1, timestamp, "jpg")
+        with open(filename, 'w') as image:
+            image.write("image")
+        store.written(filename)
+        elapsed += time.time() - start
+        
+        #the previous name, which collides within a second
+        with open(os.path.join(flat_dir, "%s%d%d%d.jpg" %(timestamp.date(), 
+                                timestamp.hour, timestamp.minute, 
+                                timestamp.second)), 'w') as image:
+            image.write("image")
+    
+    return elapsed / num * 1000
+
+def scan_latest(flat_dir):
+    """
+    The latest image in the flat directory, by modification time, as the
+    filenames cannot be sorted.
+    """
+    
+    names = os.listdir(flat_dir)
+    
+    return max(names, key = lambda name: os.path.getmtime(os.path.join(flat_dir, name)))
+
+def timed(lookup, num):
+    
+    start = time.time()
+    for i in xrange(num):
+        lookup(i)
+        
+    return (time.time() - start) / num * 1000
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    
+    flat_dir = os.path.join(temp_dir, "flat")
+    os.mkdir(flat_dir)
+    store = ImageStore(os.path.join(temp_dir, "images"), budget_mb = 1024)
+    
+    try:
+        day = time.mktime(datetime.datetime(2026, 9, 3).timetuple())
+        results = [("Add an image", fill(store, flat_dir, num)),
+                   ("Latest image of a sample", 
+                    timed(lambda i: store.latest(i % 12 + 1), lookups)),
+                   ("A sample's images over a day", 
+                    timed(lambda i: store.find(i % 12 + 1, day, day + 86400), lookups)),
+                   ("Latest image, directory scan", 
+                    timed(lambda i: scan_latest(flat_dir), max(1, lookups / 20)))]
+        
+        start = time.time()
+        evicted = store.evict(store.usage() / 2)
+        results.append(("Evict %d images" %evicted, (time.time() - start) * 1000))
+        
+        for label, elapsed in results:
+            print "%-30s %8.3f ms" %(label, elapsed)
+            
+        print "Files left by the old names: %d of %d" %(len(os.listdir(flat_dir)), num)
+        
+        store.close()
+    finally:
+        logger.flush_all()
+        shutil.rmtree(temp_dir)
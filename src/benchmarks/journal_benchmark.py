@@ -0,0 +1,143 @@
+'''
+Measures what the transaction journal costs the router. Drives a batch of
+requests through Router.next() with stub receivers, each passed on from the
+translator to the camera to flickr as a capture request is, first with no
+journal, then with the group committed journal, then with an fsync for every
+entry. Then times opening a journal left with unfinished transactions, as
+a router does after a reboot. The journal is written to a temporary
+directory that is removed afterwards.
+
+Run from the src directory:
+    python -m benchmarks.journal_benchmark [num_requests] [work_us]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+
+from production_files import logger
+from production_files.journal import Journal
+from production_files.router import Router
+from production_files.transaction import Transaction
+from production_files.receivers.receiver import Receiver
+from production_files.receivers.translator_receiver import CaptureRequest
+
+#Each receiver, and the receiver it passes a request on to
+stages = {'translator' : "camera",
+          'camera' : "flickr",
+          'flickr' : None}
+
+class NullLogger(object):
+    """
+    Stands in for the Logger so the benchmark does not measure disk writes.
+    """
+    
+    def log(self, *messages):
+        pass
+
+class StubReceiver(Receiver):
+    """
+    Spins for the work time, then passes the request on in place.
+    """
+    
+    work = 0
+    
+    def process_transaction(self, transaction):
+        
+        end = time.time() + self.work
+        while time.time() < end:
+            pass
+        
+        if stages[self.r_id] is None:
+            transaction.process(success = True, allow_log = False)
+        else:
+            transaction.process(success = True, finished = False, allow_log = False)
+            transaction.to_id = stages[self.r_id]
+
+class StubRouter(Router):
+    """
+    A router whose receivers are all stubs.
+    """
+    
+    def _create_receivers(self, gui_communicator):
+        
+        for r_id in stages:
+            self._add_receiver(StubReceiver(self, r_id))
+
+def request(i):
+    """
+    The arguments of a request, sized like a capture plan.
+    """
+    
+    return (CaptureRequest(i % 12 + 1, (("user%d" %i, ("s",)),)),)
+
+def run(num, journal):
+    """
+    Returns the microseconds per request.
+    """
+    
+    router = StubRouter(logger = NullLogger(), journal = journal)
+    
+    start = time.time()
+    
+    for i in xrange(num):
+        router.create_transaction(to_id = "translator", command = "get_images",
+                                  command_args = request(i), origin = "user%d" %i)
+        
+        #each request goes through its three receivers
+        for hop in xrange(3):                           #@UnusedVariable
+            router.next()
+    
+    elapsed = time.time() - start
+    router.close()
+    
+    return elapsed / num * 1e6
+
+def recovery(num):
+    """
+    Returns the milliseconds to open a journal holding num unfinished
+    transactions, and the number recovered.
+    """
+    
+    filename = os.path.join(temp_dir, "recovery.journal")
+    journal = Journal(filename)
+    
+    for i in xrange(num):
+        journal.put(Transaction(NullLogger(), "camera", "get_images", request(i),
+                                "user%d" %i))
+    
+    journal.close()
+    
+    start = time.time()
+    journal = Journal(filename)
+    elapsed = time.time() - start
+    journal.close()
+    
+    return elapsed * 1000, len(journal.recovered)
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    StubReceiver.work = float(sys.argv[2]) / 1e6 if len(sys.argv) > 2 else 0
+    
+    try:
+        print "%d requests of 3 hops, %.0f us of work a hop" %(num, StubReceiver.work * 1e6)
+        
+        baseline = run(num, False)
+        print "No journal:          %8.2f us/request" %baseline
+        
+        for name, interval in (("Group commit:", 0.05), ("fsync every entry:", 0)):
+            journalled = run(num, Journal(os.path.join(temp_dir, "%s.journal" %interval),
+                                          commit_interval = interval))
+            print "%-20s %8.2f us/request, %+.1f%%" %(name, journalled,
+                                                     (journalled / baseline - 1) * 100)
+        
+        print
+        print "Recovery of %d transactions: %.1f ms" %(num, recovery(num)[0])
+    finally:
+        logger.flush_all()
+        shutil.rmtree(temp_dir)
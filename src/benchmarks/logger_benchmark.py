@@ -0,0 +1,67 @@
+'''
+Compares the logging rate of the buffered Logger against the previous
+implementation, which opened, appended to and closed the day's file for every
+message. Logs go to a temporary directory that is removed afterwards.
+
+Run from the src directory:
+    python -m benchmarks.logger_benchmark [num_lines]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+log_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = log_dir
+
+from production_files import logger
+
+class LegacyLogger(logger.Logger):
+    """
+    The Logger with its previous log method, kept for comparison.
+    """
+    
+    def log(self, *messages):
+        
+        current = time.localtime()
+        
+        file_name = "%s%s/%d%02d%02d.%s" % (self.directory, self.name, 
+                                            current.tm_year, current.tm_mon, 
+                                              current.tm_mday, self.extension)
+        log_file = open(file_name, "a")
+        
+        log_string = self.separator.join(str(x) for x in messages)
+        
+        if self.show_date:
+            log_file.write("%02d:%02d:%02d - " % (current.tm_hour, current.tm_min, 
+                                            current.tm_sec) + log_string + "\n")
+        else:
+            log_file.write(log_string + "\n")
+                                              
+        log_file.close()
+
+def run(logger_class, name, num_lines):
+    """
+    Logs num_lines arduino-style messages and returns the lines per second,
+    including the time to get every line onto disk.
+    """
+    
+    log = logger_class(name = name)
+    
+    start = time.time()
+    for i in xrange(num_lines):
+        log.log("Sent to arduino: 'm a %d %d %d'" %(i, i, i))
+    log.close()
+    
+    return num_lines / (time.time() - start)
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    
+    try:
+        print "Open/close per line: %10.0f lines/s" %run(LegacyLogger, "legacy", num)
+        print "Buffered:            %10.0f lines/s" %run(logger.Logger, "buffered", num)
+    finally:
+        shutil.rmtree(log_dir, ignore_errors = True)
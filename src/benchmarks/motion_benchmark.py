@@ -0,0 +1,60 @@
+'''
+Compares camera travel for multi-sample requests under each route strategy,
+offline. The previous behaviour, homing after every image, is included. Sample
+positions are read from the CameraCommunicator configuration when it has them,
+and otherwise laid out as a 4 x 3 well plate.
+
+Run from the src directory:
+    python -m benchmarks.motion_benchmark [num_requests]
+'''
+
+import random
+from collections import OrderedDict
+import sys
+from production_files import utils
+from production_files.receivers import motion_planner
+
+def sample_positions():
+    """
+    Returns a dictionary of sample number: (x, y, z) position.
+    """
+    
+    try:
+        config = utils.read_config_dict("CameraCommunicator")
+    except (utils.BadConfigFileError, IOError, OSError, TypeError):
+        config = {}
+    
+    coords = [config[key] for key in sorted(k for k in config if '~s' in k)]
+    
+    if len(coords) >= 3:
+        return dict((i / 3 + 1, tuple(coords[i:i + 3])) 
+                    for i in xrange(0, len(coords) - 2, 3))
+    
+    return dict((row * 4 + col + 1, (100 + col * 200, 100 + row * 250, 20))
+                for row in xrange(3) for col in xrange(4))
+
+def home_every_time(positions):
+    """
+    The travel when the camera homes after every image.
+    """
+    
+    return sum(2 * motion_planner.distance(motion_planner.home, position) 
+               for position in positions.values())
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    positions = sample_positions()
+    rand = random.Random(1)
+    totals = dict((name, 0) for name in ("home_every_time",) + motion_planner.strategies)
+    
+    for i in xrange(num):
+        samples = rand.sample(sorted(positions), rand.randint(2, len(positions)))
+        requested = OrderedDict((s, positions[s]) for s in samples)
+        
+        totals["home_every_time"] += home_every_time(requested)
+        
+        for strategy in motion_planner.strategies:
+            totals[strategy] += motion_planner.plan_route(requested, strategy)[1]
+            
+    for name in ("home_every_time",) + motion_planner.strategies:
+        print "%-16s mean travel %8.0f" %(name, totals[name] / num)
@@ -0,0 +1,73 @@
+'''
+Measures how many tweets per second the command parser handles, over a
+generated corpus of mentions shaped like the ones the microscope receives.
+The previous parser, which compiled its pattern on every tweet and made three
+more passes over every command string, is measured alongside.
+
+Run from the src directory:
+    python -m benchmarks.parser_benchmark [corpus_size]
+'''
+
+import random
+import re
+import sys
+import time
+from production_files.receivers import command_parser
+
+TEMPLATES = ["@pellinglab sample(%(a)d) please!",
+             "@pellinglab sample(%(a)d,%(b)d,%(c)d) -a",
+             "@pellinglab can I see sample(%(a)d) -a -b and sample(%(b)d)",
+             "@pellinglab help() -s",
+             "@pellinglab what are you looking at today?",
+             "@pellinglab sample(1,2,3,4,5,6,7,8,9,10,11,12) -a -b",
+             "@pellinglab test() -r"]
+
+def corpus(size, seed = 1):
+    """
+    Returns size tweets built from the templates with random sample numbers.
+    """
+    
+    rand = random.Random(seed)
+    
+    return [(rand.choice(TEMPLATES) %dict(a = rand.randint(1, 12), 
+                                          b = rand.randint(1, 12),
+                                          c = rand.randint(1, 12)), 
+             "user%d" %rand.randint(1, 500)) 
+            for i in xrange(size)]
+
+def legacy_parse(content):
+    """
+    The previous TranslatorReceiver._parse and _translate, without validation.
+    """
+    
+    parsing_regex = re.compile('[a-z]+\(\d*(?:\s*,\d*\s*)*\)(?:\s+-[a-z])*')
+    result = []
+    
+    for command_string in re.findall(parsing_regex, content):
+        args = [arg.replace("-", "") for arg in re.findall('-[a-z]', command_string)]
+        command = re.findall('^[a-z]+', command_string.lower())[0]
+        samples = [int(s) for s in re.findall('\d+', command_string)]
+        result.append((command, samples, args))
+        
+    return result
+
+def run(parse_tweets, tweets, repeats):
+    
+    start = time.time()
+    for i in xrange(repeats):
+        parse_tweets(tweets)
+        
+    return len(tweets) * repeats / (time.time() - start)
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tweets = corpus(size)
+    
+    print "Previous parser:   %10.0f tweets/s" %run(
+                lambda batch: [legacy_parse(content) for content, user in batch],
+                tweets, 5)
+    print "Single pass:       %10.0f tweets/s" %run(
+                lambda batch: [command_parser.parse(content) for content, user in batch],
+                tweets, 5)
+    print "Single pass batch: %10.0f tweets/s" %run(
+                command_parser.parse_batch, tweets, 5)
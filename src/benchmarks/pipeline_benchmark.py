@@ -0,0 +1,160 @@
+'''
+Compares the single transaction queue with the pipeline executor, using stub
+receivers that sleep for as long as the real ones wait on the network or
+the hardware. Each request goes translator -> camera -> flickr -> twitter,
+as a capture request does, and every fifth one fails its first attempt at
+flickr so the retries are exercised. While the requests run, twitter is
+polled every 50 ms, to show how long a poll waits behind the other
+receivers.
+
+Run from the src directory:
+    python -m benchmarks.pipeline_benchmark [num_requests]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+
+from production_files import logger
+from production_files.router import Router
+from production_files.receivers.receiver import Receiver
+
+#The seconds each stub takes, and the receiver it passes the request on to
+stages = {'translator' : (0.001, "camera"),
+          'camera' : (0.02, "flickr"),
+          'flickr' : (0.05, "twitter"),
+          'twitter' : (0.01, None),
+          'filemanager' : (0, None)}
+
+class NullLogger(object):
+    """
+    Stands in for the Logger so the benchmark does not measure disk writes.
+    """
+    
+    def log(self, *messages):
+        pass
+
+class StubReceiver(Receiver):
+    """
+    Sleeps for its stage's time, then passes the request on in place, as the
+    real receivers do.
+    
+    Attributes:
+        polls: The seconds each timed twitter update waited to be processed.
+        finished: The number of requests finished.
+    """
+    
+    #retried quickly, so the benchmark measures the executors, not the backoff
+    retry_backoff = 0.05
+    
+    def __init__(self, router, r_id):
+        super(StubReceiver, self).__init__(router, r_id)
+        
+        self.delay, self.next_id = stages[r_id]
+        self.polls = []
+        self.finished = 0
+        self._failed = set()
+    
+    def process_transaction(self, transaction):
+        
+        if transaction.command == "update":
+            #the router's own polls are not timed
+            if transaction.command_args is not None:
+                self.polls.append(time.time() - transaction.command_args)
+            
+            transaction.process(success = True, allow_log = False)
+            return
+        
+        time.sleep(self.delay)
+        
+        if (self.r_id == "flickr" and transaction.command_args % 5 == 0 and
+                transaction.command_args not in self._failed):
+            self._failed.add(transaction.command_args)
+            transaction.process(success = False)
+            return
+        
+        if self.next_id is None:
+            self.finished += 1
+            transaction.process(success = True, allow_log = False)
+        else:
+            transaction.process(success = True, finished = False, allow_log = False)
+            transaction.to_id = self.next_id
+
+class StubRouter(Router):
+    """
+    A router whose receivers are all stubs.
+    """
+    
+    def _create_receivers(self, gui_communicator):
+        
+        for r_id in stages:
+            self._add_receiver(StubReceiver(self, r_id))
+    
+    def receiver(self, r_id):
+        
+        return self._routes[r_id][0]
+
+def poll_twitter(router, stop):
+    """
+    Queues a twitter update every 50 ms, like an idle router does.
+    """
+    
+    while not stop.is_set():
+        router.create_transaction(to_id = "twitter", command = "update",
+                                  command_args = time.time())
+        stop.wait(0.05)
+
+def run(num, pipeline):
+    """
+    Returns the seconds to finish num requests, and the mean and worst
+    milliseconds a twitter poll waited.
+    """
+    
+    router = StubRouter(logger = NullLogger(), pipeline = pipeline, max_idle = 0.01,
+                        journal = False)
+    twitter = router.receiver("twitter")
+    stop = threading.Event()
+    
+    start = time.time()
+    
+    for i in xrange(num):
+        router.create_transaction(to_id = "translator", command = "bench",
+                                  command_args = i)
+    
+    poller = threading.Thread(target = poll_twitter, args = (router, stop))
+    poller.start()
+    
+    #the router releases the retries, and polls, as startup.py drives it
+    while twitter.finished < num:
+        router.next()
+    
+    elapsed = time.time() - start
+    stop.set()
+    poller.join()
+    router.close()
+    
+    polls = twitter.polls or [0]
+    
+    return elapsed, sum(polls) / len(polls) * 1000, max(polls) * 1000
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    
+    try:
+        print "%d requests" %num
+        print "%-8s %10s %12s %16s %16s" %("executor", "total s", "requests/s",
+                                          "mean poll ms", "worst poll ms")
+        
+        for name, pipeline in (("queue", False), ("pipeline", True)):
+            elapsed, mean_poll, worst_poll = run(num, pipeline)
+            print "%-8s %10.2f %12.1f %16.1f %16.1f" %(name, elapsed, num / elapsed,
+                                                       mean_poll, worst_poll)
+    finally:
+        logger.flush_all()
+        shutil.rmtree(temp_dir)
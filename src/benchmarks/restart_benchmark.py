@@ -0,0 +1,67 @@
+'''
+Measures how long a new router's camera receiver takes to get its
+CameraCommunicator: opened from scratch, as every router used to, and rebound
+to the live session of the router it replaces after a health check. The
+Arduino board is a fake board on a pseudo-terminal.
+
+Logs and the configuration file go to a temporary directory that is removed
+afterwards.
+
+Run from the src directory:
+    python -m benchmarks.restart_benchmark [num_restarts] [boot_delay]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+os.environ['PELLINGLAB_RESOURCE_DIR'] = temp_dir
+
+from benchmarks.fake_arduino import FakeArduino
+from production_files.session import SessionManager
+from production_files.receivers.camera_communicator import CameraCommunicator
+
+def write_config(port, boot_delay):
+    
+    with open(os.path.join(temp_dir, "dicts_t.cfg"), 'w') as config_file:
+        config_file.write("start CameraCommunicator\n"
+                          "arduino_port:%s\n"
+                          "camera_number:(int)0\n"
+                          "boot_delay:(int)%d\n"
+                          "end\n" %(port, boot_delay))
+
+def restart(sessions, fresh):
+    """
+    Returns the seconds taken to get the camera session.
+    """
+    
+    if fresh:
+        sessions.release("camera")
+    
+    start = time.time()
+    sessions.get("camera", CameraCommunicator, CameraCommunicator.is_healthy)
+    
+    return time.time() - start
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    boot_delay = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    
+    board = FakeArduino(boot_delay = boot_delay)
+    write_config(board.port, boot_delay)
+    sessions = SessionManager()
+    
+    try:
+        opened = sum(restart(sessions, True) for i in xrange(num)) / num
+        rebound = sum(restart(sessions, False) for i in xrange(num)) / num
+        
+        print "Opened from scratch: %10.2f ms/restart" %(opened * 1000)
+        print "Rebound to session:  %10.2f ms/restart" %(rebound * 1000)
+    finally:
+        sessions.release_all()
+        board.close()
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,153 @@
+'''
+A synthetic load generator for the transaction schedulers. Simulates the
+camera's queue through a burst of requests: a few heavy users each ask for
+every sample again and again, while casual users each ask for one sample at
+random times. Reports the median and 90th percentile time a request waits
+for the camera under the FifoScheduler and the FairScheduler, in simulated
+seconds, then times queuing and taking a transaction for growing queues.
+
+Run from the src directory:
+    python -m benchmarks.scheduler_benchmark [duration_s] [casual_per_min]
+'''
+
+import random
+import sys
+import time
+from production_files.scheduler import FifoScheduler, FairScheduler
+from production_files.transaction import Transaction
+from production_files.receivers.translator_receiver import CaptureRequest
+
+#The seconds the camera takes to capture one sample
+capture_time = 4.0
+
+#The heavy users, and the seconds between their requests for every sample
+heavy_users = ["heavy1", "heavy2"]
+heavy_interval = 60.0
+num_samples = 12
+
+class NullLogger(object):
+    """
+    Stands in for the Logger so the benchmark does not measure disk writes.
+    """
+    
+    def log(self, *messages):
+        pass
+
+def plan(user, samples):
+    """
+    Returns the get_images transaction for a user's samples.
+    """
+    
+    requests = tuple(CaptureRequest(sample, ((user, ()),)) for sample in samples)
+    
+    return Transaction(NullLogger(), "camera", "get_images", requests, user)
+
+def arrivals(duration, casual_per_min, seed = 1):
+    """
+    Returns the (time, transaction) of every request of the load, in order.
+    """
+    
+    rng = random.Random(seed)
+    load = []
+    
+    for i, user in enumerate(heavy_users):
+        start = i * heavy_interval / len(heavy_users)
+        
+        while start < duration:
+            load.append((start, plan(user, range(1, num_samples + 1))))
+            start += heavy_interval
+    
+    start = rng.expovariate(casual_per_min / 60.0)
+    user = 0
+    
+    while start < duration:
+        load.append((start, plan("casual%d" %user, [rng.randint(1, num_samples)])))
+        start += rng.expovariate(casual_per_min / 60.0)
+        user += 1
+    
+    load.sort(key = lambda arrival: arrival[0])
+    
+    return load
+
+def simulate(scheduler_class, load):
+    """
+    Runs the load through a scheduler in front of the camera. Returns the
+    waits of the casual and of the heavy users' requests, in seconds.
+    """
+    
+    scheduler = scheduler_class()
+    queued = {}
+    waits = {'casual' : [], 'heavy' : []}
+    now = 0.0
+    i = 0
+    
+    while i < len(load) or len(scheduler) > 0:
+        #everything that has arrived by now is queued
+        while i < len(load) and load[i][0] <= now:
+            arrived, transaction = load[i]
+            queued[transaction.id] = arrived
+            scheduler.push(transaction)
+            i += 1
+        
+        if len(scheduler) == 0:
+            now = load[i][0]
+            continue
+        
+        transaction = scheduler.pop()
+        kind = "heavy" if transaction.origin in heavy_users else "casual"
+        waits[kind].append(now - queued.pop(transaction.id))
+        now += capture_time * len(transaction.command_args)
+    
+    return waits['casual'], waits['heavy']
+
+def percentile(samples, point):
+
+    samples = sorted(samples)
+    
+    return samples[min(len(samples) - 1, int(len(samples) * point / 100.0))]
+
+def operation_time(scheduler_class, size, rounds = 20000):
+    """
+    Returns the microseconds to queue and take a transaction with size
+    transactions queued, from 100 users.
+    """
+    
+    scheduler = scheduler_class()
+    transactions = [Transaction(NullLogger(), "twitter", "post", "", "user%d" %(i % 100))
+                    for i in xrange(size + rounds)]
+    
+    for transaction in transactions[:size]:
+        scheduler.push(transaction)
+    
+    start = time.time()
+    for transaction in transactions[size:]:
+        scheduler.push(transaction)
+        scheduler.pop()
+    
+    return (time.time() - start) / rounds * 1e6
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1800
+    casual_per_min = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    
+    load = arrivals(duration, casual_per_min)
+    
+    print "%d s of load, %d heavy users, %.0f casual requests a minute" %(
+                                        duration, len(heavy_users), casual_per_min)
+    print "%-6s %14s %14s %14s %14s" %("", "casual median", "casual p90",
+                                       "heavy median", "heavy p90")
+    
+    for name, scheduler_class in (("fifo", FifoScheduler), ("fair", FairScheduler)):
+        casual, heavy = simulate(scheduler_class, load)
+        print "%-6s %13.0fs %13.0fs %13.0fs %13.0fs" %(name,
+                                                       percentile(casual, 50),
+                                                       percentile(casual, 90),
+                                                       percentile(heavy, 50),
+                                                       percentile(heavy, 90))
+    
+    print
+    print "%-8s %14s %14s" %("queued", "fifo us/op", "fair us/op")
+    
+    for size in (10, 1000, 100000):
+        print "%-8d %14.2f %14.2f" %(size, operation_time(FifoScheduler, size),
+                                     operation_time(FairScheduler, size))
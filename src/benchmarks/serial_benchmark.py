@@ -0,0 +1,61 @@
+'''
+Measures the round trip time of a command to the Arduino board, using the
+fake board on a pseudo-terminal. The previous send, which busy-waited for the
+first byte and then slept a fixed second, is measured alongside.
+
+Run from the src directory:
+    python -m benchmarks.serial_benchmark [num_commands] [board_delay]
+'''
+
+import sys
+import time
+from serial import Serial
+from benchmarks.fake_arduino import FakeArduino
+from production_files.receivers.serial_protocol import SerialProtocolEngine
+
+def legacy_send(connection, message):
+    """
+    The previous BoardCommunicator.send, without logging.
+    """
+    
+    connection.flushInput()
+    connection.flushOutput()
+    connection.write(message)
+    
+    while(connection.inWaiting() == 0):
+        pass
+    
+    time.sleep(1)
+    
+    return int(connection.read(connection.inWaiting()).rstrip())
+
+def run(send, num_commands):
+    """
+    Returns the mean round trip in milliseconds.
+    """
+    
+    start = time.time()
+    for i in xrange(num_commands):
+        assert send("m a %d %d 0" %(i, i)) == 0
+        
+    return (time.time() - start) / num_commands * 1000
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    
+    board = FakeArduino(response_delay = delay)
+    connection = Serial(board.port, 115200)
+    
+    try:
+        print "Busy-wait and sleep: %8.1f ms/command" %run(
+                    lambda message: legacy_send(connection, message), min(num, 5))
+        
+        engine = SerialProtocolEngine(connection)
+        engine.start()
+        print "Protocol engine:     %8.1f ms/command" %run(
+                    lambda message: int(engine.send(message)), num)
+        engine.stop()
+    finally:
+        connection.close()
+        board.close()
@@ -0,0 +1,94 @@
+'''
+Measures how long the BoardCommunicator takes to find and connect to the
+Arduino board among several serial devices, simulated with fake boards on
+pseudo-terminals. The board is the last device listed. Three starts are
+timed: the previous search, which tried one port at a time with fixed sleeps;
+a cold start, which tries every port at once; and a warm start, which goes 
+straight to the port with the stored fingerprint. The cold and warm starts
+both take about boot_delay, as opening a port resets the board it belongs
+to: the warm start only spares the other devices from being opened.
+
+Logs and the configuration file go to a temporary directory that is removed
+afterwards.
+
+Run from the src directory:
+    python -m benchmarks.startup_benchmark [num_devices] [boot_delay]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+os.environ['PELLINGLAB_RESOURCE_DIR'] = temp_dir
+
+with open(os.path.join(temp_dir, "dicts_t.cfg"), 'w') as config_file:
+    config_file.write("start CameraCommunicator\nend\n")
+
+from benchmarks.fake_arduino import FakeArduino
+from production_files.receivers import camera_communicator
+from production_files.receivers.camera_communicator import BoardCommunicator
+
+class LegacyBoardCommunicator(BoardCommunicator):
+    """
+    The BoardCommunicator with its previous search: one port at a time, each
+    with a 3 s sleep before and after the handshake.
+    """
+    
+    def _probe_ports(self, ports):
+        
+        for port in ports:
+            cxn = BoardCommunicator._probe_ports(self, [port])
+            
+            if cxn is not None:
+                return cxn
+            
+        return None
+    
+    def _handshake(self, cxn):
+        
+        time.sleep(3)
+        cxn.flushInput()
+        cxn.write("connection")
+        time.sleep(3)
+        
+        return cxn.read(cxn.inWaiting()).strip()
+
+def connect(communicator, fingerprint = None):
+    """
+    Returns the seconds taken to connect to the board.
+    """
+    
+    start = time.time()
+    board_comm = communicator(None, fingerprint)
+    elapsed = time.time() - start
+    board_comm.close()
+    
+    return elapsed
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    boot_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+    
+    #Other serial devices answer the handshake with their own names
+    boards = [FakeArduino(handshake = "device %d" %i, boot_delay = boot_delay) 
+              for i in xrange(num - 1)]
+    boards.append(FakeArduino(boot_delay = boot_delay))
+    
+    ports = [(board.port, "fake board", "USB VID:PID=2341:0043 SER=%d" %i) 
+             for i, board in enumerate(boards)]
+    camera_communicator.list_ports.comports = lambda: ports
+    
+    try:
+        print "Previous search: %6.2f s" %connect(LegacyBoardCommunicator)
+        print "Cold start:      %6.2f s" %connect(BoardCommunicator)
+        print "Warm start:      %6.2f s" %connect(BoardCommunicator, 
+                                                 "2341:0043:%d" %(num - 1))
+    finally:
+        for board in boards:
+            board.close()
+            
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,198 @@
+'''
+Measures how long a run of captures and their uploads takes when every image
+is uploaded inline, as FlickrReceiver used to, against handing the images to
+an UploadPool with 1, 2 and 4 workers. Flickr is stood in for by a local HTTP
+server that answers each upload after a set latency, and fails a set fraction
+of them so the retries are exercised.
+
+Run from the src directory:
+    python -m benchmarks.upload_benchmark [num_images] [latency_ms] [failure_rate]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+temp_dir = tempfile.mkdtemp()
+os.environ['PELLINGLAB_LOG_DIR'] = temp_dir
+
+import BaseHTTPServer
+import SocketServer
+import datetime
+import httplib
+import random
+from production_files import logger
+from production_files.receivers.upload_pool import UploadPool, UploadJob
+
+#The camera's own time to move, light, settle and write an image
+capture_time = 0.05
+
+#The size of the uploaded images
+image_kb = 200
+
+class FlickrStandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Answers every POST with a photo id after the latency, or with an error for
+    the failure rate of them.
+    """
+    
+    daemon_threads = True
+    latency = 0.2
+    failure_rate = 0.0
+
+class UploadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        
+        if random.random() < self.server.failure_rate:
+            self.send_response(503)
+            self.end_headers()
+            return
+        
+        body = "%d" %random.randint(0, 10 ** 9)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+def uploader(port):
+    """
+    Returns an upload function that POSTs an image to the stand-in.
+    """
+    
+    def upload(filename, sample, timestamp):                #@UnusedVariable
+        
+        with open(filename, 'rb') as image:
+            data = image.read()
+        
+        connection = httplib.HTTPConnection("127.0.0.1", port, timeout = 30)
+        
+        try:
+            connection.request("POST", "/upload", data)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        
+        if response.status != 200:
+            raise IOError("Upload failed with status %d" %response.status)
+        
+        return "https://flic.kr/p/" + body
+    
+    return upload
+
+def run_inline(upload, filenames):
+    """
+    Returns the seconds for the captures and their uploads, and the seconds
+    the captures were held up by uploads.
+    """
+    
+    start = time.time()
+    held_up = 0
+    
+    for filename in filenames:
+        time.sleep(capture_time)
+        
+        uploading = time.time()
+        
+        #the old receiver gave up on the first failure, here it tries again
+        while True:
+            try:
+                upload(filename, 1, datetime.datetime.now())
+                break
+            except IOError:
+                pass
+        
+        held_up += time.time() - uploading
+    
+    return time.time() - start, held_up
+
+def run_pool(upload, filenames, workers):
+    """
+    Returns the seconds for the captures and their uploads, and the seconds
+    the captures were held up by handing the images to the pool.
+    """
+    
+    done = threading.Event()
+    remaining = [len(filenames)]
+    lock = threading.Lock()
+    
+    def uploaded(job, link):                                #@UnusedVariable
+        
+        with lock:
+            remaining[0] -= 1
+            
+            if remaining[0] == 0:
+                done.set()
+    
+    pool = UploadPool(upload, workers = workers, backoff = 0.05, max_backoff = 0.5,
+                      max_attempts = 20)
+    pool.bind(uploaded)
+    
+    start = time.time()
+    held_up = 0
+    
+    for filename in filenames:
+        time.sleep(capture_time)
+        
+        submitting = time.time()
+        pool.submit(UploadJob(filename, 1, datetime.datetime.now(), "gui"))
+        held_up += time.time() - submitting
+    
+    done.wait()
+    total = time.time() - start
+    pool.close()
+    
+    return total, held_up
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.2
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    
+    server = FlickrStandIn(("127.0.0.1", 0), UploadHandler)
+    server.latency = latency
+    server.failure_rate = failure_rate
+    
+    server_thread = threading.Thread(target = server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    
+    try:
+        filenames = []
+        
+        for i in xrange(num):
+            filename = os.path.join(temp_dir, "%d.jpg" %i)
+            
+            with open(filename, 'wb') as image:
+                image.write(os.urandom(image_kb * 1024))
+            
+            filenames.append(filename)
+        
+        upload = uploader(server.server_address[1])
+        
+        print "%d images, %d ms upload latency, %d%% failures" %(num, latency * 1000,
+                                                                  failure_rate * 100)
+        print "%-10s %10s %12s %14s" %("uploads", "total s", "images/s", "held up ms")
+        
+        total, held_up = run_inline(upload, filenames)
+        print "%-10s %10.2f %12.1f %14.1f" %("inline", total, num / total,
+                                             held_up * 1000 / num)
+        
+        for workers in (1, 2, 4):
+            total, held_up = run_pool(upload, filenames, workers)
+            print "%-10s %10.2f %12.1f %14.2f" %("%d workers" %workers, total,
+                                                 num / total, held_up * 1000 / num)
+    finally:
+        server.shutdown()
+        logger.flush_all()
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,177 @@
+'''
+Where the Router keeps the transactions it gives up on. A transaction that
+failed attempt_threshold times, or that is routed to no receiver, used to be
+logged and lost. It is now kept in an SQLite file in the resource directory,
+with why it was dropped, so it can be looked at later and replayed once
+whatever broke it is fixed:
+
+    for letter in dead_letters.get_store().letters():
+        print letter.id, letter.receiver, letter.command, letter.reason
+
+    router.replay_dead_letters([letter.id])
+'''
+
+from collections import namedtuple
+import cPickle
+import sqlite3
+import threading
+import time
+import telemetry
+import utils
+
+#The dead letter file, in the resource directory
+store_name = "dead_letters.sqlite"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dropped REAL NOT NULL,
+    receiver TEXT,
+    command TEXT,
+    origin TEXT,
+    attempts INTEGER,
+    reason TEXT,
+    record BLOB NOT NULL);
+"""
+
+class DeadLetter(namedtuple('DeadLetter',
+                            'id dropped receiver command origin attempts reason')):
+    """
+    A transaction that was dropped.
+    
+    Attributes:
+        id: The id of the dead letter in the store, not of the transaction.
+        dropped: The time in seconds since the epoch it was dropped.
+        receiver: The receiver id, or ids, it was routed to.
+        command: Its command.
+        origin: The user or receiver it came from.
+        attempts: The number of failed attempts it had.
+        reason: Why it was dropped.
+    """
+    
+    __slots__ = ()
+
+class DeadLetterStore(object):
+    """
+    The dropped transactions.
+    
+    Attributes:
+        filename: The SQLite file of the store.
+        _db: The connection to the store, shared by every thread that uses it.
+        _lock: Held while the store is used.
+    """
+    
+    def __init__(self, filename = None):
+        """
+        Args:
+            filename: The SQLite file of the store. The store_name file in the
+                resource directory if not given.
+        """
+        
+        if filename is None:
+            filename = utils.get_resource_files_prefix() + store_name
+        
+        self.filename = filename
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread = False)
+        self._db.executescript(_schema)
+    
+    def add(self, transaction, reason):
+        """
+        Stores a dropped transaction, and returns the id of its dead letter.
+        """
+        
+        receiver = transaction.to_id
+        
+        if receiver is not None and not isinstance(receiver, basestring):
+            receiver = ",".join(receiver)
+        
+        record = cPickle.dumps(transaction.record(), cPickle.HIGHEST_PROTOCOL)
+        
+        with self._lock, self._db:
+            cursor = self._db.execute("INSERT INTO dead_letters (dropped, receiver, "
+                                      "command, origin, attempts, reason, record) "
+                                      "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                      (time.time(), receiver, transaction.command,
+                                       transaction.origin, transaction.attempts,
+                                       reason, sqlite3.Binary(record)))
+        
+        telemetry.record("dead_letter", transaction_id = transaction.id,
+                         receiver = receiver, command = transaction.command,
+                         reason = reason)
+        
+        return cursor.lastrowid
+    
+    def letters(self, receiver = None):
+        """
+        Returns the DeadLetters in the store, oldest first, of every receiver or
+        only of the given receiver id.
+        """
+        
+        query = ("SELECT id, dropped, receiver, command, origin, attempts, reason "
+                 "FROM dead_letters")
+        values = ()
+        
+        if receiver is not None:
+            query += " WHERE receiver = ?"
+            values = (receiver,)
+        
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id", values).fetchall()
+        
+        return [DeadLetter(*row) for row in rows]
+    
+    def take(self, ids = None):
+        """
+        Removes dead letters from the store, and returns the record() of each of
+        their transactions, oldest first.
+        
+        Args:
+            ids: The ids of the dead letters to take. Every one if not given.
+        """
+        
+        with self._lock, self._db:
+            if ids is None:
+                rows = self._db.execute("SELECT id, record FROM dead_letters "
+                                        "ORDER BY id").fetchall()
+            else:
+                rows = []
+                
+                for letter_id in sorted(ids):
+                    rows.extend(self._db.execute("SELECT id, record FROM "
+                                                 "dead_letters WHERE id = ?",
+                                                 (letter_id,)).fetchall())
+            
+            self._db.executemany("DELETE FROM dead_letters WHERE id = ?",
+                                 [(row[0],) for row in rows])
+        
+        return [cPickle.loads(str(row[1])) for row in rows]
+    
+    def __len__(self):
+        
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+    
+    def close(self):
+        
+        with self._lock:
+            self._db.close()
+
+#The dead letter store shared by the process
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Returns the DeadLetterStore shared by the process, creating it on first use.
+    """
+    
+    global _store
+    
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DeadLetterStore()
+    
+    return _store
@@ -0,0 +1,318 @@
+'''
+Where captured images are kept. Every image gets its own file, named by its
+capture time and a sequence number that is never reused, under a directory
+per day and per sample:
+
+    images/2026-10-17/sample03/142501-000123.jpg
+
+An SQLite index in the image directory holds the sample, capture time, path,
+size and Flickr link of every image, so images are found by sample and time
+through an index instead of by listing directories. The images use no more
+than a disk budget: once they pass it, the least recently used are deleted.
+An image is not deleted while it is waiting to be uploaded to Flickr.
+'''
+
+import os
+import sqlite3
+import threading
+import time
+import telemetry
+import utils
+
+#The disk budget in MB if the ImageStore configuration does not give one
+default_budget_mb = 2048
+
+#The index file, in the image directory
+index_name = "index.sqlite"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sample INTEGER NOT NULL,
+    taken REAL NOT NULL,
+    path TEXT UNIQUE,
+    size INTEGER,
+    flickr_id TEXT,
+    used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS images_by_sample ON images (sample, taken);
+CREATE INDEX IF NOT EXISTS images_by_use ON images (used);
+"""
+
+class ImageStore(object):
+    """
+    The images on disk and their index.
+    
+    Attributes:
+        directory: The image directory, ending in a slash.
+        budget: The most bytes the images may use.
+        uploading: Called with the filename of an image that has no Flickr link,
+            returns whether it is waiting to be uploaded, so it is not evicted.
+            None if no images are uploaded.
+        _db: The connection to the index, shared by every thread that uses the
+            store.
+        _lock: Held while the index is used.
+        _used: The bytes used by the written images, kept as they are written
+            and evicted so it is not summed for every image.
+    """
+    
+    def __init__(self, directory = None, budget_mb = None):
+        """
+        Args:
+            directory: The image directory. The configured one if not given.
+            budget_mb: The disk budget in MB. Read from the budget_mb entry of the
+                ImageStore configuration if not given.
+        """
+        
+        if directory is None:
+            directory = utils.get_image_dir()
+        
+        if budget_mb is None:
+            try:
+                budget_mb = utils.read_config_dict("ImageStore").get(
+                                                'budget_mb', default_budget_mb)
+            except utils.BadConfigFileError:
+                budget_mb = default_budget_mb
+        
+        self.directory = os.path.join(directory, "")
+        self.budget = budget_mb * 1024 * 1024
+        self.uploading = None
+        
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory + index_name,
+                                   check_same_thread = False)
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(_schema)
+        self._used = self._db.execute("SELECT TOTAL(size) FROM images").fetchone()[0]
+    
+    def new_image(self, sample, timestamp, extension):
+        """
+        Adds an image to the index and returns the absolute filename it is to be
+        written to. Its directory is created if necessary. The image is not
+        evicted before written is called for it.
+        
+        Args:
+            sample: The sample in the image.
+            timestamp: The datetime the image was taken.
+            extension: The file extension of the image format, eg. "jpg".
+        """
+        
+        taken = time.mktime(timestamp.timetuple()) + timestamp.microsecond / 1e6
+        
+        with self._lock, self._db:
+            cursor = self._db.execute("INSERT INTO images (sample, taken, used) "
+                                      "VALUES (?, ?, ?)",
+                                      (sample, taken, time.time()))
+            
+            path = "%s/sample%02d/%s-%06d.%s" %(timestamp.strftime("%Y-%m-%d"),
+                                                sample,
+                                                timestamp.strftime("%H%M%S"),
+                                                cursor.lastrowid, extension)
+            
+            self._db.execute("UPDATE images SET path = ? WHERE id = ?",
+                             (path, cursor.lastrowid))
+        
+        try:
+            os.makedirs(os.path.dirname(self.directory + path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(self.directory + path)):
+                raise
+        
+        return self.directory + path
+    
+    def written(self, filename):
+        """
+        Records the size of an image once it has been written, then evicts the
+        least recently used images if the budget is passed.
+        """
+        
+        size = os.path.getsize(filename)
+        
+        with self._lock, self._db:
+            cursor = self._db.execute("UPDATE images SET size = ? "
+                                      "WHERE path = ? AND size IS NULL",
+                                      (size, self._relative(filename)))
+            self._used += size * cursor.rowcount
+            over = self._used > self.budget
+        
+        if over:
+            self.evict()
+    
+    def contains(self, filename):
+        """
+        Returns whether an image is in the store and has not been evicted.
+        """
+        
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM images WHERE path = ?",
+                                   (self._relative(filename),)).fetchone()
+        
+        return row is not None
+    
+    def touch(self, filename):
+        """
+        Marks an image as just used, so it is the last to be evicted.
+        """
+        
+        with self._lock, self._db:
+            self._db.execute("UPDATE images SET used = ? WHERE path = ?",
+                             (time.time(), self._relative(filename)))
+    
+    def set_link(self, filename, link):
+        """
+        Records the Flickr link of an uploaded image.
+        """
+        
+        with self._lock, self._db:
+            self._db.execute("UPDATE images SET flickr_id = ?, used = ? "
+                             "WHERE path = ?",
+                             (link, time.time(), self._relative(filename)))
+    
+    def link(self, filename):
+        """
+        Returns the Flickr link of an image, or None if it has not been uploaded.
+        """
+        
+        with self._lock:
+            row = self._db.execute("SELECT flickr_id FROM images WHERE path = ?",
+                                   (self._relative(filename),)).fetchone()
+        
+        return None if row is None else row[0]
+    
+    def find(self, sample, start = None, end = None):
+        """
+        Returns the (time taken, filename) of the images of a sample taken from
+        start up to but not including end, oldest first.
+        
+        Args:
+            sample: The sample in the images.
+            start: The earliest time in seconds since the epoch. No limit if None.
+            end: The time in seconds since the epoch to stop before. No limit if
+                None.
+        """
+        
+        if start is None:
+            start = float("-inf")
+        if end is None:
+            end = float("inf")
+        
+        with self._lock:
+            rows = self._db.execute("SELECT taken, path FROM images "
+                                    "WHERE sample = ? AND taken >= ? AND taken < ? "
+                                    "ORDER BY taken", (sample, start, end)).fetchall()
+        
+        return [(taken, self.directory + path) for taken, path in rows]
+    
+    def latest(self, sample):
+        """
+        Returns the (time taken, filename) of the latest image of a sample, or
+        None if there is none.
+        """
+        
+        with self._lock:
+            row = self._db.execute("SELECT taken, path FROM images WHERE sample = ? "
+                                   "ORDER BY taken DESC LIMIT 1",
+                                   (sample,)).fetchone()
+        
+        return None if row is None else (row[0], self.directory + row[1])
+    
+    def usage(self):
+        """
+        Returns the bytes used by the written images.
+        """
+        
+        with self._lock:
+            return self._used
+    
+    def evict(self, budget = None):
+        """
+        Deletes the least recently used written images until the rest fit in the
+        budget. Images waiting to be uploaded are skipped.
+        
+        Args:
+            budget: The bytes to fit in. The store's budget if not given, 0 to
+                delete every written image.
+        
+        Returns:
+            The number of images deleted.
+        """
+        
+        if budget is None:
+            budget = self.budget
+        
+        evicted = []
+        freed = 0
+        
+        with self._lock:
+            if self._used <= budget:
+                return 0
+            
+            rows = self._db.execute("SELECT id, path, size, flickr_id FROM images "
+                                    "WHERE size IS NOT NULL ORDER BY used")
+            
+            for row_id, path, size, flickr_id in rows.fetchall():
+                if self._used - freed <= budget:
+                    break
+                
+                if (flickr_id is None and self.uploading is not None and
+                        self.uploading(self.directory + path)):
+                    continue
+                
+                self._delete_file(path)
+                freed += size
+                evicted.append((row_id,))
+            
+            with self._db:
+                self._db.executemany("DELETE FROM images WHERE id = ?", evicted)
+            
+            self._used -= freed
+        
+        telemetry.record("images_evicted", count = len(evicted), bytes = freed)
+        
+        return len(evicted)
+    
+    def close(self):
+        
+        with self._lock:
+            self._db.close()
+    
+    def _relative(self, filename):
+        """
+        Helper method that returns the path of an image in the index.
+        """
+        
+        if filename.startswith(self.directory):
+            return filename[len(self.directory):]
+        
+        return filename
+    
+    def _delete_file(self, path):
+        """
+        Helper method that deletes an image. Its directories are left in place,
+        as another image may be about to be written to them.
+        """
+        
+        try:
+            os.remove(self.directory + path)
+        except OSError:
+            pass
+
+#The image store shared by the process
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Returns the ImageStore shared by the process, creating it on first use.
+    """
+    
+    global _store
+    
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageStore()
+    
+    return _store
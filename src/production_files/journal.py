@@ -0,0 +1,302 @@
+'''
+A write-ahead journal of the Router's queued transactions, so the requests
+waiting in the queue are not lost when the router is replaced or the
+machine reboots. Every time a transaction is queued its current state is
+appended to the journal, and once it is finished or dropped its completion
+is appended. When a Router starts, the transactions the journal holds that
+never completed are queued again.
+
+The journal only appends. Entries are buffered and written with one fsync
+per commit_interval, a group commit, so queuing a transaction costs a
+pickle and a list append rather than a disk flush. A crash loses at most the
+last commit_interval of entries. Once most of the entries are of completed
+transactions, the journal is compacted by rewriting only the live ones.
+
+Each entry is a header of the entry kind, the transaction's journal key and
+the payload length, the pickled Transaction.record() for a put, and a CRC32
+of the lot. Reading stops at the first entry that is short or does not
+match its CRC, which is where a crash cut the last write off.
+'''
+
+import cPickle
+import os
+import struct
+import threading
+import time
+import zlib
+import telemetry
+import utils
+
+#The journal file, in the resource directory
+journal_name = "transactions.journal"
+
+#The kinds of entry
+entry_put = 1
+entry_complete = 2
+
+_header = struct.Struct("<BQI")
+_crc = struct.Struct("<I")
+
+class Journal(object):
+    """
+    The journal of the queued transactions.
+    
+    Attributes:
+        filename: The journal file.
+        commit_interval: The seconds between group commits. 0 to write and fsync
+            every entry as it is made.
+        compact_min: The fewest entries written since the last compaction before
+            the journal is compacted.
+        compact_ratio: The journal is compacted once it holds more than this many
+            entries for every live transaction.
+        recovered: The (journal key, record) of every transaction that had not
+            completed when the journal was opened, in the order they were
+            first queued.
+        _live: A dictionary of journal key: the pickled record of each
+            transaction that has not completed.
+        _buffer: The entries waiting for the next commit.
+        _entries: The number of entries in the file.
+        _lock: Held while the live transactions or the buffer are used.
+        _file_lock: Held while the file is written, so queuing a transaction
+            does not wait for an fsync. Taken before _lock when both are held.
+    """
+    
+    def __init__(self, filename = None, commit_interval = 0.05, compact_min = 1000,
+                 compact_ratio = 4):
+        """
+        Opens the journal, reads the transactions that had not completed, and
+        compacts it to just those.
+        
+        Args:
+            filename: The journal file. The journal_name file in the resource
+                directory if not given.
+        """
+        
+        if filename is None:
+            filename = utils.get_resource_files_prefix() + journal_name
+        
+        self.filename = filename
+        self.commit_interval = commit_interval
+        self.compact_min = compact_min
+        self.compact_ratio = compact_ratio
+        
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._closed = False
+        self._buffer = []
+        self._live = self._read()
+        self._next_key = max(self._live) + 1 if self._live else 1
+        
+        self.recovered = [(key, cPickle.loads(payload))
+                          for key, payload in sorted(self._live.iteritems())]
+        
+        self._file = None
+        self._compact()
+        
+        self._wake = threading.Event()
+        self._flusher = None
+        
+        if commit_interval > 0:
+            self._flusher = threading.Thread(target = self._flush_loop,
+                                             name = "journal")
+            self._flusher.daemon = True
+            self._flusher.start()
+    
+    def put(self, transaction):
+        """
+        Journals the current state of a queued transaction, giving it a journal
+        key if it has none.
+        
+        Raises:
+            ValueError: The journal is closed.
+        """
+        
+        with self._lock:
+            self._check_open()
+            
+            if transaction.journal_key is None:
+                transaction.journal_key = self._next_key
+                self._next_key += 1
+            
+            payload = cPickle.dumps(transaction.record(), cPickle.HIGHEST_PROTOCOL)
+            self._live[transaction.journal_key] = payload
+            self._append(entry_put, transaction.journal_key, payload)
+        
+        if self.commit_interval <= 0:
+            self._commit()
+    
+    def complete(self, transaction):
+        """
+        Journals that a transaction is finished or dropped, so it is not queued
+        again when the journal is next opened.
+        
+        Raises:
+            ValueError: The journal is closed.
+        """
+        
+        with self._lock:
+            self._check_open()
+            
+            if self._live.pop(transaction.journal_key, None) is None:
+                return
+            
+            self._append(entry_complete, transaction.journal_key, "")
+        
+        if self.commit_interval <= 0:
+            self._commit()
+    
+    def pending(self):
+        """
+        Returns the number of transactions that have not completed.
+        """
+        
+        with self._lock:
+            return len(self._live)
+    
+    def sync(self):
+        """
+        Writes and fsyncs the buffered entries now.
+        """
+        
+        self._commit()
+    
+    def close(self):
+        """
+        Commits the buffered entries, and closes the journal. Transactions can
+        no longer be journaled once it is closed.
+        """
+        
+        with self._lock:
+            self._closed = True
+            
+        self._wake.set()
+        
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        
+        self._commit()
+        
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def _check_open(self):
+        """
+        Helper method, called with the lock held, that raises a ValueError if
+        the journal is closed, so an entry is never dropped unwritten.
+        """
+        
+        if self._closed:
+            raise ValueError("The journal is closed")
+    
+    def _append(self, kind, key, payload):
+        """
+        Helper method, called with the lock held, that buffers an entry for the
+        next commit.
+        """
+        
+        header = _header.pack(kind, key, len(payload))
+        crc = zlib.crc32(header + payload) & 0xffffffff
+        self._buffer.append(header + payload + _crc.pack(crc))
+    
+    def _commit(self):
+        """
+        Helper method that writes the buffered entries with one fsync, then
+        compacts the journal if it is mostly completed transactions.
+        Transactions can be queued while the entries are written.
+        """
+        
+        with self._file_lock:
+            with self._lock:
+                entries = self._buffer
+                self._buffer = []
+            
+            if not entries or self._file is None:
+                return
+            
+            self._file.write("".join(entries))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            
+            self._entries += len(entries)
+            
+            if self._entries >= self.compact_min:
+                with self._lock:
+                    if self._entries > self.compact_ratio * len(self._live):
+                        self._compact()
+    
+    def _compact(self):
+        """
+        Helper method that rewrites the journal with only the live transactions,
+        replacing it atomically, and leaves it open for appending. Called with
+        both locks held. Entries still buffered agree with the live 
+        transactions, so they can be appended after it.
+        """
+        
+        start = time.time()
+        temp_filename = self.filename + ".tmp"
+        
+        with open(temp_filename, 'wb') as compacted:
+            for key, payload in sorted(self._live.iteritems()):
+                header = _header.pack(entry_put, key, len(payload))
+                crc = zlib.crc32(header + payload) & 0xffffffff
+                compacted.write(header + payload + _crc.pack(crc))
+            
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        
+        if self._file is not None:
+            self._file.close()
+        
+        os.rename(temp_filename, self.filename)
+        
+        self._file = open(self.filename, 'ab')
+        self._entries = len(self._live)
+        
+        telemetry.record("journal_compacted", live = len(self._live),
+                         duration_ms = (time.time() - start) * 1000)
+    
+    def _read(self):
+        """
+        Helper method that reads the journal, and returns the live transactions
+        as a dictionary of journal key: pickled record.
+        """
+        
+        live = {}
+        
+        if not os.path.isfile(self.filename):
+            return live
+        
+        with open(self.filename, 'rb') as journal:
+            data = journal.read()
+        
+        position = 0
+        
+        while position + _header.size <= len(data):
+            kind, key, length = _header.unpack_from(data, position)
+            end = position + _header.size + length
+            
+            if end + _crc.size > len(data):
+                break
+            
+            crc = _crc.unpack_from(data, end)[0]
+            
+            #the tail of a write that was cut off
+            if zlib.crc32(data[position:end]) & 0xffffffff != crc:
+                break
+            
+            if kind == entry_put:
+                live[key] = data[position + _header.size:end]
+            else:
+                live.pop(key, None)
+            
+            position = end + _crc.size
+        
+        return live
+    
+    def _flush_loop(self):
+        
+        while not self._closed:
+            self._wake.wait(self.commit_interval)
+            self._commit()
@@ -0,0 +1,105 @@
+'''
+In-process latency statistics for the router. Durations are kept per
+(receiver, command) pair in a bounded window of the most recent samples, from
+which percentiles are computed on demand.
+'''
+
+import threading
+from collections import deque
+
+class LatencyStats(object):
+    """
+    Collects durations per receiver and command and reports their percentiles.
+    
+    Attributes:
+        window: The number of most recent durations kept for each pair.
+        points: The percentiles reported by summary.
+    """
+    
+    def __init__(self, window = 1000, points = (50, 90, 99)):
+        
+        self.window = window
+        self.points = points
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        
+    def record(self, receiver, command, duration):
+        """
+        Adds a duration, in seconds, for a receiver and command.
+        """
+        
+        key = (receiver, command)
+        
+        with self._lock:
+            try:
+                self._samples[key].append(duration)
+            except KeyError:
+                self._samples[key] = deque([duration], self.window)
+                self._counts[key] = 0
+                
+            self._counts[key] += 1
+            
+    def percentiles(self, receiver, command, points = None):
+        """
+        Returns a list of the requested percentiles, in seconds, of the recent
+        durations for a receiver and command, or None if there are none.
+        """
+        
+        with self._lock:
+            samples = sorted(self._samples.get((receiver, command), ()))
+            
+        if not samples:
+            return None
+        
+        return [_percentile(samples, p) for p in (points or self.points)]
+    
+    def summary(self):
+        """
+        Returns a dictionary of (receiver, command) keys to dictionaries of the
+        total count, the maximum and each percentile of the recent durations.
+        """
+        
+        with self._lock:
+            keys = [(key, sorted(samples), self._counts[key]) 
+                    for key, samples in self._samples.iteritems()]
+            
+        result = {}
+        
+        for key, samples, total in keys:
+            entry = {'count' : total, 'max' : samples[-1]}
+            
+            for p in self.points:
+                entry['p%d' %p] = _percentile(samples, p)
+                
+            result[key] = entry
+            
+        return result
+    
+    def dump(self, logger):
+        """
+        Logs one line per receiver and command with the count and percentiles in
+        milliseconds.
+        """
+        
+        for (receiver, command), entry in sorted(self.summary().items()):
+            logger.log("%s %s: count %d, %s, max %.1f ms" %(receiver, command, 
+                entry['count'],
+                ", ".join("p%d %.1f ms" %(p, entry['p%d' %p] * 1000) 
+                          for p in self.points),
+                entry['max'] * 1000))
+            
+    def reset(self):
+        
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+def _percentile(sorted_samples, point):
+    """
+    Nearest-rank percentile of an already sorted, non-empty list.
+    """
+    
+    index = int(round(point / 100.0 * (len(sorted_samples) - 1)))
+    
+    return sorted_samples[index]
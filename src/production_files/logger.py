@@ -1,17 +1,38 @@
 
+import atexit
+import sys
+import threading
 import time
 import os
+import weakref
 import utils
 
+#Seconds between background flushes of every logger's buffered lines
+flush_interval = 1.0
+
+#The most lines a logger keeps while its file cannot be written, as a multiple
+#of its max_buffered. The oldest lines are dropped after that.
+failed_buffers = 16
+
 class Logger:
     """
         This class lets us log a particular set of data. The default setting is an error
         log that is meant mostly for debugging. By changing the name, this can be used
         as a data logger (ie, set the separator to a comma, adn the show_date to false,
         and extension to cv). 
+        
+        Messages are buffered and written by a background thread every flush_interval
+        seconds, or sooner once max_buffered lines are waiting. The day's file is kept
+        open until the next day's first message. While the file cannot be written,
+        eg. the disk is full, the lines are kept for the next flush, up to 
+        failed_buffers times max_buffered of them.
+        
+        Attributes:
+            dropped: The number of lines dropped because they could not be written.
     """
     
-    def __init__(self, name = "messages", show_date = True, separator = " ", extension = "txt"):
+    def __init__(self, name = "messages", show_date = True, separator = " ", extension = "txt",
+                 max_buffered = 256, announce = True):
         """
         Initializes a new logger object. The defaults are for status and error message
         logging, but the if a new name is used, there will be a new directory in the log
@@ -22,6 +43,9 @@ class Logger:
             show_date: Whether or not a date should be printed with every log message
             separator: The delimiter for all strings passed to the logger in a log command
             extension: The file-type for the log messages. Defaults to '.txt'.
+            max_buffered: The number of waiting lines that triggers an early flush.
+            announce: Whether a "logger created" message is logged. Data loggers whose
+                      files must only contain data turn this off.
         """
         
         self.name = name
@@ -29,6 +53,16 @@ class Logger:
         self.show_date = show_date
         self.separator = separator
         self.extension = extension
+        self.max_buffered = max_buffered
+        self.dropped = 0
+        
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = None
+        self._day = None
+        self._second = None
+        self._time_string = ""
+        self._failing = False
         
         #check for log directory, create if necessary
         if not self.directory:
@@ -43,8 +77,11 @@ class Logger:
             if not os.path.isdir("%s%s/" %(self.directory, self.name)):
                 raise
             
+        _flusher.register(self)
+        
         #check for name directory in log, create if necessary
-        self.log("logger created")
+        if announce:
+            self.log("logger created")
     
     def log(self, *messages):
         """
@@ -53,24 +90,196 @@ class Logger:
         that a message is logged, a new file will be created. Each line of the log file
         will start with the date if the logger's show_date is set to true
         """
-   
-        current = time.localtime()
         
-        #set the file name for logging
-        file_name = "%s%s/%d%02d%02d.%s" % (self.directory, self.name, 
-                                            current.tm_year, current.tm_mon, 
-                                              current.tm_mday, self.extension)
-        #open the file
-        log_file = open(file_name, "a")
+        now = time.time()
         
         #attach all the message arguments
         log_string = self.separator.join(str(x) for x in messages)
         
-        #check the show_date flag, and write the log message
-        if self.show_date:
-            log_file.write("%02d:%02d:%02d - " % (current.tm_hour, current.tm_min, 
-                                            current.tm_sec) + log_string + "\n")
-        else:
-            log_file.write(log_string + "\n")
-                                              
-        log_file.close()
\ No newline at end of file
+        with self._lock:
+            #the time string and day only change once a second
+            if int(now) != self._second:
+                current = time.localtime(now)
+                self._second = int(now)
+                self._time_string = "%02d:%02d:%02d - " % (current.tm_hour, current.tm_min, 
+                                                           current.tm_sec)
+                
+                day = (current.tm_year, current.tm_mon, current.tm_mday)
+                
+                #lines from the previous day go in the previous day's file
+                if day != self._day:
+                    try:
+                        self._write_buffer()
+                        self._close_file()
+                    except EnvironmentError:
+                        #written with the new day's lines by the next flush
+                        self._write_failed()
+                    
+                    self._day = day
+            
+            #check the show_date flag, and buffer the log message
+            if self.show_date:
+                self._buffer.append(self._time_string + log_string + "\n")
+            else:
+                self._buffer.append(log_string + "\n")
+                
+            full = len(self._buffer) >= self.max_buffered
+            
+        if full:
+            _flusher.wake()
+            
+    def flush(self):
+        """
+        Writes all buffered messages to the log file.
+        
+        Raises:
+            IOError: The file could not be written. The messages are kept for the
+                next flush.
+        """
+        
+        with self._lock:
+            try:
+                self._write_buffer()
+            except Exception:
+                self._write_failed()
+                raise
+            
+    def close(self):
+        """
+        Writes all buffered messages and closes the log file. The file is opened again
+        if more messages are logged.
+        """
+        
+        with self._lock:
+            self._write_buffer()
+            self._close_file()
+        
+    def _write_buffer(self):
+        """
+        Writes the buffered lines to the current day's file. The lock must be held.
+        """
+        
+        if not self._buffer:
+            return
+        
+        if self._file is None:
+            #set the file name for logging
+            file_name = "%s%s/%d%02d%02d.%s" % ((self.directory, self.name) + 
+                                                self._day + (self.extension,))
+            self._file = open(file_name, "a")
+            
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._buffer = []
+        self._failing = False
+        
+    def _write_failed(self):
+        """
+        Called with the lock held when the buffered lines could not be written.
+        Closes the file, so it is opened again by the next write, eg. after it was
+        rotated, and drops the oldest lines once too many are waiting.
+        """
+        
+        self._failing = True
+        
+        try:
+            self._close_file()
+        except EnvironmentError:
+            self._file = None
+        
+        excess = len(self._buffer) - self.max_buffered * failed_buffers
+        
+        if excess > 0:
+            del self._buffer[:excess]
+            self.dropped += excess
+        
+    def _close_file(self):
+        
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class _Flusher(threading.Thread):
+    """
+    The background thread that periodically writes the buffered messages of every
+    logger in the process.
+    """
+    
+    def __init__(self):
+        super(_Flusher, self).__init__(name = "log flusher")
+        self.daemon = True
+        self._loggers = weakref.WeakSet()
+        self._loggers_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = True
+        self._started = False
+        
+    def register(self, logger):
+        
+        with self._loggers_lock:
+            self._loggers.add(logger)
+            start = not self._started
+            self._started = True
+        
+        if start:
+            self.start()
+        
+    def wake(self):
+        
+        self._wake.set()
+        
+    def flush_all(self):
+        
+        with self._loggers_lock:
+            loggers = list(self._loggers)
+            
+        for logger in loggers:
+            failing = logger._failing
+            
+            try:
+                logger.flush()
+            except Exception as e:
+                #reported once, until the logger writes again
+                if not failing:
+                    sys.stderr.write("Could not write the %s log, %d lines dropped "
+                                     "so far: %s\n" %(logger.name, logger.dropped, e))
+    
+    def stop(self):
+        """
+        Stops the thread after its current flush. Called at interpreter exit.
+        """
+        
+        self._running = False
+        self._wake.set()
+        
+        if self.is_alive():
+            self.join(flush_interval)
+    
+    def run(self):
+        
+        while self._running:
+            self._wake.wait(flush_interval)
+            self._wake.clear()
+            
+            #the thread must outlive any error, or every buffer grows for good
+            try:
+                self.flush_all()
+            except Exception as e:
+                sys.stderr.write("Error flushing the logs: %s\n" %e)
+
+_flusher = _Flusher()
+
+def flush_all():
+    """
+    Writes the buffered messages of every logger. Called before any shutdown or
+    reboot so no messages are lost.
+    """
+    
+    _flusher.flush_all()
+
+def _shutdown():
+    
+    _flusher.stop()
+    flush_all()
+
+atexit.register(_shutdown)
\ No newline at end of file
@@ -0,0 +1,138 @@
+'''
+Resolution of the directories the program keeps its resources, images and
+logs in. Each directory is found once and the absolute path is cached, so
+callers that ask for it on every image or log message pay nothing. The
+working directory of the process is never changed.
+
+A directory can be overridden with an environment variable, and the image
+and log directories can also be set in a "Paths" section of the
+configuration file. Otherwise the directory is searched for in the
+directory of this package and each of its parents.
+'''
+
+import os
+import threading
+import utils
+
+env_overrides = {'resources' : 'PELLINGLAB_RESOURCE_DIR',
+                 'images' : 'PELLINGLAB_IMAGE_DIR',
+                 'log' : 'PELLINGLAB_LOG_DIR'}
+
+config_overrides = {'images' : 'image_dir',
+                    'log' : 'log_dir'}
+
+_resolved = {}
+_lock = threading.RLock()
+
+def resource_dir():
+    """
+    Returns the absolute path of the resource directory, with a trailing
+    slash, or False if it cannot be found.
+    """
+    
+    return _resolve("resources")
+
+def image_dir():
+    """
+    Returns the absolute path of the image storage directory, with a trailing
+    slash. If it cannot be found, it is placed next to the resource directory.
+    """
+    
+    return _resolve("images")
+
+def log_dir():
+    """
+    Returns the absolute path of the log storage directory, with a trailing
+    slash. If it cannot be found, it is placed next to the resource directory.
+    """
+    
+    return _resolve("log")
+
+def reset():
+    """
+    Forgets all resolved directories, so they are found again on next use.
+    """
+    
+    with _lock:
+        _resolved.clear()
+
+def _resolve(name):
+    """
+    Returns the cached path for the named directory, finding it first if this
+    is the first time it was asked for.
+    """
+    
+    try:
+        return _resolved[name]
+    except KeyError:
+        pass
+    
+    with _lock:
+        if name not in _resolved:
+            path = _find(name)
+            
+            #A missing resource directory may be created later, so it is
+            #looked for again next time
+            if not path:
+                return path
+            
+            _resolved[name] = path
+            
+        return _resolved[name]
+
+def _find(name):
+    """
+    Looks for the named directory in the environment, then the configuration
+    file, then the directory of this package and its parents.
+    """
+    
+    override = os.environ.get(env_overrides[name])
+    
+    if not override and name in config_overrides:
+        override = _config_override(config_overrides[name])
+        
+    if override:
+        return _as_dir(override)
+    
+    current = os.path.dirname(os.path.abspath(__file__))
+    
+    while True:
+        if os.path.isdir(os.path.join(current, name)):
+            return _as_dir(os.path.join(current, name))
+        
+        parent = os.path.dirname(current)
+        
+        #reached the root of the file system
+        if parent == current:
+            break
+        
+        current = parent
+    
+    if name == "resources":
+        return False
+    
+    #default to a sibling of the resource directory
+    resources = resource_dir()
+    
+    if not resources:
+        return False
+    
+    return _as_dir(os.path.join(os.path.dirname(resources.rstrip("/")), name))
+
+def _config_override(key):
+    """
+    Returns the value of key in the Paths section of the configuration file,
+    or None if there is no configuration file, section or key.
+    """
+    
+    if not resource_dir():
+        return None
+    
+    try:
+        return utils.read_config_dict("Paths").get(key)
+    except (utils.BadConfigFileError, IOError, OSError):
+        return None
+
+def _as_dir(path):
+    
+    return os.path.abspath(os.path.expanduser(path)) + "/"
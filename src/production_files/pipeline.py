@@ -0,0 +1,277 @@
+'''
+The executor a Router uses in pipeline mode. Instead of every transaction
+waiting its turn in one queue, each receiver gets its own inbox and worker
+thread, so a slow receiver only holds up its own transactions: a Flickr
+upload or a run of camera moves no longer stalls Twitter polling or the
+translator.
+
+A transaction is queued in the inbox of the first receiver it is routed to.
+Its worker hands it to the Router, which routes and processes it exactly as
+in the single queue, then queues it again wherever it is to go next. Every
+receiver is only ever used by one thread at a time, so the hardware-bound
+CameraReceiver stays strictly serialized, as do receivers whose
+communicators are not thread safe.
+
+An exception raised by a receiver stops the executor and is raised again by
+the Router's next(), so startup.py replaces the Router as it always has.
+'''
+
+import sys
+import threading
+import time
+
+class ReceiverWorker(object):
+    """
+    The inbox and worker thread of one receiver id.
+    
+    Attributes:
+        r_id: The id of the receiver the inbox is for.
+        lock: Held while any thread uses the receiver.
+        _inbox: The scheduler of the transactions waiting for the worker.
+        _busy: Whether the worker is processing a transaction.
+    """
+    
+    def __init__(self, executor, r_id, scheduler_class):
+        
+        self.r_id = r_id
+        self.lock = threading.RLock()
+        
+        self._executor = executor
+        self._inbox = scheduler_class()
+        self._busy = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target = self._work,
+                                        name = "%s worker" %r_id)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def put(self, transaction):
+        
+        with self._condition:
+            self._inbox.push(transaction)
+            self._condition.notify()
+    
+    def pending(self):
+        """
+        Returns the number of transactions queued or being processed.
+        """
+        
+        with self._condition:
+            return len(self._inbox) + self._busy
+    
+    def stop(self, wait = True):
+        """
+        Wakes the worker so it sees the executor has stopped, and waits for it
+        to finish the transaction it is processing if wait is True.
+        """
+        
+        with self._condition:
+            self._condition.notify()
+        
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+    
+    def _work(self):
+        
+        while True:
+            with self._condition:
+                while self._executor.running and not self._inbox:
+                    self._condition.wait()
+                
+                if not self._executor.running:
+                    return
+                
+                transaction = self._inbox.pop()
+                self._busy = True
+            
+            try:
+                self._executor.deliver(transaction)
+            except Exception:
+                error_info = sys.exc_info()
+            else:
+                error_info = None
+            
+            with self._condition:
+                self._busy = False
+            
+            if error_info is not None:
+                self._executor.fail(error_info)
+            
+            self._executor.finished()
+            
+            if error_info is not None:
+                return
+
+class PipelineExecutor(object):
+    """
+    Runs a worker per receiver id, and passes the transactions queued by a
+    Router to them.
+    
+    Attributes:
+        running: False once the executor is stopped, or a receiver has raised
+            an exception.
+        error: The first exception raised by a receiver, None if there was none.
+        _workers: A dictionary of receiver id: ReceiverWorker pairs.
+        _error_info: The exception information of the error, so it is raised
+            again with the traceback of the worker.
+        _queued: The number of transactions submitted and not yet processed.
+        _idle: Notified when _queued falls to 0, or the executor stops.
+    """
+    
+    def __init__(self, router):
+        """
+        Creates a worker for every receiver of a router, whose inbox uses the
+        router's scheduler. The router's receivers must all have been created.
+        """
+        
+        self.running = True
+        self.error = None
+        self._error_info = None
+        
+        self._router = router
+        self._workers = {}
+        self._error_lock = threading.Lock()
+        self._queued = 0
+        self._idle = threading.Condition()
+        
+        for receiver in router._receivers:
+            if receiver.r_id not in self._workers:
+                self._workers[receiver.r_id] = ReceiverWorker(self, receiver.r_id,
+                                                              router._scheduler_class)
+    
+    def submit(self, transaction):
+        """
+        Queues a transaction in the inbox of the first receiver it is routed to.
+        A transaction routed to no receiver is passed to the router at once,
+        which drops it.
+        """
+        
+        receivers = self._router._route(transaction.to_id)
+        
+        if receivers:
+            with self._idle:
+                self._queued += 1
+                
+            self._workers[receivers[0].r_id].put(transaction)
+        elif self.running:
+            self._router._deliver(transaction)
+    
+    def deliver(self, transaction):
+        """
+        Called by a worker to have the router process a transaction. Holds the
+        lock of every receiver it is routed to, taken in a fixed order so two
+        workers never wait on each other.
+        
+        The router is only woken when a poll of the twitter or gui receiver is
+        done, so it can schedule the next one. It is not woken for every other
+        transaction, as the workers process them without it.
+        """
+        
+        command = transaction.command
+        locks = sorted(set(self._workers[receiver.r_id]
+                           for receiver in self._router._route(transaction.to_id)),
+                       key = lambda worker: worker.r_id)
+        
+        for worker in locks:
+            worker.lock.acquire()
+        
+        try:
+            self._router._deliver(transaction)
+        finally:
+            for worker in reversed(locks):
+                worker.lock.release()
+        
+        if command == "update":
+            self._router._work_available.set()
+    
+    def finished(self):
+        """
+        Called by a worker once it is done with a transaction, including any
+        transaction it queued in its place.
+        """
+        
+        with self._idle:
+            self._queued -= 1
+            
+            if self._queued <= 0:
+                self._idle.notify_all()
+    
+    def pending(self, r_id = None):
+        """
+        Returns the number of transactions queued or being processed for a
+        receiver id, or for every receiver if none is given.
+        """
+        
+        if r_id is not None:
+            worker = self._workers.get(r_id)
+            return 0 if worker is None else worker.pending()
+        
+        return sum(worker.pending() for worker in self._workers.itervalues())
+    
+    def lock(self, r_id):
+        """
+        Returns the lock held while the receivers with an id are used, so the
+        router can use one without a worker using it at the same time.
+        """
+        
+        return self._workers[r_id].lock
+    
+    def join(self, timeout = None):
+        """
+        Waits until no transactions are queued or being processed, or the
+        executor has stopped. Returns whether it is idle.
+        """
+        
+        deadline = None if timeout is None else time.time() + timeout
+        
+        with self._idle:
+            while self.running and self._queued > 0:
+                if deadline is None:
+                    self._idle.wait()
+                else:
+                    remaining = deadline - time.time()
+                    
+                    if remaining <= 0:
+                        return False
+                    
+                    self._idle.wait(remaining)
+        
+        return self.pending() == 0
+    
+    def fail(self, error_info):
+        """
+        Called by a worker whose receiver raised an exception, with the
+        sys.exc_info() of the exception. Stops the other workers, and wakes the
+        router so it raises the exception.
+        """
+        
+        with self._error_lock:
+            if self.error is None:
+                self.error = error_info[1]
+                self._error_info = error_info
+        
+        self.stop(wait = False)
+        self._router._work_available.set()
+    
+    def raise_error(self):
+        """
+        Raises the exception a receiver raised on its worker, if there was one.
+        """
+        
+        if self._error_info is not None:
+            raise self._error_info[0], self._error_info[1], self._error_info[2]
+    
+    def stop(self, wait = True):
+        """
+        Stops the workers once the transactions they are processing are done.
+        Transactions still in the inboxes are dropped, as they are when a
+        Router with a single queue is replaced.
+        """
+        
+        self.running = False
+        
+        with self._idle:
+            self._idle.notify_all()
+        
+        for worker in self._workers.itervalues():
+            worker.stop(wait)
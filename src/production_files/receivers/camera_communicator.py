@@ -1,10 +1,18 @@
-from production_files import utils
-from cv2 import imwrite, VideoCapture #@UnresolvedImport
+from production_files import utils, telemetry, image_store
+from collections import OrderedDict
+from cv2 import VideoCapture #@UnresolvedImport
 import datetime
 from production_files.logger import Logger
+import motion_planner
+from frame_grabber import FrameGrabber, CaptureFailedException
+from image_writer import ImageWriter
+import Queue
+import re
 from serial import Serial, SerialException
+from serial_protocol import SerialProtocolEngine
 from serial.tools import list_ports
-from time import sleep
+import threading
+from time import sleep, time
 
 '''
 Created Oct 2, 2013
@@ -17,13 +25,36 @@ interface with the actual camera.
 
 Note:
 This implementation is currently blocking. Nothing will happen in the main
-program until the arduino board returns a value.
+program until the arduino board returns a value. Responses are read by the
+serial_protocol engine's reader thread, so a command only blocks for as long
+as the board takes to answer.
 '''
 
 default_dict = {'arduino_port' : 'None',
+                'arduino_fingerprint' : 'None',
+                'boot_delay' : 3,
+                'handshake_timeout' : 3,
                 'max_x' : 1000,
                 'max_y' : 1000,
-                'max_z' : 1000}
+                'max_z' : 1000,
+                'path_strategy' : 'nearest',
+                'drift_budget' : 0,
+                'settle_tolerance' : 2,
+                'settle_max_frames' : 30,
+                'flush_frames' : 4,
+                'command_terminator' : 'none'}
+
+#What the board firmware expects after each command, by the command_terminator
+#setting. Bare commands are told apart by the pause before the next one
+request_terminators = {'none' : "",
+                       'newline' : "\n"}
+
+#The first letters of the board commands that move the camera
+motion_commands = ('m', 'h')
+
+#The USB vendor id, product id and serial number in a port's hardware id, as
+#written by both pyserial 2 and 3
+_hwid_regex = re.compile(r'VID:PID=([0-9A-Fa-f]{4}):([0-9A-Fa-f]{4})(?:\s+(?:SER|SNR)=(\S+))?')
 
 class CameraCommunicator(object):
     """
@@ -34,7 +65,12 @@ class CameraCommunicator(object):
         _lights: An instance of Lights that controls and tracks the state of the lights
         _camera_positions: The list of positions the samples being monitored.
         _board_comm: The communication interface with the Arduino board.
+        _board_settings: The keyword arguments for connecting to the board.
         cam: An instance of Camera that is the interface with the physical camera.
+        path_strategy: The motion_planner strategy used to order batches of captures.
+        drift_budget: The distance the camera may travel in a batch of captures 
+            before it is homed again. 0 homes only at the end of a batch.
+        _logger: Logs the planned batches of captures.
     """
     
     def __init__(self, hasCamera = True):
@@ -45,6 +81,7 @@ class CameraCommunicator(object):
         """
         
         config_dict = utils.read_config_dict("CameraCommunicator")
+        self._logger = Logger()
         self._lights = None
         self._camera_positions = None
         
@@ -54,11 +91,29 @@ class CameraCommunicator(object):
         except KeyError:
             port = default_dict['arduino_port']
         
+        fingerprint = config_dict.get('arduino_fingerprint', 
+                                      default_dict['arduino_fingerprint'])
+        self._board_settings = dict(
+                fingerprint = None if fingerprint == 'None' else fingerprint,
+                boot_delay = config_dict.get('boot_delay', default_dict['boot_delay']),
+                handshake_timeout = config_dict.get('handshake_timeout', 
+                                                    default_dict['handshake_timeout']),
+                request_terminator = request_terminators[
+                        config_dict.get('command_terminator', 
+                                        default_dict['command_terminator'])])
+        
         self._board_comm = self._connect(port)
         
         #Initialization of the Camera
         if hasCamera:
-            self.cam = Camera(config_dict['camera_number'])
+            self.cam = Camera(config_dict['camera_number'],
+                              config_dict.get('settle_tolerance', 
+                                              default_dict['settle_tolerance']),
+                              config_dict.get('settle_max_frames',
+                                              default_dict['settle_max_frames']),
+                              config_dict,
+                              config_dict.get('flush_frames',
+                                              default_dict['flush_frames']))
         
         #Initialization of the Lights
         try:
@@ -91,6 +146,12 @@ class CameraCommunicator(object):
         
         self._set_sample_pos(config_dict)
         
+        #Batch capture settings
+        self.path_strategy = config_dict.get('path_strategy', 
+                                             default_dict['path_strategy'])
+        self.drift_budget = config_dict.get('drift_budget', 
+                                            default_dict['drift_budget'])
+        
     
     def get_sample_image(self, sample_num):
         """
@@ -106,20 +167,81 @@ class CameraCommunicator(object):
             the newly saved image.
         """
         
-        #Uses sample_num - 1 to translate from the 1-indexed twitter interface
-        #to the 0-indexed Arduino interface 
-        self._camera_positions.move(self.sample_positions[sample_num - 1])
-        self._lights.on(sample_num - 1)
-        
-        timestamp, image = self.cam.get_image()
-        
-        self._lights.all_off()
+        start = time()
         
         #Homes after every image capture, to reduce camera drift.
-        self._camera_positions.home()
+        timestamp, image = self._capture_at(sample_num, home_after = True)
+        
+        telemetry.record("capture", receiver = "camera", sample = sample_num,
+                         duration_ms = (time() - start) * 1000)
         
         return timestamp, image
     
+    def get_sample_images(self, sample_nums, strategy = None):
+        """
+        Retrieve images of several samples, visiting them in an order planned
+        to minimize the travel of the camera. The camera is homed once at the
+        end, and on the way whenever the travel since the last homing would
+        exceed the drift budget.
+        
+        Args:
+            sample_nums: The samples being imaged. Duplicates are imaged once.
+            strategy: The motion_planner strategy to use, instead of the
+                configured path_strategy.
+        
+        Returns:
+            A list of (sample_num, timestamp, image) tuples, in the order the
+            images were taken.
+        """
+        
+        order, travel = self.plan_captures(sample_nums, strategy)
+        
+        self._logger.log("Capturing samples %s, planned travel %.0f" 
+                         %(order, travel))
+        
+        images = []
+        position = motion_planner.home
+        drift = 0
+        
+        for index, sample_num in enumerate(order):
+            start = time()
+            target = self.sample_positions[sample_num - 1]
+            step = motion_planner.distance(position, target)
+            home_first = False
+            
+            #home first if this move would take the camera past its budget
+            if self.drift_budget and drift > 0 and drift + step > self.drift_budget:
+                home_first = True
+                drift = 0
+                step = motion_planner.distance(motion_planner.home, target)
+            
+            timestamp, image = self._capture_at(sample_num, home_first,
+                                                home_after = index == len(order) - 1)
+            images.append((sample_num, timestamp, image))
+            
+            position = target
+            drift += step
+            
+            telemetry.record("capture", receiver = "camera", sample = sample_num,
+                             duration_ms = (time() - start) * 1000)
+            
+        return images
+    
+    def plan_captures(self, sample_nums, strategy = None):
+        """
+        Plans the order to visit samples in, without moving the camera.
+        
+        Returns:
+            A tuple of the list of samples in the planned order, and the planned
+            travel from home, through every sample and back home.
+        """
+        
+        positions = OrderedDict((num, self.sample_positions[num - 1]) 
+                                for num in sample_nums)
+        
+        return motion_planner.plan_route(positions, 
+                                         strategy or self.path_strategy)
+    
     def get_camera_position_tracker(self):
         
         return self._camera_positions
@@ -132,15 +254,29 @@ class CameraCommunicator(object):
         
         return self.get_camera_position_tracker(), self.get_lights_tracker()
         
+    def is_healthy(self):
+        """
+        A cheap check that the board connection and the camera are still usable,
+        without sending anything to the board.
+        """
+        
+        if not self._board_comm.is_open():
+            return False
+        
+        return not hasattr(self, "cam") or self.cam.is_open()
+    
     def cleanup(self):
         """
         Close the connection with the Arduino to allow new connections to be
-        made with it.
+        made with it, and release the camera.
         """
         
-        self._board_comm._connection.close()
+        self._board_comm.close()
         del self._board_comm
         
+        if hasattr(self, "cam"):
+            self.cam.release()
+        
     def _set_sample_pos(self, config_dict):
         """
         Helper method for initializing the calibrated sample positions.
@@ -166,6 +302,68 @@ class CameraCommunicator(object):
             else: 
                 counter += 1
     
+    def _capture_at(self, sample_num, home_first = False, home_after = False):
+        """
+        Moves to a sample, lights it, and takes its image. The board commands
+        before and after the image are each sent as one batch.
+        
+        Args:
+            sample_num: The sample being imaged.
+            home_first: Home the camera before moving to the sample.
+            home_after: Home the camera after the image is taken.
+        """
+        
+        positions = self._camera_positions
+        lights = self._lights
+        
+        #Uses sample_num - 1 to translate from the 1-indexed twitter interface
+        #to the 0-indexed Arduino interface 
+        target = self.sample_positions[sample_num - 1]
+        steps = []
+        
+        if home_first:
+            steps.append(("h", positions.homed))
+            
+        steps.append((positions.move_command(target), 
+                      lambda result: positions.moved(target, result)))
+        
+        if not lights.is_on(sample_num - 1):
+            steps.append((lights.on_command(sample_num - 1), 
+                          lambda result: lights.turned_on(sample_num - 1, result)))
+            
+        self._run_steps(steps)
+        
+        timestamp, image = self.cam.get_image(sample_num)
+        
+        steps = [("l o", lights.turned_all_off)]
+        
+        if home_after:
+            steps.append(("h", positions.homed))
+            
+        self._run_steps(steps)
+        
+        #the stream only needs to be warm while a sample is lit
+        self.cam.idle()
+        
+        return timestamp, image
+    
+    def _run_steps(self, steps):
+        """
+        Sends a list of (command, handler) steps to the board as one batch, and
+        passes each result code to its handler. The batch stops at the first
+        failed move; that step's handler deals with it, eg. by homing, and any
+        remaining steps are then sent one at a time, as they would have been
+        without batching.
+        """
+        
+        results = self._board_comm.send_batch([command for command, handler in steps])
+        
+        for (command, handler), result in zip(steps, results):          #@UnusedVariable
+            handler(result)
+            
+        for command, handler in steps[len(results):]:
+            handler(self._board_comm.send(command))
+    
     def _connect(self, port):
         """
         Helper method that creates and initializes the board communicator. Pass
@@ -173,7 +371,7 @@ class CameraCommunicator(object):
         with the Arduino, if necessary.
         """
         
-        connection = BoardCommunicator(port)
+        connection = BoardCommunicator(port, **self._board_settings)
         
         if self._camera_positions is not None:
             self._camera_positions.reset()
@@ -191,44 +389,92 @@ class Camera(object):
     
     Attributes:
         cam: An instance of an openCV VideoCapture. 
+        _grabber: The FrameGrabber that reads frames from cam in the background.
+        _writer: The ImageWriter that encodes and writes the images.
+        _store: The ImageStore that names and indexes the images.
     """
     
-    def __init__(self, device_num):
+    def __init__(self, device_num, settle_tolerance = 2, settle_max_frames = 30,
+                 encode_settings = None, flush_frames = 4):
         """
         Uses a device num in case the system has multiple cameras attached.
+        
+        Args:
+            device_num: The number of the camera device.
+            settle_tolerance: The percentage change in brightness between frames
+                below which the exposure has settled.
+            settle_max_frames: The most frames read waiting for the exposure to
+                settle.
+            encode_settings: The image format and encoding settings, see 
+                image_writer.default_settings.
+            flush_frames: The frames the camera driver buffers, discarded at 
+                the start of every image as they may be from before the camera
+                moved or the light changed.
         """
         
         self.cam = VideoCapture(device_num) 
+        self._grabber = FrameGrabber(self.cam, tolerance = settle_tolerance / 100.0,
+                                     max_frames = settle_max_frames,
+                                     flush_frames = flush_frames)
+        self._writer = ImageWriter(encode_settings)
+        self._store = image_store.get_store()
+        
+    def is_open(self):
+        """
+        Returns whether the camera device is open.
+        """
+        
+        return self.cam.isOpened()
+    
+    def release(self):
+        """
+        Closes the camera device so it can be opened again.
+        """
+        
+        self._grabber.stop()
+        self._writer.close()
+        self.cam.release()
+    
+    def idle(self):
+        """
+        Stops reading frames from the camera until the next image.
+        """
+        
+        self._grabber.idle()
         
-    def get_image(self):
+    def get_image(self, sample_num):
         """
         Grab a frame from the camera. The cameraCommunicator is the caller,
         and is responsible for lighting and location. The filename of the
-        image is returned. 
+        image is returned straight away, while the image is written in the
+        background; image_writer.wait_for waits until it has been written.
+        
+        Args:
+            sample_num: The sample being imaged, used to file the image.
         
         Raises:
             FatalCameraException: An image was not taken successfully.
         """
         
-        #create the systematic filename
+        #the store gives every image its own file
         timestamp = datetime.datetime.now()
-        filename = utils.get_image_dir() + str(timestamp.date()) + \
-                    str(timestamp.hour) + str(timestamp.minute) + \
-                    str(timestamp.second) + '.jpg'
+        filename = self._store.new_image(sample_num, timestamp, 
+                                         self._writer.extension)
         
-        #A series of reads to allow the camera to adjust to lighting
-        self.cam.read()
-        self.cam.read()
-        self.cam.read()
-        self.cam.read()
+        #Frames are read until the camera has adjusted to the lighting, and
+        #only the first stable one is saved
+        start = time()
         
-        #only the last is saved
-        success, image = self.cam.read()
-        
-        if not success:
+        try:
+            image = self._grabber.capture()
+        except CaptureFailedException:
             raise FatalCameraException()
-        else:
-            imwrite(filename, image)
+        
+        telemetry.record("frame_settle", receiver = "camera", 
+                         discarded = self._grabber.discarded,
+                         duration_ms = (time() - start) * 1000)
+        
+        self._writer.submit(filename, image, self._store.written)
             
         return timestamp, filename
 
@@ -239,17 +485,33 @@ class BoardCommunicator(object):
     necessary. Reconnection will reboot the arduino, so homing is required.
     
     Attributes:
+        port: The port the Arduino board is connected at.
+        fingerprint: The "vid:pid:serial" of the Arduino board's USB serial 
+            device, None if it is not known.
+        boot_delay: The seconds the board takes to boot after its port is opened.
+        handshake_timeout: The seconds to wait for the answer to the handshake.
+        request_terminator: The string the board firmware expects after each
+            command, empty if it reads bare commands.
         _connection: The serial connection with the Arduino board.
+        _engine: The SerialProtocolEngine that sends commands over the connection
+                 and reads the responses.
         _logger: An Arduino-communication specific logger. Logs messages to and
                  from the Arduino board.
     """
     
-    def __init__(self, port):
+    def __init__(self, port, fingerprint = None, boot_delay = 3, 
+                 handshake_timeout = 3, request_terminator = ""):
         """
         Connect to the Arduino board and create a logger to track communication.
         
         Args:
             Port: The stored port to attempt to connect to.
+            fingerprint: The stored fingerprint of the board's USB serial device.
+            boot_delay: The seconds the board takes to boot after its port is opened.
+            handshake_timeout: The seconds to wait for the answer to the handshake.
+            request_terminator: The string the board firmware expects after each
+                command. Light commands are only batched without waiting for
+                each answer if it is not empty.
             
         Raises:
             SerialException: Unable to connect to the board.
@@ -257,7 +519,14 @@ class BoardCommunicator(object):
         
         self._logger = Logger(name = "arduino_log")
         self._connection = None
-        self._establish_connection(port)
+        self._engine = None
+        self._probe_lock = threading.Lock()
+        self.port = None
+        self.fingerprint = None
+        self.boot_delay = boot_delay
+        self.handshake_timeout = handshake_timeout
+        self.request_terminator = request_terminator
+        self._establish_connection(port, fingerprint)
     
     def send(self, message):
         """
@@ -272,130 +541,271 @@ class BoardCommunicator(object):
             
         Raises:
             SerialException: the connection to the Arduino board has been closed
+            SerialTimeoutException: the Arduino board did not answer in time
         """
         
         self._logger.log("Sent to arduino: '%s'" %message)
+        start = time()
         
-        if self._connection.isOpen():
-            self._connection.flushInput()
-            self._connection.flushOutput()
-            self._connection.write(message)
-        else:
+        if not self._connection.isOpen():
             raise SerialException("Connection to arduino board closed")
         
-        #blocking waiting for feedback
-        while(self._connection.inWaiting() == 0):
-            pass
-        
-        sleep(1)        #allows for the entire message to be transmitted
-        
-        result = int(self._connection.read(self._connection.inWaiting()).rstrip())
+        result = int(self._engine.send(message))
         
         self._logger.log("Received from arduino: '%d'" %result)
+        telemetry.record("serial", receiver = "camera", message = message, 
+                         result = result, duration_ms = (time() - start) * 1000)
         
         return result
+    
+    def send_batch(self, messages):
+        """
+        Send an ordered batch of messages to the Arduino board in one exchange.
+        Light commands are written without waiting for the board to answer the
+        ones before them, if the board reads terminated commands so they can be
+        told apart. Nothing is written after a move or homing until the board
+        has answered it, and the batch stops at the first one that fails, so
+        the board never acts on commands meant for a camera that did not get
+        where it was sent. A failed light command does not stop the batch.
         
-    def _establish_connection(self, port):
+        Args:
+            messages: the list of strings to be sent to the Arduino.
+            
+        Returns:
+            The list of integer results, one for each message sent. It is 
+            shorter than messages if a move or homing failed.
+            
+        Raises:
+            SerialException: the connection to the Arduino board has been closed
+            SerialTimeoutException: the Arduino board did not answer in time
+        """
+        
+        self._logger.log("Sent batch to arduino: %r" %(messages,))
+        start = time()
+        
+        if not self._connection.isOpen():
+            raise SerialException("Connection to arduino board closed")
+        
+        results = []
+        pending = []
+        
+        for message in messages:
+            #bare commands run together if written before the last is answered
+            if not self.request_terminator:
+                results.extend(int(response.result()) for response in pending)
+                del pending[:]
+            
+            pending.append(self._engine.request(message))
+            
+            if message[:1] in motion_commands:
+                results.extend(int(response.result()) for response in pending)
+                del pending[:]
+                
+                if results[-1] != 0:
+                    break
+        
+        results.extend(int(response.result()) for response in pending)
+        
+        self._logger.log("Received from arduino: %r" %(results,))
+        telemetry.record("serial_batch", receiver = "camera", message = messages, 
+                         result = results, duration_ms = (time() - start) * 1000)
+        
+        return results
+    
+    def is_open(self):
+        """
+        Returns whether the connection is open and its responses are still
+        being read.
+        """
+        
+        return (self._connection is not None and self._connection.isOpen() and
+                self._engine is not None and self._engine.is_running())
+    
+    def close(self):
+        """
+        Stop reading from the Arduino board and close the connection.
+        """
+        
+        if self._engine is not None:
+            self._engine.stop()
+            
+        if self._connection is not None:
+            self._connection.close()
+        
+    def _use_connection(self, cxn):
+        """
+        Helper method that adopts a connection that passed the handshake, and
+        starts the engine that reads the responses from it.
+        """
+        
+        self._connection = cxn
+        self._engine = SerialProtocolEngine(cxn, 
+                                            request_terminator = self.request_terminator)
+        self._engine.start()
+        
+    def _establish_connection(self, port, fingerprint):
         """
         Helper method to be used by the BoardCommunicator only to connect to the
         arduino board. Tells the arduino to home upon connection.
+        
+        If a port has the fingerprint of the board from the last connection,
+        only that port is tried. Otherwise the stored port and every other
+        available port are tried at the same time, and the first to answer the
+        handshake is used.
+        
+        The fingerprint does not make connecting any faster. Opening the port
+        resets the board, so even the fingerprinted port is only handshaken
+        after boot_delay, the same wait as a search of every port. What it 
+        saves is opening, and resetting, the other serial devices.
+        """
+        
+        available = [(port_info[0], port_fingerprint(port_info)) 
+                     for port_info in list_ports.comports()]
+        cxn = None
+        
+        known = [device for device, device_print in available 
+                 if fingerprint is not None and device_print == fingerprint]
+        
+        if known:
+            self._logger.log("Arduino board fingerprint %s found at port %s" 
+                             %(fingerprint, known[0]))
+            cxn = self._probe_ports(known[:1])
+        
+        #If the fingerprinted port fails, search the stored port and all the 
+        #available ports at once
+        if cxn is None:
+            self._logger.log("Searching available ports for the Arduino "
+                             "control unit")
+            
+            candidates = [device for device, device_print in available   #@UnusedVariable
+                          if device not in known[:1]]
+            
+            if port is not None and port != 'None' and port not in candidates:
+                candidates.insert(0, port)
+            
+            cxn = self._probe_ports(candidates)
+                        
+        if cxn is None:
+            self._logger.log("Did not connect to the Arduino Board after " +
+                                                        "searching all ports")
+            raise SerialException("Did not connect to the Arduino Board")
+        
+        self._logger.log("Main Arduino control unit found at port %s" %cxn.port)
+        self._use_connection(cxn)
+        self.port = cxn.port
+        self.fingerprint = dict(available).get(cxn.port)
+        
+        #Remember the board for the next connection
+        if self.port != port or self.fingerprint != fingerprint:
+            utils.update_config_dict("CameraCommunicator", 
+                                     dict(arduino_port = self.port,
+                                          arduino_fingerprint = str(self.fingerprint)))
+        
+        if self.send("h") == 0:
+            self._logger.log("Homing of camera successful")
+        else: 
+            self._logger.log("Homing failed upon connection")
+            raise SerialException("Homing Error, please check machine")
+        
+    def _probe_ports(self, ports):
+        """
+        Helper method that tries the handshake at each of the ports at the same
+        time, each on its own thread.
+        
+        Returns:
+            The open connection of the first port to answer as the Arduino
+            control unit, or None if none of them did. The other probes close
+            their ports when they finish.
+        """
+        
+        results = Queue.Queue()
+        found = threading.Event()
+        
+        for port in ports:
+            probe = threading.Thread(target = self._probe, 
+                                     args = (port, results, found),
+                                     name = "probe %s" %port)
+            probe.daemon = True
+            probe.start()
+            
+        for port in ports:                              #@UnusedVariable
+            cxn = results.get()
+            
+            if cxn is not None:
+                return cxn
+            
+        return None
+    
+    def _probe(self, port, results, found):
+        """
+        Helper method run by a probe thread. Opens a port and puts the 
+        connection in results if it is the Arduino control unit, or None if it
+        is not.
         """
         
         cxn = Serial()
         cxn.baudrate = 115200
-        
-        self._logger.log("Connecting to arduino board at %s" %port)
         cxn.port = port
         
-        #Attempt to connect at the previously stored port.
         try:
             cxn.open()
+            msg = self._handshake(cxn)
         except (SerialException, OSError):
             cxn.close()
-            self._logger.log("Failed connection to stored port %s" %port)
+            self._logger.log("Failed connection to port %s" %port)
+            results.put(None)
+            return
+        
+        self._logger.log("Handshake string received from arduino at %s: %r" 
+                         %(port, msg))
+        
+        with self._probe_lock:
+            if msg == "main" and not found.is_set():
+                found.set()
+                results.put(cxn)
+                return
             
-        if cxn.isOpen():
-            sleep(3)
-            
-            while cxn.inWaiting() > 0:
-                cxn.read()
-            
-            #Send the handshake message
-            cxn.write("connection")
-            sleep(3)
-            msg = cxn.read(cxn.inWaiting()).strip()
-            
-            self._logger.log("Handshake string received from arduino: %r" %msg)
-            
-            if msg == "main":
-                self._logger.log("Main Arduino control unit found at port %s"
-                                  %port)
-                self._connection = cxn
-                
-                if self.send("h") == 0:
-                    self._logger.log("Homing of camera successful")
-                    return
-                else: 
-                    self._logger.log("Homing failed upon connection")
-                    raise SerialException("Homing Error, please check machine")
-                
-            else:
-                self._logger.log("Connection at port %s was not the Arduino" +
-                                 " control unit")
-                cxn.close()
+        self._logger.log("Connection at port %s was not the Arduino control unit" 
+                         %port)
+        cxn.close()
+        results.put(None)
+    
+    def _handshake(self, cxn):
+        """
+        Helper method that sends the handshake message once the board has had
+        time to boot, and returns the reply as soon as it is complete.
+        """
         
-        #If the stored port fails, search available ports, trying the handshake
-        #at each one
-        else:
-            self._logger.log("Searching available ports for the Arduino "
-                             "control unit")
-            cxn.close()
+        #Opening the port resets the board
+        sleep(self.boot_delay)
+        cxn.flushInput()
+        
+        #Send the handshake message
+        cxn.write("connection" + self.request_terminator)
+        cxn.timeout = 0.05
+        deadline = time() + self.handshake_timeout
+        msg = ""
+        
+        while time() < deadline and msg.strip() != "main":
+            msg += cxn.read(max(1, cxn.inWaiting()))
             
-            for searched_port in list_ports.comports():
-                cxn.port = searched_port[0]
-                
-                try:
-                    cxn.open()
-                except (SerialException, OSError):
-                    self._logger.log("Failed connection to searched port %s" 
-                                     %searched_port[0])
-            
-                if cxn.isOpen():
-                    sleep(3)
-                    
-                    while cxn.inWaiting() > 0:
-                        cxn.read()
-                        
-                    cxn.write("connection")
-                    sleep(3)
-                    msg = cxn.read(cxn.inWaiting()).strip()
+        return msg.strip()
                     
-                    self._logger.log("Handshake string received from arduino: %r" %msg)
-                    
-                    if msg == "main":
-                        self._logger.log("Main Arduino control unit found at port %s"
-                                         %searched_port[0])
-                        self._connection = cxn
-                        utils.update_config_dict("CameraCommunicator", 
-                                            dict(arduino_port = searched_port[0]))
+def port_fingerprint(port_info):
+    """
+    Returns the fingerprint of a USB serial device, as "vid:pid:serial", from
+    its entry in list_ports.comports(). Returns None for other ports.
+    """
+    
+    match = _hwid_regex.search(port_info[2] or "")
+    
+    if match is None:
+        return None
+    
+    vid, pid, serial_number = match.groups()
+    
+    return "%s:%s:%s" %(vid.lower(), pid.lower(), serial_number or "")
 
-                        if self.send("h") == 0:
-                            self._logger.log("Homing of camera successful")
-                            return
-                        else: 
-                            self._logger.log("Homing failed upon connection")
-                            raise SerialException("Homing Error, please check machine")
-                    
-                    else:
-                        self._logger.log(("Connection at port %s was not the Arduino" +
-                                         " control unit") %searched_port[0])
-                        cxn.close()
-                        
-        if self._connection is None:
-            self._logger.log("Did not connect to the Arduino Board after " +
-                                                        "searching all ports")
-            raise SerialException("Did not connect to the Arduino Board")
-                    
 class Lights(object):
     """
     This represents the state of the lights.
@@ -430,12 +840,32 @@ class Lights(object):
         """
         
         if self._light_states[light_num] == False:
-            result = self._board_comm.send("l i %s" %light_num)
-            
-            if result == 0:
-                self._light_states[light_num] = True
+            result = self._board_comm.send(self.on_command(light_num))
+            self.turned_on(light_num, result)
             
             return result
+    
+    def is_on(self, light_num):
+        """
+        Returns whether a light is known to be on.
+        """
+        
+        return self._light_states[light_num] == True
+    
+    def on_command(self, light_num):
+        """
+        Returns the board command that turns on a light.
+        """
+        
+        return "l i %s" %light_num
+    
+    def turned_on(self, light_num, result):
+        """
+        Updates the light state with the board's result of turning on a light.
+        """
+        
+        if result == 0:
+            self._light_states[light_num] = True
         
     def off(self, light_num):
         """
@@ -465,12 +895,18 @@ class Lights(object):
         """
         
         result = self._board_comm.send("l o")
-        
-        self.list_of_states = [False, False, False, False, False, False,
-                               False, False, False, False, False, False]
+        self.turned_all_off(result)
     
         return result
     
+    def turned_all_off(self, result):
+        """
+        Updates the light states after the board has turned off all the lights.
+        """
+        
+        self._light_states = [False, False, False, False, False, False,
+                              False, False, False, False, False, False]
+    
     def cascade(self):
         """
         Turn off all lights, then blink each light in order.
@@ -482,8 +918,8 @@ class Lights(object):
         result = self._board_comm.send("l c")
         
         self.all_off()
-        self.list_of_states = [False, False, False, False, False, False,
-                               False, False, False, False, False, False]
+        self._light_states = [False, False, False, False, False, False,
+                              False, False, False, False, False, False]
         
         return result
         
@@ -492,8 +928,8 @@ class Lights(object):
         Called on board reconnection. Sets the light states to all False
         """
         
-        self.list_of_states = [False, False, False, False, False, False,
-                               False, False, False, False, False, False]
+        self._light_states = [False, False, False, False, False, False,
+                              False, False, False, False, False, False]
 
 class CameraPosition(object):
     """
@@ -537,9 +973,30 @@ class CameraPosition(object):
                 message from the Arduino board.
         """
         
+        result = self._board_comm.send(self.move_command(coords))
+        self.moved(coords, result)
+        
+        return result 
+    
+    def move_command(self, coords):
+        """
+        Returns the board command that moves the camera to (x, y, z) coords.
+        """
+        
+        x, y, z = coords
+        
+        return "m a %s %s %s" %(str(x), str(y), str(z))
+    
+    def moved(self, coords, result):
+        """
+        Updates the camera position with the board's result of a move.
+        
+        Raises:
+            FatalCameraException: An error has occurred, and detected by an error
+                message from the Arduino board.
+        """
+        
         x, y, z = coords
-            
-        result = self._board_comm.send("m a %s %s %s" %(str(x), str(y), str(z)))
         
         if result == 0:
             self._cur_x = x
@@ -555,8 +1012,6 @@ class CameraPosition(object):
         else:
             #safest is to restart the whole program using an uncaught error
             raise FatalCameraException()
-        
-        return result 
     
     def relative_move(self, coords):
         """
@@ -586,6 +1041,17 @@ class CameraPosition(object):
         """
         
         result = self._board_comm.send("h")
+        self.homed(result)
+        
+        return result
+    
+    def homed(self, result):
+        """
+        Updates the camera position with the board's result of homing.
+        
+        Raises:
+            FatalCameraException: The board could not home the camera.
+        """
         
         if result == 0:
             self._cur_x = 0
@@ -595,8 +1061,6 @@ class CameraPosition(object):
         else:
             raise FatalCameraException()
         
-        return result
-        
     def get_position(self):
         """
         Returns:
@@ -5,9 +5,14 @@ Created on Sep 6, 2013
 '''
 
 from receiver import Receiver
-from camera_communicator import CameraCommunicator
-from production_files import utils
+from camera_communicator import CameraCommunicator, FatalCameraException
+from serial import SerialException
+from production_files import utils, telemetry, image_store
 import os
+import time
+
+#Seconds an image of a sample is reused for other requests of that sample
+default_freshness = 60
 
 class CameraReceiver(Receiver):
     """
@@ -18,22 +23,42 @@ class CameraReceiver(Receiver):
         _photo_dir: The name of the directory where images are stored.
         _camera_comm: The camera_communicator instance that allows this receiver
             to capture images.
+        freshness: The time in seconds an image of a sample is reused for further 
+            requests of that sample, instead of capturing it again.
+        _recent: A dictionary of sample: (capture time, timestamp, filename) of
+            the most recent image of each sample.
     """
     
-    def __init__(self, router, r_id):
+    #The serial link and camera are flaky for a few seconds at a time
+    retry_backoff = 2
+    
+    def __init__(self, router, r_id, freshness = None):
         """
         Creates the camera communicator and ensures the image directory exists.
         
         Args:
             router: A reference to the router that this receiver is associated with.
             r_id: The string that the router refers to this receiver with.
+            freshness: The time in seconds captures are reused for. Read from the
+                capture_freshness entry of the CameraCommunicator configuration if
+                not given.
         """
         
         super(CameraReceiver, self).__init__(router, r_id)
         
+        if freshness is None:
+            freshness = utils.read_config_dict("CameraCommunicator").get(
+                                            'capture_freshness', default_freshness)
+        
+        self.freshness = freshness
+        self._recent = {}
+        
         self._photo_dir = utils.get_image_dir()
         
-        self._camera_comm = CameraCommunicator()
+        #Reuses the board connection and camera of the previous router if they
+        #are still usable
+        self._camera_comm = self.router.sessions.get("camera", CameraCommunicator, 
+                                                     CameraCommunicator.is_healthy)
         
         if not os.path.isdir(self._photo_dir):
             self.router.create_transaction(origin = self.r_id, 
@@ -51,12 +76,30 @@ class CameraReceiver(Receiver):
         Commands:
             get_image: Takes an image and stores it locally, then changes the 
                 destination to an appropiate receiver to return the image to the
-                user that requested it.
+                user that requested it. The command args are [sample, flags], with
+                an optional third entry of (user, flags) requesters from a capture
+                plan, who are all sent the image.
+            get_images: Takes the images for a capture plan, a tuple of 
+                CaptureRequests, in one batch that homes the camera once. A store
+                transaction is queued for each sample, carrying its requesters.
         """
+        
+        try:
+            self._process_command(transaction)
+        except (FatalCameraException, SerialException):
+            #The board and camera may be in any state, so the next router opens
+            #them again rather than reusing them
+            self.router.sessions.release("camera")
+            raise
+        
+    def _process_command(self, transaction):
+        """
+        Helper method that carries out the command of a transaction.
+        """
+        
         if transaction.command == "get_image":
              
-            timestamp, filename = self._camera_comm.get_sample_image(
-                                                  transaction.command_args[0])
+            timestamp, filename = self._capture(transaction.command_args[0])
             
             if(transaction.origin == "gui"):
                 raise NotImplementedError("GUI not yet implemented")
@@ -67,14 +110,93 @@ class CameraReceiver(Receiver):
             transaction.command = "store"
             transaction.command_args = [filename, 
                                         transaction.command_args[0], 
-                                        timestamp]
+                                        timestamp] + transaction.command_args[2:3]
                                                                             
+        elif transaction.command == "get_images":
+            requests = transaction.command_args
+            images = self._capture_many([request.sample for request in requests])
+            
+            for request in requests:
+                timestamp, filename = images[request.sample]
+                
+                self.router.create_transaction(origin = request.requesters[0][0],
+                                               to_id = "flickr",
+                                               command = "store",
+                                               command_args = [filename, 
+                                                               request.sample,
+                                                               timestamp,
+                                                               request.requesters])
+                
+            transaction.process(success = True, finished = True)
+            
         else: 
             transaction.log(info = "Unknown command passed to camera receiver: " + 
                             "%s" % transaction.command)
+    def _capture(self, sample):
+        """
+        Returns the (timestamp, filename) of an image of the sample. An image 
+        captured within the last freshness seconds is reused, so concurrent
+        requests for a sample share one capture.
+        """
+        
+        image = self._fresh_image(sample)
+        
+        if image is not None:
+            return image
+        
+        timestamp, filename = self._camera_comm.get_sample_image(sample)
+        self._recent[sample] = (time.time(), timestamp, filename)
+        
+        return timestamp, filename
+    
+    def _capture_many(self, samples):
+        """
+        Returns a dictionary of sample: (timestamp, filename) with an image of
+        every sample. Fresh images are reused, and the rest are taken in one
+        batch.
+        """
+        
+        images = {}
+        stale = []
+        
+        for sample in samples:
+            image = self._fresh_image(sample)
+            
+            if image is None:
+                stale.append(sample)
+            else:
+                images[sample] = image
+        
+        if stale:
+            for sample, timestamp, filename in self._camera_comm.get_sample_images(stale):
+                self._recent[sample] = (time.time(), timestamp, filename)
+                images[sample] = (timestamp, filename)
+                
+        return images
+    
+    def _fresh_image(self, sample):
+        """
+        Returns the (timestamp, filename) of the image of the sample captured in
+        the last freshness seconds, or None if there is none.
+        """
+        
+        try:
+            captured, timestamp, filename = self._recent[sample]
+        except KeyError:
+            return None
+        
+        #the image may still be being written, but must not have been evicted
+        if (time.time() - captured < self.freshness and 
+                image_store.get_store().contains(filename)):
+            telemetry.record("capture_reused", receiver = self.r_id, 
+                             sample = sample)
+            return timestamp, filename
+        
+        return None
+    
     def cleanup(self):
         """
         Ensure local resources are freed.
         """
-        self._camera_comm.cleanup()
+        self.router.sessions.release("camera")
         del self._camera_comm
\ No newline at end of file
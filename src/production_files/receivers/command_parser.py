@@ -0,0 +1,67 @@
+'''
+The tokenizer for the command strings in tweets, in the form
+cmd(num1, num2, ..) -arg1 -arg2 ..
+
+The pattern is compiled once, on import, and a single pass over a tweet pulls
+out every command string with its command word, sample numbers and flags.
+'''
+
+from collections import namedtuple
+import re
+
+#The command word, the sample list between the brackets, and the flags
+_command_regex = re.compile(r'([a-z]+)\(\s*(\d*(?:\s*,\s*\d*)*)\s*\)((?:\s+-[a-z])*)')
+
+class ParsedCommand(namedtuple('ParsedCommand', 'command samples flags text')):
+    """
+    A single command string taken from a tweet.
+    
+    Attributes:
+        command: The command word, eg. "sample".
+        samples: A tuple of the sample numbers, in the order given.
+        flags: A tuple of the single letter flags, without their dashes.
+        text: The command string as it appeared in the tweet, lower cased.
+    """
+    
+    __slots__ = ()
+    
+    def __str__(self):
+        return self.text
+
+def parse(content):
+    """
+    Finds every command string in a tweet or other request.
+    
+    Args:
+        content: The text of the tweet. Case is ignored.
+        
+    Returns:
+        A tuple of ParsedCommands, in the order they appear in the content.
+    """
+    
+    return tuple(_parsed_command(match) 
+                 for match in _command_regex.finditer(content.lower()))
+
+def parse_batch(tweets):
+    """
+    Parses every tweet from a poll of Twitter.
+    
+    Args:
+        tweets: An iterable of (content, user) tuples, as returned by 
+            TwitterCommunicator.retrieve_tweets.
+            
+    Returns:
+        A list of (content, user, commands) tuples in the same order, where
+        commands is the tuple of ParsedCommands found in the content.
+    """
+    
+    return [(content, user, parse(content)) for content, user in tweets]
+
+def _parsed_command(match):
+    
+    command, samples, flags = match.groups()
+    
+    return ParsedCommand(command, 
+                         tuple(int(s) for s in samples.split(',') if s.strip()),
+                         tuple(flag[1:] for flag in flags.split()),
+                         match.group(0))
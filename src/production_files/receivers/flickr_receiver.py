@@ -5,19 +5,42 @@ Created on Sep 6, 2013
 '''
 
 from receiver import Receiver
+import image_writer
+from upload_pool import UploadPool, UploadJob
 from flickrapi import FlickrAPI
 from flickrapi import shorturl
-from production_files import utils
+from production_files import utils, image_store
+from collections import OrderedDict
 import os
+import threading
+
+#The number of uploaded filenames whose links are remembered
+link_cache_size = 64
+
+#The upload pool settings, overridden by the FlickrCommunicator configuration
+default_dict = {'upload_workers' : 3,
+                'upload_queue' : 16,
+                'upload_attempts' : 6,
+                'upload_backoff' : 2,
+                'upload_backoff_max' : 600}
+
+#The file the unfinished uploads are kept in, in the resource directory
+retry_file_name = "upload_queue.json"
 
 class FlickrReceiver(Receiver):
     """
     The reciever that deals with storing images online. Uses the flickr API to 
-    store images in a Flickr account.
+    store images in a Flickr account. Images are uploaded in the background by
+    an UploadPool, which outlives the receiver like the FlickrCommunicator.
     
     Attributes:
         _photo_dir: The name of the local directory that images are stored.
         flickr: The FlickrCommunicator that interfaces with the Flickr API.
+        _uploads: The UploadPool that uploads the images.
+        _links: The links of the most recently uploaded files, by filename, so an
+            image shared by several requesters is only uploaded once.
+        _links_lock: Held while _links is used, as uploads finish on the pool's
+            threads.
     """
     
     def __init__(self, router, r_id,
@@ -34,7 +57,19 @@ class FlickrReceiver(Receiver):
         
         self._photo_dir = utils.get_image_dir()
         
-        self.flickr = FlickrCommunicator()
+        #Only authenticated if a previous router has not already done so
+        self.flickr = self.router.sessions.get("flickr", FlickrCommunicator)
+        
+        self._links = OrderedDict()
+        self._links_lock = threading.Lock()
+        
+        #Uploads still running for a previous router are finished for this one
+        self._uploads = self.router.sessions.get("flickr_uploads", 
+                                                 self._create_upload_pool)
+        self._uploads.bind(self._uploaded, self._upload_failed)
+        
+        #the images waiting to be uploaded are not evicted
+        image_store.get_store().uploading = self._uploads.contains
                                                 
         if not os.path.isdir(self._photo_dir):
             self.router.create_transaction(origin = self.r_id, 
@@ -53,31 +88,148 @@ class FlickrReceiver(Receiver):
             store: Saves the image to the associated Flickr account. Then passes
                 the link to the newly uploaded image to the the GUI or Twitter 
                 (depending on where the request for the image came from) with a
-                new 'post' command.
+                new 'post' command. If the command args carry the (user, flags)
+                requesters of a capture plan, every requester other than the 
+                origin is sent their own reply. An image that has not been 
+                uploaded before is handed to the upload pool, and the posts are
+                created once its upload is done.
         """
         
         if transaction.command == "store":
-            link = self.flickr.upload_photo(transaction.command_args[0], 
-                                       transaction.command_args[1],
-                                       transaction.command_args[2])
+            filename, sample, timestamp = transaction.command_args[:3]
+            requesters = tuple(transaction.command_args[3:4] and 
+                               transaction.command_args[3])
+            
+            link = self._known_link(filename)
+            
+            if link is None:
+                self._uploads.submit(UploadJob(filename, sample, timestamp, 
+                                               transaction.origin, requesters))
+                transaction.process(success = True, finished = True)
+                return
             
             transaction.process(success = True, finished = False)
-                                       
-            if transaction.origin == "gui":                 
-                transaction.to_id = transaction.origin
-            else:
-                transaction.to_id = "twitter"
-                
+            
+            targets = self._reply_targets(transaction.origin, requesters)
+            transaction.to_id = targets[0][1]
             transaction.command = "post"
             transaction.command_args = link
+            
+            for user, to_id in targets[1:]:
+                self.router.create_transaction(origin = user, 
+                                               to_id = to_id, 
+                                               command = "post", 
+                                               command_args = link)
                         
         else: 
             transaction.log(info = "Unknown command passed to flickr receiver: %s"
                                     % transaction.command)
-                                    
+    
+    def drain(self):
+        """
+        The uploads are done on the pool's threads, so this only returns how
+        many are unfinished, including those not yet reported to the router.
+        """
+        
+        return self._uploads.pending()
+    
     def cleanup(self):
+        self.router.sessions.release("flickr_uploads")
+        self.router.sessions.release("flickr")
         del self.flickr
     
+    def _create_upload_pool(self):
+        """
+        Helper method that creates the upload pool from the FlickrCommunicator
+        configuration. The pool uploads through the flickr session, after
+        waiting for the camera to finish writing the image.
+        """
+        
+        config_dict = dict(default_dict)
+        config_dict.update(utils.read_config_dict("FlickrCommunicator"))
+        flickr = self.flickr
+        
+        def upload(filename, sample, timestamp):
+            
+            return flickr.upload_photo(image_writer.wait_for(filename), sample, 
+                                       timestamp)
+        
+        return UploadPool(upload, 
+                          workers = config_dict['upload_workers'],
+                          max_queued = config_dict['upload_queue'],
+                          max_attempts = config_dict['upload_attempts'],
+                          backoff = config_dict['upload_backoff'],
+                          max_backoff = config_dict['upload_backoff_max'],
+                          retry_file = utils.get_resource_files_prefix() + 
+                                       retry_file_name)
+    
+    def _known_link(self, filename):
+        """
+        Returns the link of an image that was already uploaded, or None.
+        """
+        
+        with self._links_lock:
+            link = self._links.get(filename)
+        
+        #uploaded before this receiver was created
+        if link is None:
+            link = image_store.get_store().link(filename)
+            
+        return link
+    
+    def _reply_targets(self, origin, requesters):
+        """
+        Returns the (user, receiver id) of every user to send an image's link
+        to, the origin first.
+        """
+        
+        if origin == "gui":
+            targets = [(origin, origin)]
+        else:
+            targets = [(origin, "twitter")]
+        
+        for user, flags in requesters:                          #@UnusedVariable
+            if user not in [target[0] for target in targets]:
+                targets.append((user, "twitter"))
+                
+        return targets
+    
+    def _uploaded(self, job, link):
+        """
+        Called by the upload pool once an image is uploaded. Remembers its link,
+        and queues a post of the link to everyone who asked for the image. If
+        the router is closed this raises a RouterClosedError, and the pool 
+        reports the upload again to the receiver of the next router.
+        """
+        
+        with self._links_lock:
+            self._links[job.filename] = link
+            
+            if len(self._links) > link_cache_size:
+                self._links.popitem(last = False)
+                
+        image_store.get_store().set_link(job.filename, link)
+        
+        for user, to_id in self._reply_targets(job.origin, job.requesters):
+            self.router.create_transaction(origin = user, 
+                                           to_id = to_id, 
+                                           command = "post", 
+                                           command_args = link)
+    
+    def _upload_failed(self, job, error):
+        """
+        Called by the upload pool when an image could not be uploaded after all
+        its attempts.
+        """
+        
+        self.router.create_transaction(origin = self.r_id, 
+                                       to_id = "filemanager", 
+                                       command = "log", 
+                                       command_args = "Upload of %s failed after "
+                                                      "%d attempts: %s" 
+                                                      %(job.filename, job.attempts,
+                                                        error))
+    
 class FlickrCommunicator(object):
     """
     The interface to the Flickr API. 
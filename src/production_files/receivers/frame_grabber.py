@@ -0,0 +1,231 @@
+'''
+Keeps a camera stream warm by reading frames on a background thread, so a
+capture does not have to start the stream and throw away a fixed number of
+frames while the exposure settles. The latest frames are kept in a small ring
+of buffers that are reused by every read.
+
+The camera driver keeps filling its buffers while the stream is idle, so the
+first frames read for a capture may have been taken before the camera moved
+or the light changed. Those are read and discarded before any frame is 
+judged. Exposure is then judged to have settled by the brightness of the 
+frames: once the mean brightness of consecutive frames changes by less than
+the tolerance, the latest frame is stable and is returned straight away. The
+number of frames discarded before it is kept for every capture.
+'''
+
+import threading
+import time
+
+#The brightness of every step-th pixel in each direction is averaged
+brightness_step = 8
+
+def brightness(frame):
+    """
+    Returns the mean brightness of a frame, from a sample of its pixels.
+    """
+    
+    return float(frame[::brightness_step, ::brightness_step].mean())
+
+class CaptureFailedException(Exception):
+    """
+    The camera stopped returning frames.
+    """
+    pass
+
+class FrameGrabber(object):
+    """
+    Reads frames from a VideoCapture on its own thread while streaming.
+    
+    Attributes:
+        tolerance: The largest change in brightness, as a fraction of the
+            previous frame's, between frames that are stable.
+        settle_frames: The number of stable frame-to-frame changes needed before
+            a frame is returned.
+        flush_frames: The number of frames read and discarded at the start of
+            every capture, as the driver may have taken them before it.
+        max_frames: The most frames read for one capture. The latest is used
+            even if the brightness is still changing.
+        max_failures: The number of failed reads in a row after which a
+            capture fails.
+        discarded: The number of frames discarded by the last capture.
+        _ring: The frame buffers, reused in turn by the reads.
+        _latest: The index in the ring of the latest frame, None before the
+            first frame of a capture that is not flushed.
+        _generation: Increased by every capture, so a frame read before it
+            started is not counted.
+        _result: A copy of the frame to return for the capture, taken by the
+            reading thread as soon as there is one.
+    """
+    
+    def __init__(self, capture, ring_size = 3, tolerance = 0.02, settle_frames = 1,
+                 max_frames = 30, max_failures = 5, flush_frames = 4):
+        """
+        Args:
+            capture: An open VideoCapture.
+            ring_size: The number of frame buffers, at least 2 so the latest
+                frame is never being overwritten while it is copied.
+            flush_frames: The number of buffers of the camera driver. V4L2 
+                drivers use 4 by default.
+        """
+        
+        self.tolerance = tolerance
+        self.settle_frames = settle_frames
+        self.flush_frames = flush_frames
+        self.max_frames = max_frames
+        self.max_failures = max_failures
+        self.discarded = 0
+        
+        self._capture = capture
+        self._ring = [None] * max(2, ring_size)
+        self._latest = None
+        self._generation = 0
+        self._frames = 0
+        self._flushed = 0
+        self._stable = 0
+        self._failures = 0
+        self._brightness = None
+        self._result = None
+        
+        self._condition = threading.Condition()
+        self._streaming = False
+        self._running = True
+        self._thread = threading.Thread(target = self._grab_loop,
+                                        name = "frame grabber")
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def capture(self, timeout = 10):
+        """
+        Starts counting frames from now, and waits for a stable frame. Starts
+        streaming if the stream is idle. Call it once the camera has moved and
+        the light has changed: the first flush_frames frames read after it is
+        called are never returned.
+        
+        Returns:
+            A copy of the first stable frame.
+        
+        Raises:
+            CaptureFailedException: The camera failed to return frames, or no
+                frame arrived within the timeout.
+        """
+        
+        deadline = time.time() + timeout
+        
+        with self._condition:
+            self._generation += 1
+            self._latest = None
+            self._frames = 0
+            self._flushed = 0
+            self._stable = 0
+            self._failures = 0
+            self._brightness = None
+            self._result = None
+            self._streaming = True
+            self._condition.notify_all()
+            
+            while self._result is None and self._failures < self.max_failures:
+                remaining = deadline - time.time()
+                
+                if remaining <= 0:
+                    break
+                
+                self._condition.wait(remaining)
+            
+            if self._result is not None:
+                return self._result
+            
+            #the timeout passed before the exposure settled
+            if self._latest is not None:
+                self.discarded = self._flushed + self._frames - 1
+                return self._ring[self._latest].copy()
+            
+            raise CaptureFailedException("No frame from the camera after %d "
+                                         "failed reads" %self._failures)
+    
+    def idle(self):
+        """
+        Stops reading frames until the next capture.
+        """
+        
+        with self._condition:
+            self._streaming = False
+    
+    def stop(self):
+        """
+        Stops the reading thread for good, so the capture can be released.
+        """
+        
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+    
+    def _grab_loop(self):
+        
+        while True:
+            with self._condition:
+                while self._running and not self._streaming:
+                    self._condition.wait()
+                
+                if not self._running:
+                    return
+                
+                generation = self._generation
+                
+                #never the slot of the latest frame, which may be being copied
+                if self._latest is None:
+                    slot = 0
+                else:
+                    slot = (self._latest + 1) % len(self._ring)
+                
+                target = self._ring[slot]
+            
+            if target is None:
+                success, frame = self._capture.read()
+            else:
+                success, frame = self._capture.read(target)
+            
+            level = brightness(frame) if success else None
+            
+            with self._condition:
+                #a capture started while this frame was being read
+                if generation != self._generation:
+                    continue
+                
+                if not success:
+                    self._failures += 1
+                    
+                    if self._failures >= self.max_failures:
+                        self._streaming = False
+                
+                #may have been taken before the capture, so is never judged
+                elif self._flushed < self.flush_frames:
+                    self._ring[slot] = frame
+                    self._flushed += 1
+                    self._failures = 0
+                
+                else:
+                    self._ring[slot] = frame
+                    self._latest = slot
+                    self._frames += 1
+                    self._failures = 0
+                    
+                    previous = self._brightness
+                    
+                    if (previous is not None and
+                            abs(level - previous) <= self.tolerance * max(previous, 1.0)):
+                        self._stable += 1
+                    else:
+                        self._stable = 0
+                    
+                    self._brightness = level
+                    
+                    #the first settled frame is the one returned
+                    if self._result is None and (self._stable >= self.settle_frames or
+                                                 self._frames >= self.max_frames):
+                        self._result = frame.copy()
+                        self.discarded = self._flushed + self._frames - 1
+                
+                self._condition.notify_all()
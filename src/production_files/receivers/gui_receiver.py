@@ -5,6 +5,7 @@ Created on Sep 6, 2013
 '''
 
 from receiver import Receiver
+import time
 
 class GuiReceiver(Receiver):
     """
@@ -18,16 +19,19 @@ class GuiReceiver(Receiver):
             method that allows pulling of a list of requests for images or information.
     """
     
-    def __init__(self, router, r_id, gui):
+    def __init__(self, router, r_id, gui, poll_interval = 1):
         """
         Args:
             router: A reference to the router that this receiver is associated with.
             r_id: The string that the router refers to this receiver with.
             gui: The gui this receiver is communicating with.
+            poll_interval: The time in seconds between polls of the gui for requests.
         """
         super(GuiReceiver, self).__init__(router, r_id)
         
         self.gui = gui
+        self.poll_interval = poll_interval
+        self._poll_time = 0
     
     def process_transaction(self, transaction):
         """
@@ -43,6 +47,7 @@ class GuiReceiver(Receiver):
         """
         
         if transaction.command == "update":
+            self._poll_time = time.time()
             requests = self.gui.retrieve_requests()
             
             while len(requests) > 0:
@@ -61,3 +66,10 @@ class GuiReceiver(Receiver):
         else:
             transaction.log(info = "Unknown command passed to gui receiver: %s"
                                     % transaction.command)
+    
+    def next_work_time(self):
+        """
+        The gui is polled for new requests every poll_interval.
+        """
+        
+        return self._poll_time + self.poll_interval
\ No newline at end of file
@@ -0,0 +1,264 @@
+'''
+Encodes and writes captured images on worker threads, so the camera can move
+on to its next capture while the last one is still being written. A capture
+hands its frame to an ImageWriter and gets the filename straight away. The
+stages that read the file, like the upload to Flickr, wait for it first:
+
+    image_writer.wait_for(filename)
+
+which returns at once for a file that is not being written.
+
+The queue of frames waiting to be written is bounded, so a camera that
+captures faster than the frames can be written waits instead of holding an
+unbounded number of frames in memory.
+'''
+
+from production_files import telemetry
+from collections import deque
+import cv2 #@UnresolvedImport
+import Queue
+import threading
+import time
+
+#The image formats, by file extension, and the cv2 flags of their settings
+formats = {'jpg' : (('jpeg_quality', 'IMWRITE_JPEG_QUALITY'),
+                    ('jpeg_progressive', 'IMWRITE_JPEG_PROGRESSIVE')),
+           'png' : (('png_compression', 'IMWRITE_PNG_COMPRESSION'),),
+           'webp' : (('webp_quality', 'IMWRITE_WEBP_QUALITY'),)}
+
+default_settings = {'image_format' : 'jpg',
+                    'jpeg_quality' : 95,
+                    'jpeg_progressive' : 0,
+                    'png_compression' : 3,
+                    'webp_quality' : 95,
+                    'encode_workers' : 2,
+                    'encode_queue' : 4}
+
+#The number of images that could not be written that are remembered, so the
+#stages waiting for them see the error
+failed_kept = 64
+
+#The images queued or being written, by filename, from every writer, and the
+#last failed_kept that could not be written
+_pending = {}
+_failed = deque()
+_pending_lock = threading.Lock()
+
+class ImageWriteError(IOError):
+    """
+    An image could not be encoded or written.
+    """
+    pass
+
+class PendingImage(object):
+    """
+    An image handed to an ImageWriter, that may not be written yet.
+    
+    Attributes:
+        filename: The file the image is written to.
+        error: The exception raised writing the image, None if it succeeded or
+            has not been written yet.
+    """
+    
+    def __init__(self, filename):
+        
+        self.filename = filename
+        self.error = None
+        self._done = threading.Event()
+    
+    def done(self):
+        
+        return self._done.is_set()
+    
+    def result(self, timeout = None):
+        """
+        Waits for the image to be written.
+        
+        Returns:
+            The filename.
+        
+        Raises:
+            ImageWriteError: The image could not be written, or was not written
+                within the timeout.
+        """
+        
+        if not self._done.wait(timeout):
+            raise ImageWriteError("%s was not written after %s s"
+                                  %(self.filename, timeout))
+        
+        if self.error is not None:
+            raise ImageWriteError("%s could not be written: %s"
+                                  %(self.filename, self.error))
+        
+        return self.filename
+    
+    def _set(self, error = None):
+        
+        self.error = error
+        self._done.set()
+
+class ImageWriter(object):
+    """
+    A pool of worker threads that encode and write images.
+    
+    Attributes:
+        extension: The file extension of the image format, eg. "jpg".
+        params: The cv2.imwrite parameters of the image format.
+        _queue: The bounded queue of (PendingImage, frame, written callback) 
+            waiting to be written.
+        _workers: The worker threads.
+    """
+    
+    def __init__(self, settings = None):
+        """
+        Args:
+            settings: A configuration dictionary with any of the keys of
+                default_settings. The defaults are used for the rest.
+        """
+        
+        config = dict(default_settings)
+        config.update(settings or {})
+        
+        self.extension = config['image_format'].lower()
+        self.params = encode_params(self.extension, config)
+        
+        self._queue = Queue.Queue(max(1, config['encode_queue']))
+        self._workers = []
+        
+        for i in xrange(max(1, config['encode_workers'])):
+            worker = threading.Thread(target = self._write_loop,
+                                      name = "image writer %d" %i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+    
+    def submit(self, filename, frame, written = None):
+        """
+        Queues a frame to be written, waiting for room in the queue if it is full.
+        
+        Args:
+            filename: The file to write, ending in the writer's extension.
+            frame: The image, which must not be changed after it is submitted.
+            written: Called with the filename on a worker thread once the image 
+                has been written successfully. An exception it raises is 
+                recorded, but does not fail the image.
+        
+        Returns:
+            The PendingImage of the file.
+        """
+        
+        pending = PendingImage(filename)
+        
+        with _pending_lock:
+            _pending[filename] = pending
+        
+        self._queue.put((pending, frame, written))
+        
+        return pending
+    
+    def close(self):
+        """
+        Writes the images still queued, then stops the workers.
+        """
+        
+        for worker in self._workers:                    #@UnusedVariable
+            self._queue.put(None)
+        
+        for worker in self._workers:
+            worker.join()
+        
+        self._workers = []
+    
+    def _write_loop(self):
+        
+        while True:
+            item = self._queue.get()
+            
+            if item is None:
+                return
+            
+            pending, frame, written = item
+            start = time.time()
+            
+            try:
+                if not cv2.imwrite(pending.filename, frame, self.params):
+                    raise ImageWriteError("cv2 could not encode the image")
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            
+            telemetry.record("image_write", receiver = "camera",
+                             format = self.extension,
+                             result = 0 if error is None else 1,
+                             duration_ms = (time.time() - start) * 1000)
+            
+            #the image is written even if the callback fails
+            if error is None and written is not None:
+                try:
+                    written(pending.filename)
+                except Exception as e:
+                    telemetry.record("image_written_callback", receiver = "camera",
+                                     result = 1, error = str(e))
+            
+            pending._set(error)
+            self._finish(pending)
+    
+    def _finish(self, pending):
+        """
+        Helper method that stops tracking a written image. A failed image is
+        kept, so a stage waiting for it sees the error, until failed_kept 
+        images have failed after it.
+        """
+        
+        with _pending_lock:
+            if pending.error is not None:
+                _failed.append(pending)
+                
+                if len(_failed) <= failed_kept:
+                    return
+                
+                pending = _failed.popleft()
+            
+            if _pending.get(pending.filename) is pending:
+                del _pending[pending.filename]
+
+def encode_params(extension, config):
+    """
+    Returns the cv2.imwrite parameters for an image format from a configuration
+    dictionary. Settings not supported by the installed cv2 are left out.
+    
+    Raises:
+        ValueError: The image format is not one of formats.
+    """
+    
+    if extension not in formats:
+        raise ValueError("Unknown image format %s" %extension)
+    
+    params = []
+    
+    for key, flag_name in formats[extension]:
+        flag = getattr(cv2, flag_name, None)
+        
+        if flag is not None:
+            params.extend([flag, int(config.get(key, default_settings[key]))])
+    
+    return params
+
+def wait_for(filename, timeout = None):
+    """
+    Waits for an image being written by any ImageWriter. Returns at once if it
+    is not being written.
+    
+    Raises:
+        ImageWriteError: The image could not be written, or was not written
+            within the timeout.
+    """
+    
+    with _pending_lock:
+        pending = _pending.get(filename)
+    
+    if pending is not None:
+        pending.result(timeout)
+    
+    return filename
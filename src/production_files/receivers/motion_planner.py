@@ -0,0 +1,107 @@
+'''
+Plans the order the camera visits samples in when several are captured
+together, to cut the distance the stage travels. A route starts and ends at
+home, (0, 0, 0), since the camera is homed after a batch of captures.
+
+Strategies:
+    given: Visit the samples in the order they were asked for.
+    nearest: Always move to the closest sample not yet visited.
+    two_opt: Start from the nearest route, then reverse any stretch of the
+        route that makes it shorter, until no reversal helps.
+'''
+
+import math
+
+home = (0, 0, 0)
+
+strategies = ("given", "nearest", "two_opt")
+
+def distance(a, b):
+    """
+    The straight line distance between two (x, y, z) positions.
+    """
+    
+    return math.sqrt(sum((i - j) ** 2 for i, j in zip(a, b)))
+
+def route_length(positions, start = home):
+    """
+    The distance travelled from start, through every position in order, and
+    back to start.
+    """
+    
+    total = 0
+    current = start
+    
+    for position in positions:
+        total += distance(current, position)
+        current = position
+        
+    return total + distance(current, start)
+
+def plan_route(positions, strategy = "nearest", start = home):
+    """
+    Orders the keys of a dictionary of key: (x, y, z) positions into a route.
+    
+    Args:
+        positions: A dictionary of the positions to visit, eg. by sample number.
+        strategy: One of the strategies listed in this module.
+        start: The position the route starts and ends at.
+        
+    Returns:
+        A tuple of the list of keys in the order to visit them, and the length
+        of the route.
+        
+    Raises:
+        ValueError: The strategy is unknown.
+    """
+    
+    if strategy == "given":
+        order = list(positions)
+    elif strategy == "nearest":
+        order = _nearest_neighbour(positions, start)
+    elif strategy == "two_opt":
+        order = _two_opt(_nearest_neighbour(positions, start), positions, start)
+    else:
+        raise ValueError("Unknown route strategy: %s" %strategy)
+    
+    return order, route_length([positions[key] for key in order], start)
+
+def _nearest_neighbour(positions, start):
+    
+    remaining = list(positions)
+    order = []
+    current = start
+    
+    while remaining:
+        closest = min(remaining, key = lambda key: distance(current, positions[key]))
+        remaining.remove(closest)
+        order.append(closest)
+        current = positions[closest]
+        
+    return order
+
+def _two_opt(order, positions, start):
+    
+    #the route as points, with start at both ends
+    route = [start] + [positions[key] for key in order] + [start]
+    keys = [None] + list(order) + [None]
+    improved = True
+    
+    while improved:
+        improved = False
+        
+        for i in xrange(1, len(route) - 2):
+            for j in xrange(i + 1, len(route) - 1):
+                #reversing route[i..j] swaps edges (i-1, i), (j, j+1) for
+                #(i-1, j), (i, j+1)
+                change = (distance(route[i - 1], route[j]) + 
+                          distance(route[i], route[j + 1]) -
+                          distance(route[i - 1], route[i]) - 
+                          distance(route[j], route[j + 1]))
+                
+                if change < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    keys[i:j + 1] = reversed(keys[i:j + 1])
+                    improved = True
+                    
+    return keys[1:-1]
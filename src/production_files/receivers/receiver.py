@@ -1,3 +1,5 @@
+import random
+
 class Receiver(object):
     """
     This is a baseclass that is not meant to be instantiated.
@@ -10,8 +12,15 @@ class Receiver(object):
         router: A reference to the router object that sends transactions and takes 
                 transaction requests.
         r_id: The id that the router uses to route transactions to a receiver
+        retry_backoff: The seconds the router waits before retrying a transaction
+                this receiver failed to process for the first time. Each retry
+                after that waits twice as long as the one before.
+        retry_backoff_max: The longest the router waits before a retry.
     """
     
+    retry_backoff = 1
+    retry_backoff_max = 60
+    
     def __init__(self, router, r_id):
         """
         Initializes every receiver object to give them an id and a reference to the
@@ -41,7 +50,7 @@ class Receiver(object):
             else:
                 return False
         else:
-            if i in self.r_id:
+            if self.r_id in i:
                 return True
             else:
                 return False
@@ -56,6 +65,47 @@ class Receiver(object):
         """
         raise NotImplementedError() 
     
+    def next_work_time(self):
+        """
+        The method the router calls while idle to find out when this receiver next
+        has work to do, so the router can sleep until then instead of polling.
+        
+        Returns:
+            The time in seconds since the epoch that this receiver next has work, or
+            None if it only reacts to transactions.
+        """
+        return None
+    
+    def retry_delay(self, attempts):
+        """
+        The method the router calls when this receiver failed to process a
+        transaction, to find out how long to wait before trying it again. The
+        delay backs off exponentially, with jitter so transactions that failed
+        together are not all retried together.
+        
+        Args:
+            attempts: The number of failed attempts the transaction has had.
+            
+        Returns:
+            The delay in seconds.
+        """
+        delay = min(self.retry_backoff_max, 
+                    self.retry_backoff * 2 ** max(0, attempts - 1))
+        
+        return delay * random.uniform(0.5, 1.0)
+    
+    def drain(self):
+        """
+        The method the router calls while it drains before a restart, to have this
+        receiver do the work it holds outside the router's queue, without taking
+        new requests. Called again until it returns 0, or the drain times out.
+        
+        Returns:
+            The number of pieces of work this receiver still holds, eg. uploads 
+            in progress or posts waiting for a rate limit.
+        """
+        return 0
+    
     def cleanup(self):
         """
         The method that the router when something goes wrong, used to free local resources
@@ -0,0 +1,227 @@
+'''
+The request/response engine for the serial link with the Arduino board.
+
+A dedicated reader thread collects everything the board sends, and every
+response is handed to its request as soon as its line terminator arrives.
+This replaces busy-waiting for the first byte and then sleeping a fixed time
+for the rest of the message. The board answers commands in the order it
+receives them, so each request gets a sequence number and responses are
+matched to requests first in, first out. Every request has its own timeout.
+Firmware that does not end its responses with a terminator is handled too: a
+response is also complete once the line has been quiet for one poll_timeout.
+'''
+
+from collections import deque
+from serial import SerialException, SerialTimeoutException
+import threading
+import time
+
+#Seconds to wait for the board to answer, by the first letter of the command.
+#Moves and homing wait for the carriage to stop.
+command_timeouts = {'h' : 60,
+                    'm' : 60,
+                    'l' : 5}
+
+default_timeout = 10
+
+class PendingResponse(object):
+    """
+    The response to a request that may not have arrived yet.
+    
+    Attributes:
+        seq: The sequence number of the request.
+        message: The message that was sent.
+        timeout: The seconds to wait for the response after sending.
+        sent_at: The time in seconds the message was written.
+    """
+    
+    def __init__(self, seq, message, timeout):
+        
+        self.seq = seq
+        self.message = message
+        self.timeout = timeout
+        self.sent_at = None
+        self.expired = False
+        self._done = threading.Event()
+        self._response = None
+        self._error = None
+        
+    def result(self):
+        """
+        Waits for the response and returns it, stripped of whitespace.
+        
+        Raises:
+            SerialTimeoutException: No response arrived within the timeout.
+            SerialException: The connection closed before a response arrived.
+        """
+        
+        if not self._done.wait(self.timeout):
+            #a late response is still matched to, and dropped with, this request
+            self.expired = True
+            raise SerialTimeoutException("No response from arduino to '%s' "
+                                         "after %s s" %(self.message, self.timeout))
+        
+        if self._error is not None:
+            raise self._error
+        
+        return self._response
+    
+    def done(self):
+        
+        return self._done.is_set()
+    
+    def _set(self, response = None, error = None):
+        
+        self._response = response
+        self._error = error
+        self._done.set()
+
+class SerialProtocolEngine(object):
+    """
+    Sends line-framed requests over an open serial connection and matches the
+    responses to them from a reader thread.
+    
+    Attributes:
+        terminator: The string that ends every response from the board.
+        request_terminator: The string appended to every request. The board
+            firmware reads bare commands, so this is empty by default.
+    """
+    
+    def __init__(self, connection, terminator = "\n", request_terminator = "",
+                 poll_timeout = 0.05):
+        """
+        Args:
+            connection: An open Serial connection. Its read timeout is set to
+                poll_timeout so the reader thread can notice when to stop.
+        """
+        
+        self.terminator = terminator
+        self.request_terminator = request_terminator
+        
+        self._connection = connection
+        self._connection.timeout = poll_timeout
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+        self._seq = 0
+        self._buffer = ""
+        self._running = False
+        self._reader = None
+        
+    def start(self):
+        """
+        Discards anything waiting from the board, then starts the reader thread.
+        """
+        
+        self._connection.flushInput()
+        self._running = True
+        self._reader = threading.Thread(target = self._read_loop, 
+                                        name = "arduino reader")
+        self._reader.daemon = True
+        self._reader.start()
+        
+    def stop(self):
+        """
+        Stops the reader thread. Requests still waiting fail with a
+        SerialException.
+        """
+        
+        self._running = False
+        
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join()
+            
+        self._fail_pending(SerialException("Connection to arduino board closed"))
+        
+    def is_running(self):
+        """
+        Returns whether the reader thread is still reading from the board.
+        """
+        
+        return self._running and self._reader is not None and self._reader.is_alive()
+        
+    def request(self, message, timeout = None):
+        """
+        Writes a message to the board without waiting for the response.
+        
+        Args:
+            message: The command to send.
+            timeout: The seconds to wait for the response. Looked up in 
+                command_timeouts if not given.
+            
+        Returns:
+            The PendingResponse for the message.
+            
+        Raises:
+            SerialException: The reader thread is not running.
+        """
+        
+        if not self._running:
+            raise SerialException("Connection to arduino board closed")
+        
+        if timeout is None:
+            timeout = command_timeouts.get(message[:1], default_timeout)
+        
+        with self._write_lock:
+            self._seq += 1
+            pending = PendingResponse(self._seq, message, timeout)
+            
+            #queued before writing, so the reader can match even a fast response
+            self._pending.append(pending)
+            pending.sent_at = time.time()
+            self._connection.write(message + self.request_terminator)
+            
+        return pending
+    
+    def send(self, message, timeout = None):
+        """
+        Writes a message and waits for its response.
+        
+        Returns:
+            The response, stripped of whitespace.
+        """
+        
+        return self.request(message, timeout).result()
+    
+    def _read_loop(self):
+        
+        try:
+            while self._running:
+                data = self._connection.read(max(1, self._connection.inWaiting()))
+                
+                if data:
+                    self._receive(data)
+                elif self._buffer.strip():
+                    #the line went quiet part way through a response
+                    self._receive(self.terminator)
+        except (SerialException, OSError, ValueError) as e:
+            self._running = False
+            self._fail_pending(SerialException("Arduino connection lost: %s" %e))
+    
+    def _receive(self, data):
+        """
+        Splits the received data into responses, and hands each to the oldest
+        request still waiting. Responses to requests that already timed out 
+        are dropped, as are responses nobody asked for.
+        """
+        
+        self._buffer += data
+        
+        while self.terminator in self._buffer:
+            line, self._buffer = self._buffer.split(self.terminator, 1)
+            line = line.strip()
+            
+            if not line:
+                continue
+            
+            try:
+                pending = self._pending.popleft()
+            except IndexError:
+                continue
+            
+            if not pending.expired:
+                pending._set(response = line)
+            
+    def _fail_pending(self, error):
+        
+        while self._pending:
+            self._pending.popleft()._set(error = error)
@@ -6,7 +6,8 @@ Created on Sep 6, 2013
 
 from receiver import Receiver
 from production_files import utils
-import re
+from collections import namedtuple, OrderedDict
+import command_parser
 
 class TranslatorReceiver(Receiver):
     """
@@ -61,6 +62,12 @@ class TranslatorReceiver(Receiver):
                    command string.
             translate: Takes a single query, translates it into a command that can be understood by other  and creates the 
                        appropriate transaction.
+            batch: Takes every (content, user) tweet from one poll of Twitter, and
+                   turns them into a capture plan, CaptureRequests carrying everyone
+                   who asked for each distinct sample. The plan is sent to the camera
+                   as one get_images transaction per user who first asked for a 
+                   sample, from that user, so the router's scheduler can share the 
+                   camera fairly between them.
         """
         
         if transaction.command == "parse": 
@@ -82,48 +89,53 @@ class TranslatorReceiver(Receiver):
         elif transaction.command == "translate":
             try:
                 self._translate(transaction)
-            except BadTweetCommandError:
+            except BadTweetCommandError as e:
                 transaction.log("Invalid command string in query '%s'"
-                                %transaction.command_args)
-                self.router.clone_transaction(transaction, to_id = "twitter",
-                                  command = "post",
-                                  command_args = ("'%s' contains no valid " 
-                                  "command. Please tweet help() -c for a "
-                                  "list of commands" 
-                                  %transaction.command_args))
+                                %(transaction.command_args,))
+                self._reply(transaction, self._error_message(e, 
+                                                       transaction.command_args))
             except BadTweetArgError as e:
                 transaction.log("Invalid command arguments in query '%s'"
-                                %transaction.command_args)
-                self.router.clone_transaction(transaction, to_id = "twitter",
-                                  command = "post",
-                                  command_args = ("The %s command does not take" 
-                                                  " %s as an argument. ")
-                                                  %(e.command, e.argument) + 
-                                                  self.help_strings[e.command])
-            except BadTweetSampleError:
+                                %(transaction.command_args,))
+                self._reply(transaction, self._error_message(e, 
+                                                       transaction.command_args))
+            except BadTweetSampleError as e:
                 transaction.log("Invalid sample numbers in query '%s'"
-                                %transaction.command_args)
-                self.router.clone_transaction(transaction, to_id = "twitter",
-                                  command = "post",
-                                  command_args = ("Your tweet contains invalid"
-                                                  " sample numbers. Please use"
-                                                  " sample numbers between 1"
-                                                  " and %d" %self.num_samples))
+                                %(transaction.command_args,))
+                self._reply(transaction, self._error_message(e, 
+                                                       transaction.command_args))
+                
+        elif transaction.command == "batch":
+            num_captures = self._batch(transaction)
+            
+            transaction.process(success = True, finished = True, allow_log = False)
+            transaction.log("%d tweets planned as %d captures" 
+                            %(len(transaction.command_args), num_captures))
+    
+    def _reply(self, transaction, message):
+        """
+        Turns a transaction that could not be translated into a reply to its
+        origin, so it is not translated again.
+        """
+        
+        transaction.to_id = "twitter"
+        transaction.command = "post"
+        transaction.command_args = message
+        transaction.requeue()
     
     def _parse(self, transaction):
         """
         Takes the raw tweet or other command string and breaks it into
-        individual requests. Each individual request is used as the command
-        arg for transactions. The original transaction is modified for the
-        first request found, and then for further requests found, the
-        original transaction is cloned and modified.
+        individual requests. Each individual request, as a ParsedCommand, is
+        used as the command arg for transactions. The original transaction is 
+        modified for the first request found, and then for further requests 
+        found, the original transaction is cloned and modified.
         
         Args:
             transaction: The transaction to be parsed.
         """
         
-        parsing_regex = re.compile('[a-z]+\(\d*(?:\s*,\d*\s*)*\)(?:\s+-[a-z])*')
-        command_strings = re.findall(parsing_regex, transaction.command_args)
+        command_strings = list(command_parser.parse(transaction.command_args))
             
         if not command_strings:
             transaction.log("No command string found in tweet: %s" 
@@ -136,12 +148,12 @@ class TranslatorReceiver(Receiver):
             count = 1
             
             transaction.log("Command string found in tweet: %s" 
-                            %transaction.command_args)
+                            %(transaction.command_args,))
             
             for cmd_string in reversed(command_strings):
                 transaction.log("Command string found in tweet: %s" 
-                            %cmd_string)
-                self._router.clone_transaction(transaction, 
+                            %cmd_string.text)
+                self.router.clone_transaction(transaction, 
                                                command_args = cmd_string)
                 count += 1
             
@@ -150,61 +162,163 @@ class TranslatorReceiver(Receiver):
     def _translate(self, transaction):
         """
         This method takes a single a transaction that has a single parsed
-        command string in the form cmd(num1, num2, ..) -arg1 -arg2..
-        It takes this string apart, and validates the commands, sample numbers,
-        and arguments. If the all parts are valid, it reroutes the transaction 
-        (cloning if more than one sample number is present) to the correct 
-        receiver.
+        command, either as a ParsedCommand or as a string in the form 
+        cmd(num1, num2, ..) -arg1 -arg2..
+        It validates the command, sample numbers, and arguments. If the all 
+        parts are valid, it reroutes the transaction (cloning if more than one 
+        sample number is present) to the correct receiver.
         
         Args:
             transaction: The transaction to be parsed.
         """
         
-        content = transaction.command_args
+        command, samples, args = self._validate(transaction, 
+                                                transaction.command_args)
         
-        parsed_args = re.findall('-[a-z]', content)
-        args = []
-        for arg in parsed_args:
-            args.append(arg.replace("-", ""))
+        #Calls the appropriate, non-public helper method.
+        if command == "sample":
+            self._camera_request(transaction, args, samples)
+        elif command == "test":
+            self._test_request(transaction, args)
+        elif command == "help":
+            self._help_request(transaction, args)
             
-        try:
-            command = re.findall('^[a-z]+', content.lower())[0]
-        except IndexError:
-            raise BadTweetCommandError()
-        samples = [int(s) for s in re.findall('\d+', content)]
+    def _validate(self, transaction, content):
+        """
+        Checks a single parsed command, or command string, against the known
+        commands, their arguments and the sample numbers.
+        
+        Returns:
+            A (command, samples, args) tuple, with samples and args as lists.
+            
+        Raises:
+            BadTweetCommandError: No command, or an invalid command.
+            BadTweetArgError: An argument to the command is invalid.
+            BadTweetSampleError: Sample numbers are invalid or missing.
+        """
+        
+        if isinstance(content, basestring):
+            try:
+                content = command_parser.parse(content)[0]
+            except IndexError:
+                raise BadTweetCommandError()
+        
+        command = content.command
+        samples = list(content.samples)
+        args = list(content.flags)
         
         #Checking the validity of the pulled queries
         if not command in self.cmd_args:
             transaction.log("No valid command found in command string: %s"
-                            %content)
+                            %content.text)
             raise BadTweetCommandError()
     
         for arg in args:
-            if not arg in self.cmd_args[command.lower()]:
+            if not arg in self.cmd_args[command]:
                 transaction.log("Bad argument found in command string %s"
-                                %content)
-                raise BadTweetArgError()
+                                %content.text)
+                raise BadTweetArgError(command, arg)
         
         if not samples:
-            if not (command.lower() == "help" or command.lower() == "test"):
+            if not (command == "help" or command == "test"):
                 transaction.log("Sample numbers missing from command string %s"
-                                %content)
+                                %content.text)
                 raise BadTweetSampleError()
         
         if samples:
             for num in samples:
                 if num <= 0 or num > self.num_samples:
                     transaction.log("Bad sample numbers in command string %s"
-                                    %content)
+                                    %content.text)
                     raise BadTweetSampleError()
         
-        #Calls the appropriate, non-public helper method.
-        if command.lower() == "sample":
-            self._camera_request(transaction, args, samples)
-        elif command.lower() == "test":
-            self._test_request(transaction, args)
-        elif command.lower() == "help":
-            self._help_request(transaction, args)
+        return command, samples, args
+    
+    def _batch(self, transaction):
+        """
+        Translates a whole poll of tweets at once. Sample requests are merged
+        into a capture plan, ordered by when each sample was first asked for, 
+        with each user listed once per sample. The plan is split between the 
+        users who first asked for each sample. Every other command, and every
+        error, is answered on its own.
+        
+        Args:
+            transaction: The transaction with the list of (content, user) tweets.
+            
+        Returns:
+            The number of captures planned.
+        """
+        
+        #sample: {user: [flags]}, in order of first request
+        plan = OrderedDict()
+        
+        for content, user, commands in command_parser.parse_batch(
+                                                    transaction.command_args):
+            if not commands:
+                transaction.log("No command string found in tweet: %s" %content)
+                self.router.create_transaction(origin = user, to_id = "twitter",
+                                               command = "post",
+                                               command_args = ("I cannot understand "
+                                                   "your tweet. Please tweet "
+                                                   "'help() -s' for my command syntax"))
+                continue
+            
+            for parsed in commands:
+                try:
+                    command, samples, args = self._validate(transaction, parsed)
+                except (BadTweetCommandError, BadTweetArgError, 
+                        BadTweetSampleError) as e:
+                    message = self._error_message(e, parsed)
+                    self.router.create_transaction(origin = user, to_id = "twitter",
+                                                   command = "post",
+                                                   command_args = message)
+                    continue
+                
+                if command == "sample":
+                    for sample in samples:
+                        flags = plan.setdefault(sample, OrderedDict()).setdefault(
+                                                                        user, [])
+                        flags.extend(arg for arg in args if arg not in flags)
+                else:
+                    #help and test requests go through the usual translation
+                    self.router.create_transaction(origin = user, 
+                                                   to_id = self.r_id,
+                                                   command = "translate",
+                                                   command_args = parsed)
+        
+        requests = [CaptureRequest(sample, tuple((user, tuple(flags)) for 
+                                                 user, flags in requesters.iteritems()))
+                    for sample, requesters in plan.iteritems()]
+        
+        #the camera takes each user's part of the plan in one batch
+        plans = OrderedDict()
+        
+        for request in requests:
+            plans.setdefault(request.requesters[0][0], []).append(request)
+        
+        for user, user_requests in plans.iteritems():
+            self.router.create_transaction(origin = user,
+                                           to_id = "camera",
+                                           command = "get_images",
+                                           command_args = tuple(user_requests))
+            
+        return len(requests)
+        
+    def _error_message(self, error, content):
+        """
+        The reply to a user whose command could not be translated.
+        """
+        
+        if isinstance(error, BadTweetArgError):
+            return (("The %s command does not take %s as an argument. ")
+                    %(error.command, error.argument) + 
+                    self.help_strings[error.command])
+        elif isinstance(error, BadTweetSampleError):
+            return ("Your tweet contains invalid sample numbers. Please use"
+                    " sample numbers between 1 and %d" %self.num_samples)
+        else:
+            return ("'%s' contains no valid command. Please tweet help() -c"
+                    " for a list of commands" %(content,))
         
     def _camera_request(self, transaction, args, samples):
         """
@@ -231,8 +345,8 @@ class TranslatorReceiver(Receiver):
             #allows for remote reboot
             if 'r' in args and len(args) == 1:
                 transaction.process(True)
-                #This is super ungraceful. A future improvement would be to save
-                #Any transaction that are still valid
+                #A full reboot, for when the system is unhealthy. The queued
+                #transactions are kept in the journal
                 self.router.reboot()
             
         else:
@@ -275,6 +389,18 @@ class TranslatorReceiver(Receiver):
                 transaction.command_args = self.help_strings['bad']
                     
     
+class CaptureRequest(namedtuple('CaptureRequest', 'sample requesters')):
+    """
+    One entry of a capture plan: a sample and everyone who asked for it.
+    
+    Attributes:
+        sample: The sample number.
+        requesters: A tuple of (user, flags) pairs in the order they asked, 
+            where flags is the tuple of flags that user gave.
+    """
+    
+    __slots__ = ()
+
 class BadTweetCommandError(Exception):
     """
     Raised when the command from a tweet is missing, or is invalid.
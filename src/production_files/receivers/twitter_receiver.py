@@ -21,10 +21,15 @@ class TwitterReceiver(Receiver):
         twitter: A TwitterCommunicator instance.
     """        
     
+    #Twitter outages and rate limits last minutes, not seconds
+    retry_backoff = 5
+    retry_backoff_max = 300
+    
     def __init__(self, router, r_id):
         """
-        This creates an instance of the TwitterCommunicator class, that facilitates the
-        communication with Twitter.
+        This gets the TwitterCommunicator, that facilitates the communication with
+        Twitter, from the router's sessions. It is only created and authenticated 
+        if a previous router has not already done so.
             
         Args:
             router: A reference to the router that this receiver is associated with.
@@ -33,7 +38,7 @@ class TwitterReceiver(Receiver):
         
         super(TwitterReceiver, self).__init__(router, r_id)
         
-        self.twitter = TwitterCommunicator()
+        self.twitter = self.router.sessions.get("twitter", TwitterCommunicator)
         
     def process_transaction(self, transaction):
         """
@@ -55,16 +60,13 @@ class TwitterReceiver(Receiver):
             #then pulls tweets
             self.twitter.pull_tweets() 
             
-            #each tweet in the resulting queue is turned into a transaction
+            #the whole poll goes to the translator as one transaction
             tweets = self.twitter.retrieve_tweets()
-            while len(tweets) > 0:
-                content, user = tweets.popleft()
-                
-                #tweets are routed to the translator
-                self.router.create_transaction(origin = user, 
+            if len(tweets) > 0:
+                self.router.create_transaction(origin = self.r_id, 
                                                to_id = "translator", 
-                                               command = "parse", 
-                                               command_args = content)
+                                               command = "batch", 
+                                               command_args = list(tweets))
                                           
             #this process is not logged, as logging this overloads the logging file
             transaction.process(success = True, finished = True, allow_log = False) 
@@ -83,6 +85,23 @@ class TwitterReceiver(Receiver):
         else:
             transaction.log(info = "Unknown command passed to twitter receiver: %s"
                                     % transaction.command)
+    
+    def next_work_time(self):
+        """
+        Twitter only has work once one of the rate limit delays runs out.
+        """
+        
+        return self.twitter.next_request_time()
+    
+    def drain(self):
+        """
+        Posts the next queued tweet once the rate limit allows, without pulling
+        new tweets, so replies are not lost when the process restarts.
+        """
+        
+        self.twitter.post()
+        
+        return len(self.twitter.post_queue)
 
 class TwitterCommunicator(object):
     """ 
@@ -220,6 +239,21 @@ class TwitterCommunicator(object):
             self.post_request_time = time.time() #update the interaction time
             
         
+    def next_request_time(self):
+        """
+        Returns the time in seconds that the next request to the Twitter API is
+        allowed. Pulls are always pending; a post is only pending if there are
+        tweets waiting in the post queue.
+        """
+        
+        next_time = self.get_request_time + self.get_delay_time
+        
+        if len(self.post_queue) > 0:
+            next_time = min(next_time, 
+                            self.post_request_time + self.post_delay_time)
+            
+        return next_time
+        
     def reply(self, content = None, user = None):
         """ 
         A simple method for replying to a specific user. Appends the user name to the
@@ -0,0 +1,405 @@
+'''
+Uploads images on worker threads, so the router can carry on with captures,
+tweets and replies while an image is uploaded. An upload that fails is tried
+again after an exponential backoff with jitter, without holding up the other
+uploads. The uploads not yet done are saved to a file whenever they change,
+and are picked up again when a pool is next created, so they are not lost
+when the program stops.
+
+A pool is given the function that does the upload, and is bound to the
+functions called when an upload is done or has failed for good:
+
+    pool = UploadPool(flickr.upload_photo, retry_file = filename)
+    pool.bind(uploaded, upload_failed)
+    pool.submit(UploadJob(filename, sample, timestamp, origin))
+
+The done and failed functions are called on the worker threads. A job is
+only removed from the retry file once its done function has returned: if it
+raises, eg. because the router it would queue the replies on is closed, or
+no function is bound, the job is kept with its link and is reported once
+the pool is next bound, without being uploaded again.
+'''
+
+from production_files import telemetry
+from collections import deque
+import datetime
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+#How an UploadJob's timestamp is saved
+timestamp_format = "%Y-%m-%d %H:%M:%S.%f"
+
+class UploadJob(object):
+    """
+    An image to upload, and who to send its link to.
+    
+    Attributes:
+        filename: The image file.
+        sample: The sample in the image.
+        timestamp: The datetime the image was taken.
+        origin: The user (or receiver) the image was taken for.
+        requesters: The (user, flags) of every other user to send the link to.
+        attempts: The number of failed uploads so far.
+        link: The link to the uploaded image, None until it is uploaded.
+    """
+    
+    __slots__ = ('filename', 'sample', 'timestamp', 'origin', 'requesters',
+                 'attempts', 'link')
+    
+    def __init__(self, filename, sample, timestamp, origin, requesters = (),
+                 attempts = 0, link = None):
+        
+        self.filename = filename
+        self.sample = sample
+        self.timestamp = timestamp
+        self.origin = origin
+        self.requesters = tuple(requesters)
+        self.attempts = attempts
+        self.link = link
+    
+    def merge(self, other):
+        """
+        Adds the users of another job for the same image to this one's
+        requesters.
+        """
+        
+        users = set([self.origin] + [user for user, flags in self.requesters])
+        
+        for user, flags in ((other.origin, ()),) + other.requesters:
+            if user not in users:
+                users.add(user)
+                self.requesters += ((user, tuple(flags)),)
+    
+    def to_dict(self):
+        
+        return {'filename' : self.filename,
+                'sample' : self.sample,
+                'timestamp' : self.timestamp.strftime(timestamp_format),
+                'origin' : self.origin,
+                'requesters' : [[user, list(flags)] for user, flags in self.requesters],
+                'attempts' : self.attempts,
+                'link' : self.link}
+    
+    @classmethod
+    def from_dict(cls, values):
+        
+        return cls(values['filename'], values['sample'],
+                   datetime.datetime.strptime(values['timestamp'], timestamp_format),
+                   values['origin'],
+                   [(user, tuple(flags)) for user, flags in values['requesters']],
+                   values['attempts'],
+                   values.get('link'))
+
+class UploadPool(object):
+    """
+    Worker threads that upload images, with retries.
+    
+    Attributes:
+        max_queued: The most uploads waiting for a worker. Submitting another
+            waits for room.
+        max_attempts: The number of failed uploads after which a job fails.
+        backoff: The seconds before the first retry. Each retry after that waits
+            twice as long as the one before.
+        max_backoff: The longest wait between retries.
+        retry_file: The file the unfinished uploads are saved to, None to not
+            save them.
+        _jobs: Every unfinished job, by the filename of its image. A job is
+            unfinished until its upload has been reported to the done function.
+        _ready: The jobs waiting for a worker.
+        _delayed: A heap of (ready time, sequence number, job) of the jobs
+            waiting to be retried.
+        _unreported: The uploaded jobs whose done function was not bound or
+            raised, reported when the pool is next bound.
+    """
+    
+    def __init__(self, upload, workers = 3, max_queued = 16, max_attempts = 6,
+                 backoff = 2, max_backoff = 600, retry_file = None):
+        """
+        Args:
+            upload: Called with (filename, sample, timestamp) to upload an image.
+                Returns the link to the image, or raises an exception if the
+                upload failed.
+            workers: The number of uploads done at once.
+        """
+        
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_file = retry_file
+        
+        self._upload = upload
+        self._done = None
+        self._failed = None
+        
+        self._jobs = {}
+        self._ready = deque()
+        self._delayed = []
+        self._unreported = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        
+        #uploads left unfinished by the last pool go first, and those already
+        #uploaded are only reported
+        for job in self._load():
+            self._jobs[job.filename] = job
+            
+            if job.link is None:
+                self._ready.append(job)
+            else:
+                self._unreported.append(job)
+        
+        self._workers = []
+        
+        for i in xrange(max(1, workers)):
+            worker = threading.Thread(target = self._work, name = "uploader %d" %i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+    
+    def bind(self, done, failed = None):
+        """
+        Sets the functions called when an upload is done, with (job, link), and
+        when it has failed for good, with (job, exception). The uploads that
+        could not be reported to the last done function are reported to this
+        one.
+        """
+        
+        with self._condition:
+            self._done = done
+            self._failed = failed
+            unreported = self._unreported
+            self._unreported = []
+        
+        for job in unreported:
+            self._report(job)
+    
+    def submit(self, job):
+        """
+        Queues an image to be uploaded. If its image is already waiting to be
+        uploaded, the job's users are added to the waiting one instead.
+        """
+        
+        with self._condition:
+            waiting = self._jobs.get(job.filename)
+            
+            if waiting is not None:
+                waiting.merge(job)
+                self._save()
+                return
+            
+            while self._running and len(self._ready) >= self.max_queued:
+                self._condition.wait()
+            
+            self._jobs[job.filename] = job
+            self._ready.append(job)
+            self._save()
+            self._condition.notify_all()
+    
+    def pending(self):
+        """
+        Returns the number of unfinished uploads, including those uploaded but
+        not yet reported.
+        """
+        
+        with self._condition:
+            return len(self._jobs)
+    
+    def contains(self, filename):
+        """
+        Returns whether the upload of an image is unfinished.
+        """
+        
+        with self._condition:
+            return filename in self._jobs
+    
+    def close(self):
+        """
+        Waits for the uploads in progress, and for them to be reported, then
+        stops the workers. The uploads not started or not reported are left in
+        the retry file for the next pool.
+        """
+        
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        
+        for worker in self._workers:
+            worker.join()
+        
+        self._workers = []
+    
+    def cleanup(self):
+        """
+        Closes the pool when its session is released.
+        """
+        
+        self.close()
+    
+    def _work(self):
+        
+        while True:
+            job = self._take()
+            
+            if job is None:
+                return
+            
+            start = time.time()
+            
+            try:
+                link = self._upload(job.filename, job.sample, job.timestamp)
+            except Exception as e:
+                telemetry.record("upload", sample = job.sample, result = 1,
+                                 attempts = job.attempts + 1,
+                                 duration_ms = (time.time() - start) * 1000)
+                self._retry(job, e)
+                continue
+            
+            telemetry.record("upload", sample = job.sample, result = 0,
+                             attempts = job.attempts + 1,
+                             duration_ms = (time.time() - start) * 1000)
+            
+            with self._condition:
+                job.link = link
+                self._save()
+            
+            self._report(job)
+    
+    def _take(self):
+        """
+        Helper method that waits for a job that is ready to upload. Returns None
+        when the pool is closed.
+        """
+        
+        with self._condition:
+            while self._running:
+                now = time.time()
+                
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                
+                if self._ready:
+                    self._condition.notify_all()
+                    return self._ready.popleft()
+                
+                if self._delayed:
+                    self._condition.wait(self._delayed[0][0] - now)
+                else:
+                    self._condition.wait()
+            
+            return None
+    
+    def _report(self, job):
+        """
+        Helper method that calls the done function with an uploaded job, and
+        only then removes the job. A job whose done function is not bound, or
+        raises, is kept for the next bind, unless the pool was bound again 
+        meanwhile, in which case the new function is called.
+        
+        The done function is given a copy of the job, so users merged into it
+        by a submit() while the function runs are not missed: they are 
+        reported in turn, instead of the job being removed.
+        """
+        
+        while True:
+            with self._condition:
+                done = self._done
+                
+                if done is None:
+                    self._unreported.append(job)
+                    return
+                
+                reporting = UploadJob(job.filename, job.sample, job.timestamp,
+                                      job.origin, job.requesters, job.attempts,
+                                      job.link)
+            
+            try:
+                done(reporting, job.link)
+            except Exception:
+                with self._condition:
+                    if self._done is done:
+                        self._unreported.append(job)
+                        unreported = len(self._unreported)
+                        break
+            else:
+                with self._condition:
+                    #merge() only ever adds requesters to the end
+                    added = job.requesters[len(reporting.requesters):]
+                    
+                    if not added:
+                        del self._jobs[job.filename]
+                        self._save()
+                        return
+                    
+                    #only the users merged in are left to report
+                    job.origin = added[0][0]
+                    job.requesters = added[1:]
+                    self._save()
+        
+        telemetry.record("upload_unreported", sample = job.sample, 
+                         queued = unreported)
+    
+    def _retry(self, job, error):
+        """
+        Helper method that schedules a failed job to be tried again, or fails it
+        for good once it has had max_attempts.
+        """
+        
+        with self._condition:
+            job.attempts += 1
+            
+            if job.attempts < self.max_attempts:
+                delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+                
+                #jitter, so uploads that failed together are not retried together
+                delay *= random.uniform(0.5, 1.0)
+                
+                heapq.heappush(self._delayed, (time.time() + delay, next(self._seq), job))
+                self._save()
+                self._condition.notify_all()
+                return
+            
+            del self._jobs[job.filename]
+            self._save()
+            failed = self._failed
+        
+        telemetry.record("upload_failed", sample = job.sample, attempts = job.attempts)
+        
+        if failed is not None:
+            failed(job, error)
+    
+    def _load(self):
+        """
+        Helper method that reads the jobs left in the retry file.
+        """
+        
+        if self.retry_file is None or not os.path.isfile(self.retry_file):
+            return []
+        
+        try:
+            with open(self.retry_file, 'r') as retries:
+                return [UploadJob.from_dict(values) for values in json.load(retries)]
+        except (ValueError, KeyError, TypeError):
+            return []
+    
+    def _save(self):
+        """
+        Helper method, called with the condition held, that writes every
+        unfinished job to the retry file, replacing it atomically.
+        """
+        
+        if self.retry_file is None:
+            return
+        
+        temp_filename = self.retry_file + ".tmp"
+        
+        with open(temp_filename, 'w') as retries:
+            json.dump([job.to_dict() for job in self._jobs.itervalues()], retries)
+        
+        os.rename(temp_filename, self.retry_file)
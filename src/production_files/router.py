@@ -1,11 +1,31 @@
-from collections import deque
-from logger import Logger
+from logger import Logger, flush_all
 from receivers import twitter_receiver, camera_receiver, filemanager_receiver
 from receivers import flickr_receiver, gui_receiver, translator_receiver 
 from transaction import Transaction
+from latency_stats import LatencyStats
+from pipeline import PipelineExecutor
+from scheduler import schedulers
+from journal import Journal
 import utils
-from copy import deepcopy
+import telemetry
+import session
+import dead_letters
+import heapq
+import itertools
 import os
+import threading
+import time
+
+#Seconds between checks of the work the receivers hold while draining, eg.
+#posts waiting for the twitter rate limit
+drain_poll = 0.1
+
+class RouterClosedError(Exception):
+    """
+    An exception that is thrown when a transaction is created on a router that
+    has been closed, so the caller knows it was not queued.
+    """
+    pass
                 
 class Router(object):
     """
@@ -13,9 +33,16 @@ class Router(object):
         
         The driving method of the program is the next() function. It takes the next
         transaction from the transaction queue and processes it.
+        
+        In pipeline mode each receiver instead has its own inbox and worker thread,
+        run by a PipelineExecutor, and next() only polls the twitter and gui 
+        receivers for new requests.
     """
     
-    def __init__(self, attempt_threshold = 5, logger = None, gui_communicator = None):
+    def __init__(self, attempt_threshold = 5, logger = None, gui_communicator = None,
+                 max_idle = 60, stats_interval = 3600, sessions = None,
+                 pipeline = None, scheduler_class = None, dead_letter_store = None,
+                 journal = None):
         """           
            Args:
             attempt_threshold: The max number of times one transaction will appear on the
@@ -25,21 +52,112 @@ class Router(object):
             gui_communicator: The communicator for a GUI for local use of the system.
                               This initialized before the router, unlike the rest of
                               the communicators.
+            max_idle: The longest time in seconds the router will sleep while it has
+                      nothing to do. Defaults to 60.
+            stats_interval: The time in seconds between dumps of the latency statistics
+                            to the latency_stats log. Defaults to 3600.
+            sessions: The SessionManager holding the hardware and web service 
+                      connections the receivers use. Defaults to the one shared by
+                      the process, so a new router reuses the connections of the
+                      one it replaces.
+            pipeline: True to process each receiver's transactions on its own 
+                      thread, False for the single transaction queue. Defaults to
+                      whether the executor entry of the Router configuration is
+                      "pipeline".
+            scheduler_class: The class of the scheduler that orders the queued
+                      transactions, eg. FairScheduler. Defaults to the one named by
+                      the scheduler entry of the Router configuration, or to 
+                      FairScheduler if there is none.
+            dead_letter_store: The DeadLetterStore that transactions the router
+                      gives up on are kept in. Defaults to the one shared by the
+                      process.
+            journal: The Journal the queued transactions are written ahead to,
+                      so they are queued again by the next router if this one is
+                      replaced or the machine reboots. Defaults to the journal in
+                      the resource directory, unless the journal entry of the 
+                      Router configuration is "off". False for no journal.
         """
         
         self.settings = utils.read_config_dict("Router")
         
-        self._transactions = deque()
+        if scheduler_class is None:
+            scheduler_class = schedulers[self.settings.get('scheduler', "fair")]
+        
+        self._scheduler_class = scheduler_class
+        self._transactions = scheduler_class()
+        
+        #Failed transactions waiting to be retried, a heap of 
+        #(ready time, sequence number, transaction)
+        self._delayed = []
+        self._delayed_lock = threading.Lock()
+        self._delayed_seq = itertools.count()
+        
+        self._dead_letter_store = dead_letter_store
+        
+        #Set whenever a transaction is queued, to wake an idle router. In 
+        #pipeline mode only set when a poll is done or a transaction is delayed
+        self._work_available = threading.Event()
+        self._max_idle = max_idle
+        
+        #The time the twitter and gui receivers were last polled in pipeline
+        #mode, by receiver id
+        self._last_poll = {}
+        
+        self.gui_communicator = gui_communicator
+        
+        if sessions is None:
+            self.sessions = session.get_manager()
+        else:
+            self.sessions = sessions
         
         self._receivers = []
         
+        #Index of receiver id to the receivers a transaction is routed to
+        self._routes = {}
+        
         if logger is None:
             self._logger = Logger()
         else:
             self._logger = logger
             
-        self._create_receivers(gui_communicator) 
+        #Per receiver and command processing times, and end to end times
+        self.stats = LatencyStats()
+        self._stats_logger = None
+        self._stats_interval = stats_interval
+        self._next_stats_dump = time.time() + stats_interval
+            
         self._attempt_threshold = attempt_threshold
+        self._executor = None
+        self._journal = None
+        self._closed = False
+        
+        #Opened before the receivers, as they may queue transactions as they are
+        #created, eg. the replies of uploads the last router could not queue
+        if journal is None and self.settings.get('journal', "on") != "off":
+            journal = Journal()
+            
+        if journal:
+            self._journal = journal
+        
+        try:
+            self._create_receivers(gui_communicator)
+        except Exception:
+            #a router that fails to start does not keep the journal open
+            self.close()
+            raise
+        
+        if self._journal is not None:
+            self._replay_journal()
+        
+        if pipeline is None:
+            pipeline = self.settings.get('executor', "queue") == "pipeline"
+        
+        if pipeline:
+            self._executor = PipelineExecutor(self)
+            
+            #Transactions replayed, or queued by the receivers as they were created
+            while len(self._transactions) > 0:
+                self._executor.submit(self._transactions.pop())
     
     def create_transaction(self, to_id = None, command = None, 
                                         command_args = None, origin = None):
@@ -52,20 +170,23 @@ class Router(object):
             to_id: The id of the receiver this transaction will be routed to
             command: The string command word that the receiver will understand
             command_args: Addition arguments for the command
+            
+        Raises:
+            RouterClosedError: The router is closed.
         """
         
-        self._transactions.append(Transaction(self._logger, 
-                                              to_id, 
-                                              command, 
-                                              command_args, 
-                                              origin))
+        self._queue(Transaction(self._logger, 
+                                to_id, 
+                                command, 
+                                command_args, 
+                                origin))
         
     def clone_transaction(self, original_transaction, to_id = None, 
                           command = None, command_args = None):
         """
-        Deep copies an existing transaction, allowing changing of any routing
-        parameter or carried information. The origin remains constant. A deep
-        copy of a transaction avoids duplication of the logger.
+        Copies an existing transaction and queues the copy, allowing changing of
+        any routing parameter or carried information. The origin remains constant.
+        Command arguments are only copied if they are not replaced and are mutable.
         
         Args:
             original_transaction: The transaction being copied
@@ -75,48 +196,44 @@ class Router(object):
                           transaction
         """
         
-        new_transaction = deepcopy(original_transaction)
-        
-        if to_id is not None:
-            new_transaction.to_id = to_id
-        if command is not None:
-            new_transaction.command = command
-        if command_args is not None:
-            new_transaction.command_args = command_args
-            
-        new_transaction.finished = new_transaction.processed = False
-        new_transaction.attempts = 0
+        new_transaction = original_transaction.clone(to_id, command, command_args)
         
-        self._transactions.append(new_transaction)
+        self._queue(new_transaction)
        
     def next(self):
         """
         The method that drives the router. It will process the next transaction in the queue.
-        If there are no transaction in the queue, transactions to pull tweets and gui commands
-        are queued. Any transactions that fail to process are added to the queue again, but
-        will not be added more than the attempt_threshold.
+        If there are no transaction in the queue, the router sleeps until a receiver has
+        scheduled work or a transaction is queued, then transactions to pull tweets and gui
+        commands are queued. Any transactions that fail to process are added to the queue again
+        once their receiver's retry delay has passed, but will not be added more than the 
+        attempt_threshold. Transactions that are given up on are kept as dead letters.
+        
+        In pipeline mode the receivers' workers process the transactions, and next()
+        sleeps until the twitter or gui receiver has scheduled work, or a failed 
+        transaction is ready to retry, then polls the receivers whose work is due. An
+        exception raised by a receiver on its worker is raised here.
         """
         
-        if len(self._transactions) > 0:
-            transaction = self._transactions.popleft()
-            
-            for rec in self._receivers:
-                if rec.check_id(transaction.to_id):
-                    rec.process_transaction(transaction)
-                                                        
-            if transaction.processed and not transaction.finished:
-                transaction.requeue()
-                self._transactions.append(transaction)
-                
-            elif not transaction.processed:
-                if transaction.attempts < self._attempt_threshold:
-                    self._transactions.append(transaction)
-                    
-                else:
-                    self._logger.log("Transaction failed to process too many " + 
-                                     "times: " + str(transaction))
+        self._release_delayed()
+        
+        if self._executor is not None:
+            self._next_pipeline()
+        
+        elif len(self._transactions) > 0:
+            self._deliver(self._transactions.pop())
+        
+            if time.time() >= self._next_stats_dump:
+                self.dump_stats()
         
         else: #no transaction to handle, lets find others
+            self._wait_for_work()
+            self._release_delayed()
+            
+            #A transaction was queued, or became ready to retry, while waiting
+            if len(self._transactions) > 0:
+                return
+            
             #Poll the twitter receiver for new tweets
             self.create_transaction(to_id = "twitter", command = "update")
             
@@ -124,17 +241,397 @@ class Router(object):
             if self.gui_communicator:
                 self.create_transaction(to_id = "gui", command = "update")
     
+    def dump_stats(self):
+        """
+        Logs the percentiles of the processing time of each receiver and command,
+        and of the end to end time of each kind of finished transaction.
+        """
+        
+        if self._stats_logger is None:
+            self._stats_logger = Logger(name = "latency_stats")
+            
+        self.stats.dump(self._stats_logger)
+        self._next_stats_dump = time.time() + self._stats_interval
+    
+    def replay_dead_letters(self, ids = None):
+        """
+        Queues the transactions kept as dead letters again, as if they had not 
+        been attempted, and removes them from the dead letter store.
+        
+        Args:
+            ids: The ids of the DeadLetters to replay. Every one if not given.
+            
+        Returns:
+            The number of transactions queued.
+        """
+        
+        records = self._dead_letters().take(ids)
+        
+        for record in records:
+            transaction = Transaction.from_record(self._logger, record)
+            transaction.attempts = 0
+            self._queue(transaction)
+            
+        self._logger.log("Replayed %d dead letters" %len(records))
+        
+        return len(records)
+    
+    def close(self):
+        """
+        Stops the receivers' workers in pipeline mode, once the transactions they
+        are processing are done, and closes the journal. Called before the router
+        is replaced. Creating a transaction on a closed router raises a 
+        RouterClosedError.
+        """
+        
+        if self._executor is not None:
+            self._executor.stop()
+        
+        self._closed = True
+            
+        if self._journal is not None:
+            self._journal.close()
+    
+    def drain(self, timeout = 60):
+        """
+        Processes the transactions already queued, without polling the twitter and
+        gui receivers for new requests, and has the receivers finish the work 
+        they hold outside the queue, until none is left or the timeout passes. 
+        Replies queued meanwhile, eg. by uploads finishing, are processed too.
+        Called before a restart. Transactions still queued, or waiting to be
+        retried, are kept in the journal, and uploads not finished in the upload
+        pool's retry file.
+        
+        Args:
+            timeout: The longest time in seconds to spend draining.
+        
+        Returns:
+            The number of transactions, and pieces of receiver work, left.
+        """
+        
+        deadline = time.time() + timeout
+        held = 0
+        
+        while True:
+            #cleared before looking for work, so work queued after is not missed
+            self._work_available.clear()
+            self._release_delayed()
+            
+            if self._executor is None and len(self._transactions) > 0:
+                if time.time() >= deadline:
+                    break
+                
+                self._drain_next()
+                continue
+            
+            if self._executor is not None and not self._executor.join(
+                                                    max(0, deadline - time.time())):
+                break
+            
+            held = self._drain_receivers()
+            remaining = deadline - time.time()
+            
+            if held == 0 or remaining <= 0:
+                break
+            
+            self._work_available.wait(min(drain_poll, remaining))
+        
+        if self._executor is not None:
+            left = self._executor.pending()
+        else:
+            left = len(self._transactions)
+        
+        with self._delayed_lock:
+            return left + len(self._delayed) + held
+    
+    def shutdown(self):
+        """
+        Shuts the router down for good, before the process is restarted or the
+        system reboots. Stops the workers, has every receiver free its local
+        resources, closes the sessions, then closes the router and writes the
+        buffered log messages. Unprocessed transactions are kept in the journal.
+        
+        The journal is closed last, as the transactions queued while the 
+        receivers and sessions close, eg. the replies of the uploads the upload
+        pool waits for, must still be journaled.
+        """
+        
+        if self._executor is not None:
+            self._executor.stop()
+        
+        for rec in self._receivers:
+            try:
+                rec.cleanup()
+            except Exception as e:
+                self._logger.log("Error cleaning up the %s receiver: %s"
+                                 %(rec.r_id, str(e)))
+        
+        self.sessions.release_all()
+        self.close()
+        flush_all()
+    
     def reboot(self):
         """
         A system reboot command that all receivers can call. This ensures a controlled
-        shutdown of all receivers. Unprocessed transactions are lost.
+        shutdown of all receivers. Unprocessed transactions are kept in the journal, 
+        and queued again by the router started after the reboot.
         """
-        for rec in self._receivers:
-            rec.cleanup()
-            os.system("sudo reboot")
+        self.shutdown()
+        os.system("sudo reboot")
         
     ##Private members
     
+    def _queue(self, transaction):
+        """
+        Adds a transaction to the scheduler of the transaction queue, or of the
+        inbox of its receiver in pipeline mode.
+        
+        Raises:
+            RouterClosedError: The router is closed, so the transaction could
+                not be journaled.
+        """
+        
+        if self._closed:
+            raise RouterClosedError("The router is closed")
+        
+        #twitter and gui polls are made again by the next router anyway
+        if self._journal is not None and transaction.command != "update":
+            self._journal.put(transaction)
+        
+        #the workers are woken by their inboxes, so the router is not
+        if self._executor is not None:
+            self._executor.submit(transaction)
+        else:
+            self._transactions.push(transaction)
+            self._work_available.set()
+    
+    def _deliver(self, transaction):
+        """
+        Routes a transaction to its receivers, then queues it again if it is to
+        be passed on, or if it failed and has not reached the attempt_threshold.
+        A transaction handed on without being processed, by changing its to_id or
+        command or calling requeue(), is queued again at once. Only one that
+        failed waits for the retry delay. A transaction routed to no receiver is 
+        dropped. Finished and dropped transactions are completed in the journal.
+        """
+        
+        #receivers change these in place to pass the transaction on
+        to_id = transaction.to_id
+        command = transaction.command
+        attempts = transaction.attempts
+        started = time.time()
+        
+        receivers = self._route(to_id)
+        
+        try:
+            for rec in receivers:
+                rec.process_transaction(transaction)
+        except Exception:
+            #the next router replays the transaction from the journal, unless it
+            #keeps raising
+            transaction.attempts += 1
+            
+            if transaction.attempts >= self._attempt_threshold:
+                self._drop(transaction, "Transaction raised an exception too many "
+                                        "times")
+            elif self._journal is not None:
+                self._journal.put(transaction)
+            raise
+            
+        self._record_hop(transaction, to_id, command, started)
+        
+        if transaction.processed and transaction.finished:
+            if self._journal is not None:
+                self._journal.complete(transaction)
+                                                    
+        elif transaction.processed and not transaction.finished:
+            transaction.requeue()
+            self._queue(transaction)
+            
+        elif not transaction.processed:
+            if not receivers:
+                self._drop(transaction, "Transaction routed to no receiver")
+                
+            elif transaction.attempts <= attempts:
+                #handed on, not failed
+                self._queue(transaction)
+                
+            elif transaction.attempts < self._attempt_threshold:
+                self._delay(transaction, receivers)
+                
+            else:
+                self._drop(transaction, "Transaction failed to process too many " + 
+                                        "times")
+    
+    def _delay(self, transaction, receivers):
+        """
+        Holds a failed transaction back until the longest retry delay of its
+        receivers has passed. Other transactions are processed meanwhile.
+        """
+        
+        delay = max(rec.retry_delay(transaction.attempts) for rec in receivers)
+        
+        if self._journal is not None:
+            self._journal.put(transaction)
+        
+        with self._delayed_lock:
+            heapq.heappush(self._delayed, (time.time() + delay, 
+                                           next(self._delayed_seq), transaction))
+        
+        #the router may need to wake earlier than it planned to
+        self._work_available.set()
+    
+    def _release_delayed(self):
+        """
+        Queues the failed transactions whose retry delay has passed.
+        """
+        
+        if not self._delayed:
+            return
+        
+        now = time.time()
+        ready = []
+        
+        with self._delayed_lock:
+            while self._delayed and self._delayed[0][0] <= now:
+                ready.append(heapq.heappop(self._delayed)[2])
+        
+        for transaction in ready:
+            self._queue(transaction)
+    
+    def _drop(self, transaction, reason):
+        """
+        Gives up on a transaction, keeping it in the dead letter store.
+        """
+        
+        self._logger.log("%s: %s" %(reason, transaction))
+        telemetry.record("transaction_dropped", 
+                         transaction_id = transaction.id,
+                         receiver = transaction.to_id,
+                         command = transaction.command)
+        
+        self._dead_letters().add(transaction, reason)
+        
+        if self._journal is not None:
+            self._journal.complete(transaction)
+    
+    def _drain_next(self):
+        """
+        Processes the next queued transaction while draining. Polls are skipped,
+        as they are made again once the router is restarted.
+        """
+        
+        transaction = self._transactions.pop()
+        
+        if transaction.command == "update":
+            return
+        
+        try:
+            self._deliver(transaction)
+        except Exception as e:
+            self._logger.log("Exception while draining: %s" %str(e))
+    
+    def _drain_receivers(self):
+        """
+        Has every receiver do the work it holds while draining, using it on no
+        other thread in pipeline mode. Returns the pieces of work still held.
+        """
+        
+        held = 0
+        
+        for rec in self._receivers:
+            try:
+                if self._executor is not None:
+                    with self._executor.lock(rec.r_id):
+                        held += rec.drain()
+                else:
+                    held += rec.drain()
+            except Exception as e:
+                self._logger.log("Exception while draining the %s receiver: %s"
+                                 %(rec.r_id, str(e)))
+        
+        return held
+    
+    def _replay_journal(self):
+        """
+        Queues the transactions the journal holds that were never finished, in the
+        order they were first queued.
+        """
+        
+        for key, record in self._journal.recovered:
+            transaction = Transaction.from_record(self._logger, record)
+            transaction.journal_key = key
+            self._transactions.push(transaction)
+            
+        if self._journal.recovered:
+            self._logger.log("Replayed %d transactions from the journal" 
+                             %len(self._journal.recovered))
+    
+    def _dead_letters(self):
+        """
+        Returns the dead letter store, opening the shared one the first time it
+        is needed.
+        """
+        
+        if self._dead_letter_store is None:
+            self._dead_letter_store = dead_letters.get_store()
+            
+        return self._dead_letter_store
+    
+    def _next_pipeline(self):
+        """
+        The pipeline mode next(). The workers process the transactions, so this
+        only waits for the twitter and gui receivers to have work, and polls them
+        once their work is due if they have none queued.
+        """
+        
+        self._executor.raise_error()
+        
+        if time.time() >= self._next_stats_dump:
+            self.dump_stats()
+        
+        self._wait_for_work()
+        self._release_delayed()
+        
+        self._executor.raise_error()
+        
+        if self._poll_due("twitter"):
+            self._poll("twitter")
+            
+        if self.gui_communicator and self._poll_due("gui"):
+            self._poll("gui")
+    
+    def _poll_due(self, r_id):
+        """
+        True if the receivers with the given id have no poll queued, and the work
+        one of them has scheduled is due. Receivers that schedule no work are 
+        polled every max_idle.
+        """
+        
+        if self._executor.pending(r_id) > 0:
+            return False
+        
+        now = time.time()
+        
+        for rec in self._route(r_id):
+            work_time = rec.next_work_time()
+            
+            if work_time is None:
+                work_time = self._last_poll.get(r_id, 0) + self._max_idle
+                
+            if work_time <= now:
+                return True
+            
+        return False
+    
+    def _poll(self, r_id):
+        """
+        Queues an update transaction to poll the receivers with the given id.
+        """
+        
+        self._last_poll[r_id] = time.time()
+        self.create_transaction(to_id = r_id, command = "update")
+    
     def _create_receivers(self, gui_communicator): 
         """
         Creates all the receivers.
@@ -142,23 +639,120 @@ class Router(object):
         
         #Only create a GUI receiver if the GUI exists
         if gui_communicator:
-            self._receivers.append(gui_receiver.
-                                   GuiReceiver(self, "gui", gui_communicator))
+            self._add_receiver(gui_receiver.
+                               GuiReceiver(self, "gui", gui_communicator))
             
-        self._receivers.append(twitter_receiver.
-                               TwitterReceiver(self, "twitter"))
+        self._add_receiver(twitter_receiver.
+                           TwitterReceiver(self, "twitter"))
         
-        self._receivers.append(translator_receiver.
-                               TranslatorReceiver(self, "translator", 
-                                                  self.settings['num_samples']))
+        self._add_receiver(translator_receiver.
+                           TranslatorReceiver(self, "translator", 
+                                              self.settings['num_samples']))
         
-        self._receivers.append(filemanager_receiver.
-                               FileManagerReceiver(self, "filemanager"))
+        self._add_receiver(filemanager_receiver.
+                           FileManagerReceiver(self, "filemanager"))
         
-        self._receivers.append(flickr_receiver.
-                               FlickrReceiver(self, "flickr"))
+        self._add_receiver(flickr_receiver.
+                           FlickrReceiver(self, "flickr"))
         
-        self._receivers.append(camera_receiver.
-                               CameraReceiver(self, "camera"))
+        self._add_receiver(camera_receiver.
+                           CameraReceiver(self, "camera"))
         
         self._logger.log("Receivers created")
+        
+    def _record_hop(self, transaction, to_id, command, started):
+        """
+        Records how long the receivers took with a transaction, and the time since
+        the transaction was created if it is now finished.
+        """
+        
+        finished_time = time.time()
+        duration = finished_time - started
+        
+        if to_id is not None and not isinstance(to_id, basestring):
+            to_id = ",".join(to_id)
+        
+        transaction.add_hop(to_id, command, started, duration)
+        self.stats.record(to_id, command, duration)
+        
+        #twitter and gui polls are far too frequent to be worth recording
+        if command != "update":
+            telemetry.record("hop", transaction_id = transaction.id, 
+                             receiver = to_id, command = command, 
+                             duration_ms = duration * 1000)
+        
+        if transaction.processed and transaction.finished:
+            self.stats.record("end_to_end", command, 
+                              finished_time - transaction.created)
+        
+    def _wait_for_work(self):
+        """
+        Blocks until the earliest time any receiver has scheduled work, a failed
+        transaction is ready to retry, or a transaction is queued, whichever 
+        comes first. Never sleeps longer than max_idle. In pipeline mode queued
+        transactions go to the workers instead, and a worker finishing a poll
+        wakes the router.
+        """
+        
+        self._work_available.clear()
+        
+        if len(self._transactions) > 0:
+            return
+        
+        if self._executor is not None and self._executor.error is not None:
+            return
+        
+        timeout = self._max_idle
+        
+        with self._delayed_lock:
+            if self._delayed:
+                timeout = min(timeout, self._delayed[0][0] - time.time())
+        
+        for rec in self._receivers:
+            #in pipeline mode a receiver with work queued is woken by its worker
+            if self._executor is not None and self._executor.pending(rec.r_id) > 0:
+                continue
+            
+            work_time = rec.next_work_time()
+            
+            if work_time is not None:
+                timeout = min(timeout, work_time - time.time())
+        
+        if timeout > 0:
+            self._work_available.wait(timeout)
+        
+    def _add_receiver(self, receiver):
+        """
+        Registers a receiver with the router and indexes it by its id, so
+        routing a transaction is a single dictionary lookup.
+        """
+        
+        self._receivers.append(receiver)
+        self._routes.setdefault(receiver.r_id, []).append(receiver)
+        
+        #Multi-destination entries are built lazily, and are stale now
+        for key in [k for k in self._routes if isinstance(k, tuple)]:
+            del self._routes[key]
+        
+    def _route(self, to_id):
+        """
+        Returns the list of receivers a transaction with the given to_id is
+        routed to. The to_id is either a receiver id or a list of them. The
+        receivers for a list of ids are indexed the first time that list is
+        seen.
+        """
+        
+        try:
+            return self._routes[to_id]
+        except TypeError: #a list of ids is not hashable
+            key = tuple(to_id)
+        except KeyError:
+            if not isinstance(to_id, tuple):
+                return ()
+            key = to_id
+            
+        if key not in self._routes:
+            self._routes[key] = [rec for rec in self._receivers
+                                 if rec.check_id(key)]
+            
+        return self._routes[key]
\ No newline at end of file
@@ -0,0 +1,164 @@
+'''
+The order the Router takes queued transactions in. The Router keeps its
+transactions in a scheduler, and in pipeline mode every receiver's inbox is
+one too, so the order can be changed without touching the routing.
+
+A FifoScheduler takes transactions in the order they were queued, as the
+single deque always did. A FairScheduler serves the transactions in priority
+classes, replies and posts first, then the admin test commands, then
+everything else, and captures last, and within a class shares the router
+fairly between the users the transactions came from. Each user's
+transactions keep their order, but a user who asks for all twelve samples
+no longer holds up everyone who asks after them: the others' requests are
+interleaved with theirs, weighted by the number of captures each asks for.
+
+The fair share is self-clocked fair queuing. Every transaction is tagged
+with its user's finish time, the later of the class's virtual time and the
+tag of the user's previous transaction, plus its cost, and the smallest tag
+is served first, so queuing and taking a transaction are O(log n) on a heap.
+
+Transactions are queued by the upload threads of the flickr receiver as well
+as by the thread that takes them, so both schedulers are thread safe.
+'''
+
+from collections import deque
+import heapq
+import itertools
+import threading
+
+#The priority classes of the FairScheduler, the lowest served first
+class_replies = 0
+class_admin = 1
+class_other = 2
+class_captures = 3
+
+def priority(transaction):
+    """
+    Returns the priority class of a transaction.
+    """
+    
+    command = transaction.command
+    
+    if command == "post":
+        return class_replies
+    
+    if command == "get_image" or command == "get_images":
+        return class_captures
+    
+    if command == "translate" and _is_test(transaction.command_args):
+        return class_admin
+    
+    return class_other
+
+def cost(transaction):
+    """
+    Returns the share of the router a transaction uses: the number of samples
+    for a capture plan, and one for everything else.
+    """
+    
+    if transaction.command == "get_images":
+        return max(1, len(transaction.command_args))
+    
+    return 1
+
+class FifoScheduler(object):
+    """
+    Takes transactions in the order they were queued. The deque's append and
+    popleft are atomic, so it needs no lock.
+    """
+    
+    def __init__(self):
+        
+        self._queue = deque()
+    
+    def push(self, transaction):
+        
+        self._queue.append(transaction)
+    
+    def pop(self):
+        """
+        Removes and returns the next transaction.
+        
+        Raises:
+            IndexError: There are no transactions queued.
+        """
+        
+        return self._queue.popleft()
+    
+    def __len__(self):
+        
+        return len(self._queue)
+
+class FairScheduler(object):
+    """
+    Takes transactions by priority class, then by fair share between origins.
+    
+    Attributes:
+        _heap: A heap of (class, finish tag, sequence number, transaction).
+        _virtual: The virtual time of each class, the finish tag of the
+            transaction of that class last taken.
+        _finish: A dictionary of (class, origin): the finish tag of the origin's
+            last queued transaction of that class. Origins with nothing queued
+            are removed, so it does not grow with every user ever seen.
+        _lock: Held while the heap and tags are changed.
+    """
+    
+    def __init__(self):
+        
+        self._heap = []
+        self._virtual = [0] * (class_captures + 1)
+        self._finish = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+    
+    def push(self, transaction):
+        
+        level = priority(transaction)
+        key = (level, transaction.origin)
+        
+        with self._lock:
+            tag = max(self._virtual[level], self._finish.get(key, 0)) + cost(transaction)
+            self._finish[key] = tag
+            
+            heapq.heappush(self._heap, (level, tag, next(self._seq), transaction))
+    
+    def pop(self):
+        """
+        Removes and returns the next transaction.
+        
+        Raises:
+            IndexError: There are no transactions queued.
+        """
+        
+        with self._lock:
+            level, tag, seq, transaction = heapq.heappop(self._heap)  #@UnusedVariable
+            self._virtual[level] = tag
+            
+            #the origin's last queued transaction of the class
+            key = (level, transaction.origin)
+            if self._finish.get(key) == tag:
+                del self._finish[key]
+        
+        return transaction
+    
+    def __len__(self):
+        
+        return len(self._heap)
+
+#The schedulers that can be named by the scheduler entry of the Router
+#configuration
+schedulers = {'fifo' : FifoScheduler,
+              'fair' : FairScheduler}
+
+def _is_test(command_args):
+    """
+    True if the command arguments of a translate transaction are a test
+    command, either parsed or as a string.
+    """
+    
+    command = getattr(command_args, "command", None)
+    
+    if command is None and isinstance(command_args, basestring):
+        command = command_args.strip().split("(", 1)[0]
+    
+    return command == "test"
@@ -0,0 +1,154 @@
+'''
+Long-lived connections to the hardware and web services, kept apart from the
+Router so they outlive it. Opening them is slow: the Arduino board is reset,
+re-handshaken and homed, the camera device is reopened, and Twitter and
+Flickr are authenticated again. When startup.py replaces a Router after an
+error, the receivers of the new one rebind to the sessions that are still
+live instead.
+
+Receivers ask the manager shared by the process for a session by name,
+giving the function that opens it and an optional cheap health check:
+
+    self._camera_comm = self.router.sessions.get("camera", CameraCommunicator,
+                                                  CameraCommunicator.is_healthy)
+
+A session that fails its health check is cleaned up and opened again. A
+receiver that knows its session is broken, eg. after a hardware error,
+releases it so the next Router opens a new one.
+'''
+
+import threading
+import time
+import telemetry
+from logger import Logger
+
+class SessionManager(object):
+    """
+    Opens, hands out and closes the named sessions.
+    
+    Attributes:
+        _sessions: A dictionary of name: open session pairs.
+        _lock: Held while a session is checked or opened, so one is never opened
+            twice.
+        _logger: Logs sessions being opened, reused and closed. Created the
+            first time there is something to log.
+    """
+    
+    def __init__(self):
+        
+        self._sessions = {}
+        self._lock = threading.RLock()
+        self._logger = None
+    
+    def get(self, name, factory, check = None):
+        """
+        Returns the live session with the given name. Opens it if there is none,
+        or if the open one fails its health check.
+        
+        Args:
+            name: The name of the session, eg. "camera".
+            factory: Called with no arguments to open the session.
+            check: Called with the session, returns whether it is still usable.
+                Every open session is reused if not given.
+        
+        Raises:
+            Whatever the factory raises if the session cannot be opened.
+        """
+        
+        with self._lock:
+            session = self._sessions.get(name)
+            
+            if session is not None:
+                start = time.time()
+                
+                if check is None or self._healthy(name, session, check):
+                    self._log("Reusing the %s session" %name)
+                    telemetry.record("session_reused", session = name,
+                                     duration_ms = (time.time() - start) * 1000)
+                    return session
+                
+                self._log("The %s session failed its health check" %name)
+                self.release(name)
+            
+            start = time.time()
+            session = factory()
+            self._sessions[name] = session
+            
+            self._log("Opened the %s session" %name)
+            telemetry.record("session_opened", session = name,
+                             duration_ms = (time.time() - start) * 1000)
+            
+            return session
+    
+    def release(self, name):
+        """
+        Closes the session with the given name, if it is open, by calling its
+        cleanup method if it has one.
+        """
+        
+        with self._lock:
+            session = self._sessions.pop(name, None)
+            
+            if session is None:
+                return
+            
+            try:
+                if hasattr(session, "cleanup"):
+                    session.cleanup()
+            except Exception as e:
+                self._log("Error closing the %s session: %s" %(name, str(e)))
+            else:
+                self._log("Closed the %s session" %name)
+    
+    def release_all(self):
+        """
+        Closes every open session.
+        """
+        
+        with self._lock:
+            for name in self._sessions.keys():
+                self.release(name)
+    
+    def names(self):
+        """
+        Returns the sorted names of the open sessions.
+        """
+        
+        with self._lock:
+            return sorted(self._sessions)
+    
+    def _log(self, message):
+        
+        if self._logger is None:
+            self._logger = Logger(name = "sessions")
+            
+        self._logger.log(message)
+    
+    def _healthy(self, name, session, check):
+        """
+        Helper method that runs a health check, treating an error as a failure.
+        """
+        
+        try:
+            return check(session)
+        except Exception as e:
+            self._log("Error checking the %s session: %s" %(name, str(e)))
+            return False
+
+#The sessions shared by every Router in the process
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """
+    Returns the SessionManager shared by the process, creating it on first use.
+    """
+    
+    global _manager
+    
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionManager()
+                
+    return _manager
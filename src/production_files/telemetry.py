@@ -0,0 +1,152 @@
+'''
+A structured record of what the system did, kept alongside the text logs.
+Every event is one compact JSON object per line, with typed fields, in a
+file per day under log/telemetry/. The day in each filename is the index:
+a query only opens the files for the days it covers.
+
+Events are recorded through the module-level record function, which writes
+to a TelemetryLog shared by the whole process:
+
+    telemetry.record("serial", receiver = "camera", duration_ms = 1003.2,
+                     result = 0)
+
+and read back with query, eg. every capture of sample 3 in the last week:
+
+    telemetry.query("capture", start = time.time() - 7 * 86400, sample = 3)
+'''
+
+import json
+import os
+import threading
+import time
+from logger import Logger
+
+#The fields every event may have. Other keyword fields are recorded as given.
+fields = ("event", "transaction_id", "receiver", "duration_ms", "sample",
+          "result")
+
+class TelemetryLog(object):
+    """
+    Writes events to, and reads events from, the daily JSON-lines files.
+    Writing goes through a Logger, so events are buffered and flushed in the
+    background like any other log.
+    
+    Attributes:
+        directory: The directory holding the daily event files.
+    """
+    
+    def __init__(self, name = "telemetry"):
+        
+        self._logger = Logger(name = name, show_date = False, 
+                              extension = "jsonl", announce = False)
+        self.directory = "%s%s/" %(self._logger.directory, name)
+        
+    def record(self, event, **values):
+        """
+        Records a single event, timestamped now. Fields that are None are left
+        out.
+        
+        Args:
+            event: The type of event, eg. "serial" or "transaction_processed".
+            values: The typed fields of the event, see the fields tuple.
+        """
+        
+        entry = {"ts" : round(time.time(), 3), "event" : event}
+        
+        for key, value in values.iteritems():
+            if value is not None:
+                entry[key] = value
+                
+        self._logger.log(json.dumps(entry, separators = (',', ':'), 
+                                    default = str))
+        
+    def days(self):
+        """
+        Returns the sorted list of days that have events, as YYYYMMDD strings.
+        """
+        
+        if not os.path.isdir(self.directory):
+            return []
+        
+        return sorted(name[:8] for name in os.listdir(self.directory) 
+                      if name.endswith(".jsonl"))
+        
+    def query(self, event = None, start = None, end = None, **match):
+        """
+        Yields the recorded events, oldest first, as dictionaries.
+        
+        Args:
+            event: Only yield events of this type, if given.
+            start: Only yield events at or after this time in seconds, if given.
+            end: Only yield events before this time in seconds, if given.
+            match: Only yield events whose fields equal these values.
+        """
+        
+        self._logger.flush()
+        
+        first_day = _day(start) if start is not None else None
+        last_day = _day(end) if end is not None else None
+        
+        for day in self.days():
+            if first_day is not None and day < first_day:
+                continue
+            if last_day is not None and day > last_day:
+                break
+            
+            with open("%s%s.jsonl" %(self.directory, day), "r") as day_file:
+                for line in day_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: #a line cut short by a crash
+                        continue
+                    
+                    if event is not None and entry.get("event") != event:
+                        continue
+                    if start is not None and entry["ts"] < start:
+                        continue
+                    if end is not None and entry["ts"] >= end:
+                        continue
+                    if any(entry.get(key) != value 
+                           for key, value in match.iteritems()):
+                        continue
+                    
+                    yield entry
+                    
+    def flush(self):
+        
+        self._logger.flush()
+
+def _day(seconds):
+    
+    return time.strftime("%Y%m%d", time.localtime(seconds))
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_log():
+    """
+    Returns the TelemetryLog shared by the process, creating it on first use.
+    """
+    
+    global _log
+    
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = TelemetryLog()
+                
+    return _log
+
+def record(event, **values):
+    """
+    Records an event in the process's TelemetryLog. See TelemetryLog.record.
+    """
+    
+    get_log().record(event, **values)
+    
+def query(event = None, start = None, end = None, **match):
+    """
+    Queries the process's TelemetryLog. See TelemetryLog.query.
+    """
+    
+    return get_log().query(event, start, end, **match)
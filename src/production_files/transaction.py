@@ -5,6 +5,16 @@ Created on Sep 9, 2013
 '''
 
 from copy import deepcopy
+from datetime import date, datetime
+from itertools import count
+import telemetry
+import time
+
+#Source of the ids that identify a transaction in the telemetry log
+_ids = count(1)
+
+#Types of command arguments that clones can share with the original
+_immutable_types = (basestring, int, long, float, bool, type(None), date, datetime)
 
 class Transaction(object):
     """
@@ -22,8 +32,22 @@ class Transaction(object):
         processed: A state boolean indicating whether the transaction is 
                    finished or not
         attempts: The number of times a receiver has attempted to process this
+        id: A number identifying this transaction and its clones in the telemetry log
+        created: The time in seconds this transaction, or the one it was cloned
+                 from, was created
+        hops: A list of (receiver id, command, start time, duration) tuples, one for
+              each time the router passed this transaction to a receiver
+        journal_key: The key of this transaction in the router's journal, None if
+                     it has not been journalled. Unlike the id, it is not shared
+                     with clones
     """
     
+    #Transactions are created and cloned for every tweet, so they have a fixed,
+    #compact layout
+    __slots__ = ('to_id', '_logger', 'command', 'command_args', 'processed', 
+                 'attempts', '_origin', 'finished', 'id', 'created', 'hops',
+                 'journal_key')
+    
     def __init__(self, logger, to_id = None, command = None, 
                             command_args = None, origin = None, attempts = 0):
         """
@@ -38,6 +62,10 @@ class Transaction(object):
         self.attempts = attempts
         self._origin = origin
         self.finished = False
+        self.id = next(_ids)
+        self.created = time.time()
+        self.hops = []
+        self.journal_key = None
                  
     def process(self, success, finished = True, allow_log = True):
         """
@@ -57,8 +85,13 @@ class Transaction(object):
             if allow_log:
                 self._logger.log("%s to %s processed with args: %s" %(self.command, self.to_id, 
                                                                        self.command_args))
+                telemetry.record("transaction_processed", transaction_id = self.id,
+                                 receiver = self.to_id, command = self.command)
         else:
             self.attempts += 1
+            telemetry.record("transaction_failed", transaction_id = self.id,
+                             receiver = self.to_id, command = self.command,
+                             attempts = self.attempts)
                                                                                     
     def log(self, info = "Not specified"):
         """
@@ -78,9 +111,95 @@ class Transaction(object):
         self.processed = False
         self.attempts = 0
     
+    def add_hop(self, to_id, command, started, duration):
+        """
+        Called by the router after a receiver has handled this transaction, to
+        record how long it took.
+        """
+        
+        self.hops.append((to_id, command, started, duration))
+    
+    def clone(self, to_id = None, command = None, command_args = None):
+        """
+        Copies this transaction, allowing changing of any routing parameter or
+        carried information. The origin, id, creation time and hops so far are
+        kept, and the logger is shared. The copy has not been processed or
+        attempted yet.
+        
+        Command arguments that are not replaced are shared with the copy if they
+        are immutable, and deep copied otherwise.
+        
+        Args:
+            to_id: A new receiver id to send the copy to
+            command: The new command being carried by the copy
+            command_args: The new command arguments being carried by the copy
+        """
+        
+        result = self.__class__.__new__(self.__class__)
+        
+        result._logger = self._logger
+        result._origin = self._origin
+        result.id = self.id
+        result.created = self.created
+        result.hops = list(self.hops)
+        result.journal_key = None
+        
+        if to_id is not None:
+            result.to_id = to_id
+        elif isinstance(self.to_id, list):
+            result.to_id = list(self.to_id)
+        else:
+            result.to_id = self.to_id
+            
+        result.command = self.command if command is None else command
+        
+        if command_args is not None:
+            result.command_args = command_args
+        elif _is_immutable(self.command_args):
+            result.command_args = self.command_args
+        else:
+            result.command_args = deepcopy(self.command_args)
+            
+        result.processed = result.finished = False
+        result.attempts = 0
+        
+        return result
+    
+    def record(self):
+        """
+        Returns the routing parameters and carried information of this transaction
+        as a dictionary, without its logger, so it can be pickled and stored.
+        """
+        
+        return {'to_id' : self.to_id,
+                'command' : self.command,
+                'command_args' : self.command_args,
+                'origin' : self._origin,
+                'attempts' : self.attempts,
+                'id' : self.id,
+                'created' : self.created}
+    
+    @classmethod
+    def from_record(cls, logger, record):
+        """
+        Creates a transaction from a dictionary made by record(). It keeps the
+        id and creation time of the stored transaction, and has no hops.
+        
+        Args:
+            logger: The logger of the new transaction
+            record: The dictionary made by record()
+        """
+        
+        result = cls(logger, record['to_id'], record['command'], 
+                     record['command_args'], record['origin'], record['attempts'])
+        result.id = record['id']
+        result.created = record['created']
+        
+        return result
+    
     def __deepcopy__(self, memo):
         """
-        An override of __deepcopy__ to allow cloning of transactions but allowing
+        An override of __deepcopy__ to allow copying of transactions but allowing
         the logger to be shared across all transactions
         """
         
@@ -90,11 +209,17 @@ class Transaction(object):
         
         memo[id(self)] = result
         
-        for k, v in self.__dict__.items():
+        for k in Transaction.__slots__:
+            v = getattr(self, k)
+            
             if k == '_logger': #skips the deep copy of the logger
                 setattr(result, k, v)
                 continue
             
+            if k == 'journal_key': #the copy is journalled on its own
+                setattr(result, k, None)
+                continue
+            
             setattr(result, k, deepcopy(v, memo)) #deep copies all other attributes
             
         return result
@@ -106,4 +231,17 @@ class Transaction(object):
     
     @property                  
     def origin(self):
-        return self._origin
\ No newline at end of file
+        return self._origin
+
+def _is_immutable(value):
+    """
+    True if value, and everything in it, cannot be changed.
+    """
+    
+    if isinstance(value, _immutable_types):
+        return True
+    
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    
+    return False
\ No newline at end of file
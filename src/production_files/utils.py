@@ -1,5 +1,6 @@
 import os
-import shutil
+import threading
+import paths
 
 '''
 Some helper functions for various parts of the program.
@@ -13,109 +14,51 @@ dict_filename = "dicts_t.cfg"
 
 def get_resource_files_prefix():
     """
-    This returns the absolute file prefix for the resource folder.
-    Uses a breadth-first search of directories.
+    This returns the absolute file prefix for the resource folder, or False
+    if it cannot be found.
     """
-        
-    found = False
-    os.chdir(os.path.abspath(__file__[:-9]))
-    while not found:
-        for directory in os.walk('.').next()[1]:
-            if directory == "resources":
-                found = True
-                break
-        else:
-            os.chdir('..')
-        
-        if os.getcwd == 'home':
-            return False
-        
-    return os.getcwd() + "/resources/"
+    
+    return paths.resource_dir()
 
 def get_image_dir():
     """
     This returns the absolute file location of the image storage directory.
-    Uses a breadth-first search of directories.
-    """
-    
-    found = False
-    os.chdir(os.path.abspath(__file__[:-9]))
-    while not found:
-        for directory in os.walk('.').next()[1]:
-            if directory == "images":
-                found = True
-                break
-        else:
-            os.chdir('..')
-            
-        if os.getcwd == "home":
-            return False
-        
-    return os.getcwd() + "/images/"
+    """
+    
+    return paths.image_dir()
 
 def get_log_dir():
     """
     This returns the absolute file location of the log storage directory.
-    Uses a breadth-first search of directories.
-    """
-    
-    found = False
-    os.chdir(os.path.abspath(__file__[:-9]))
-    while not found:
-        for directory in os.walk('.').next()[1]:
-            if directory == "log":
-                found = True
-                break
-        else:
-            os.chdir('..')
-                
-            if os.getcwd == "home":
-                return False
-            
-        return os.getcwd() + "/log/"
+    """
+    
+    return paths.log_dir()
 
 def clear_image_cache():
     """
-    This erases all the images in the image directory.
+    This erases all the images in the image store, leaving the image directory
+    and its index in place.
     """
     
-    shutil.rmtree("%s." %get_image_dir(), ignore_errors = True)
+    #imported here, as the image store reads its configuration through utils
+    import image_store
+    
+    image_store.get_store().evict(0)
 
 def read_config_dict(header, raw = False):
     """
     Reads from the config file, finds the given header and loads 
     the data in the config to a dictionary and returns it to the caller.
     The raw option skips the casting of integers and lists and is used by the 
-    update_config_dict function.
+    update_config_dict function. The file itself is only read again if it
+    has changed since it was last read.
     
     Arguments:
         raw: If raw is True, then the type flags in front of individual values
              is ignored. Used for writing values to the configuration dictionary.
     """
     
-    dict_file = open(get_resource_files_prefix() + dict_filename, 'r')
-    isHeaderFound = False
-    config_dict = dict()
-    
-    #Reads the dicts.cfg file and finds the relevant section. Converts the
-    #data to a dictionary.
-    for line in dict_file.readlines():
-        line = line.strip() #removes trailing newline
-        
-        if not isHeaderFound:
-            if line == ("start " + header):
-                isHeaderFound = True
-                
-        else:
-            key, colon, value = line.partition(':')            #@UnusedVariable
-            
-            if key == "end":
-                break
-            else:
-                config_dict[key] = value
-            
-    else: #header never found
-        raise BadConfigFileError("Requested header not found")
+    config_dict = _config_store.section(header)
     
     #Casting dictionary values to ints, or a comma-separated string list into
     #a python list of strings, if requested
@@ -135,7 +78,6 @@ def read_config_dict(header, raw = False):
                 current = current.replace("(list)", "")
                 current = current.split(',')
         
-    dict_file.close()
     return config_dict
 
 def update_config_dict(header, new_dict):
@@ -156,32 +98,151 @@ def update_config_dict(header, new_dict):
         if type(new_dict[key]) is list:
             new_dict[key] = "(list)" + ",".join([str(item) for item in new_dict[key]])
         
-    original = read_config_dict(header, raw = True) 
+    _config_store.update(header, new_dict)
+
+class ConfigStore(object):
+    """
+    An in-memory copy of the configuration file. The whole file is parsed once
+    into all of its sections, and is only parsed again when its modification
+    time or size changes. Updates are written through to the file, which is
+    replaced atomically so a crash mid-write cannot truncate it.
     
-    #change and add any values
-    for key in new_dict:
-        original[key] = new_dict[key]
+    Attributes:
+        _filename: The configuration file. Found in the resource directory the
+            first time it is needed if not given.
+        _stamp: The (modification time, size) of the file when last parsed.
+        _lines: The lines of the file, used to rewrite it on updates.
+        _sections: A dictionary of header: raw configuration dictionary pairs.
+    """
+    
+    def __init__(self, filename = None):
+        
+        self._filename = filename
+        self._stamp = None
+        self._lines = []
+        self._sections = {}
+        self._lock = threading.Lock()
+        
+    def section(self, header):
+        """
+        Returns a copy of the raw configuration dictionary with the given header.
+        
+        Raises:
+            BadConfigFileError: The header is not in the configuration file.
+        """
         
-    #change the dictionary into a list of strings
-    updated_dict_list = []
-    for key in original:
-        updated_dict_list.append(str(key) + ":" + str(original[key]))
+        with self._lock:
+            self._refresh()
+            
+            try:
+                return dict(self._sections[header])
+            except KeyError:
+                raise BadConfigFileError("Requested header not found")
+            
+    def update(self, header, new_values):
+        """
+        Changes and adds raw values in the section with the given header, then
+        writes the whole configuration back to the file.
+        
+        Raises:
+            BadConfigFileError: The header is not in the configuration file.
+        """
+        
+        with self._lock:
+            self._refresh()
+            
+            try:
+                section = self._sections[header]
+            except KeyError:
+                raise BadConfigFileError("Requested header not found")
+            
+            section.update(new_values)
+            
+            #find the header entry being updated, and replace its contents
+            start_index = self._lines.index("start " + header)
+            end_index = self._lines.index("end", start_index)
+            self._lines[start_index + 1:end_index] = [str(key) + ":" + str(value)
+                                                    for key, value in section.items()]
+            
+            self._write()
     
-    #open the configuration file and put all the lines in a list
-    with open(get_resource_files_prefix() + dict_filename, 'r') as resource_file:
-        filelist = resource_file.readlines()
+    def invalidate(self):
+        """
+        Forces the file to be parsed again on the next access.
+        """
+        
+        with self._lock:
+            self._stamp = None
     
-    #find the header entry being updated
-    start_index = filelist.index("start " + header + '\n')
-    end_index = filelist.index("end\n", start_index)
+    def _get_filename(self):
+        
+        if self._filename is None:
+            self._filename = get_resource_files_prefix() + dict_filename
+            
+        return self._filename
     
-    #write the updated header's configurations
-    filelist[start_index + 1:end_index] = updated_dict_list
+    def _refresh(self):
+        """
+        Parses the file again if it has changed since it was last parsed.
+        """
+        
+        stat = os.stat(self._get_filename())
+        stamp = (stat.st_mtime, stat.st_size)
+        
+        if stamp == self._stamp:
+            return
+        
+        with open(self._get_filename(), 'r') as dict_file:
+            self._lines = [line.rstrip() for line in dict_file]
+        
+        self._sections = {}
+        current = None
+        
+        #Each section runs from a "start <header>" line to an "end" line
+        for line in self._lines:
+            line = line.strip()
+            
+            if current is None:
+                if line.startswith("start "):
+                    header = line[len("start "):]
+                    
+                    #Only the first section with a given header is used
+                    if header not in self._sections:
+                        current = self._sections[header] = {}
+                    
+            else:
+                key, colon, value = line.partition(':')            #@UnusedVariable
+                
+                if key == "end":
+                    current = None
+                else:
+                    current[key] = value
+        
+        self._stamp = stamp
     
-    #open the file again to write.
-    with open(get_resource_files_prefix() + dict_filename, 'w') as file_to_overwrite:
-        for line in filelist:
-            file_to_overwrite.write("%s\n" %line.rstrip())
+    def _write(self):
+        """
+        Writes the lines to a temporary file, then renames it over the
+        configuration file.
+        """
+        
+        filename = self._get_filename()
+        temp_filename = filename + ".tmp"
+        
+        with open(temp_filename, 'w') as temp_file:
+            for line in self._lines:
+                temp_file.write("%s\n" %line)
+            
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+            
+        os.rename(temp_filename, filename)
+        
+        stat = os.stat(filename)
+        self._stamp = (stat.st_mtime, stat.st_size)
+
+#The configuration shared by everything in the process
+_config_store = ConfigStore()
 
 class BadConfigFileError(Exception):
     """
@@ -3,25 +3,128 @@
 @author: Craig Bryan
 '''
 
-from production_files import router, logger
+from production_files import router, logger, telemetry
 import traceback
 from time import sleep
 import os
+import sys
+import threading
 from production_files import utils
 import time
 
 count = 0
+
+#Seconds to wait before replacing a router that failed while running
+restart_delay = 1
+
+#The daily restart. The restart entry of the Router configuration chooses how:
+#"process" drains the queue, shuts the router down and re-executes this
+#process, "router" drains the queue and only replaces the router, keeping the
+#hardware and web sessions as after an error, and "reboot" reboots the 
+#machine as startup.py always did. A full reboot is otherwise only done when
+#routers keep failing to start.
+restart_modes = ("process", "router", "reboot")
+restart_interval = 86400
+
+#Seconds a restart waits for the queued transactions to be processed, and for
+#the receivers to finish their uploads and posts. Transactions left are kept
+#in the journal for the next router, and uploads in the upload pool's file.
+drain_timeout = 60
+
+#Tells the process started by a restart when, and how, the old one stopped
+restart_variable = "PELLINGLAB_RESTARTED"
+
+#Set by a timer once the restart is due, so the router loop only checks a flag
+restart_due = threading.Event()
+
 logr = logger.Logger("system_status")
 running = True
 print utils.get_log_dir()
 
+def schedule_restart(interval):
+    """
+    Sets restart_due once the given number of seconds has passed.
+    """
+    
+    restart_due.clear()
+    timer = threading.Timer(interval, restart_due.set)
+    timer.daemon = True
+    timer.start()
+
+def reboot():
+    """
+    Reboots the machine, once the buffered log messages are written.
+    """
+    
+    logger.flush_all()
+    os.system("sudo reboot")
+
+def restart(r, mode):
+    """
+    Drains the router's queue and shuts it down, then re-executes the process,
+    or reboots the machine. In "router" mode the router is only closed, so 
+    its sessions are kept for the next one, and it returns, leaving the 
+    caller to create the new router.
+    
+    Returns:
+        The time the router was shut down, once it had drained its queue, for
+        report_restart.
+    """
+    
+    start = time.time()
+    left = r.drain(drain_timeout)
+    drained = time.time()
+    
+    logr.log("Daily restart of the %s. Drained the queue in %.1f s, %d transactions "
+             "left in the journal" %(mode, drained - start, left))
+    telemetry.record("restart_drained", mode = mode, left = left,
+                     duration_ms = (drained - start) * 1000)
+    
+    if mode == "reboot":
+        r.reboot()
+        return drained
+    
+    #uploads finishing meanwhile are reported to the new router
+    if mode == "router":
+        r.close()
+    else:
+        r.shutdown()
+    
+    stopped = time.time()
+    
+    if mode == "process":
+        os.environ[restart_variable] = "%f %s" %(stopped, mode)
+        
+        #the new process inherits no files, sockets or serial ports
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    
+    return stopped
+
+def report_restart(stopped, mode):
+    """
+    Logs the time from the old router being shut down, after its drain, to the
+    new router being ready, and records it as telemetry. The drain is logged
+    on its own by restart().
+    """
+    
+    downtime = time.time() - stopped
+    
+    logr.log("Restarted the %s in %.1f s" %(mode, downtime))
+    telemetry.record("restart", mode = mode, duration_ms = downtime * 1000)
+
+#Set when this process was started by a restart, until it is reported
+restarted = os.environ.pop(restart_variable, None)
+
+if restarted is not None:
+    restarted = restarted.split()
+    restarted = (float(restarted[0]), restarted[1])
+
+restart_scheduled = False
+
 start_time = time.time();
 try:
     while(running):
-        if(time.time() - start_time > 86400):
-            logr.log("Normal daily restart routine")
-            os.system("sudo reboot")  
-            
         try:
             r = router.Router()
         except Exception as e:
@@ -29,31 +132,62 @@ try:
             print traceback.format_exc(e)
             logr.log("Exception on router instantiation: %s" %str(e))
             count += 1
-    
+            
+            #The failed health check that still reboots the machine
             if count > 3:
-                os.system("sudo reboot")
-    
+                reboot()
+            
             sleep(60)
             continue
         else:
             count = 0
             
-            while(True):
-                if(time.time() - start_time > 86400):
-                        os.system("sudo reboot")
+            if restarted is not None:
+                report_restart(*restarted)
+                restarted = None
+            
+            #The first restart is timed from when the process started
+            if not restart_scheduled:
+                interval = r.settings.get('restart_interval', restart_interval)
+                schedule_restart(max(0, start_time + interval - time.time()))
+                restart_scheduled = True
             
+            while(True):
+                if restart_due.is_set():
+                    mode = r.settings.get('restart', "process")
+                    
+                    if mode not in restart_modes:
+                        logr.log("Unknown restart mode %s, restarting the process"
+                                 %mode)
+                        mode = "process"
+                    
+                    restarted = (restart(r, mode), mode)
+                    schedule_restart(r.settings.get('restart_interval',
+                                                    restart_interval))
+                    del r
+                    break
+                
                 try:
                     r.next()
                 except Exception as e:
                     print "Exception during router running: %s" %str(e)
                     print traceback.format_exc(e)
                     logr.log("Exception during router running: %s" %str(e))
-                    sleep(60)
+                    
+                    #The new router reuses the hardware and web sessions, so it
+                    #is created straight away, waiting longer each time errors
+                    #follow one another. The replies of uploads that finish
+                    #meanwhile are kept by the upload pool for the new router.
+                    sleep(restart_delay)
+                    restart_delay = min(restart_delay * 2, 60)
+                    r.close()
                     del r
                     break
+                else:
+                    restart_delay = 1
                 
 except Exception as e:
     logr.log(e);
     print traceback.format_exc(e)
-    os.system("sudo reboot")
-    
+    reboot()
+    
\ No newline at end of file
@@ -0,0 +1,46 @@
+'''
+Unit tests of the production files. Run from the src directory:
+    python -m unittest discover -s tests -t .
+
+The resources, images and logs used by the code under test are kept in a
+temporary directory, which is removed once the tests have run. Its
+configuration file only has the Router section, and the sections the
+translator reads.
+'''
+
+import atexit
+import os
+import shutil
+import tempfile
+
+temp_dir = tempfile.mkdtemp()
+
+for name, variable in (("resources", 'PELLINGLAB_RESOURCE_DIR'),
+                       ("images", 'PELLINGLAB_IMAGE_DIR'),
+                       ("log", 'PELLINGLAB_LOG_DIR')):
+    os.mkdir(os.path.join(temp_dir, name))
+    os.environ[variable] = os.path.join(temp_dir, name)
+
+with open(os.path.join(temp_dir, "resources", "dicts_t.cfg"), 'w') as config:
+    config.write("start Router\n"
+                 "num_samples:(int)12\n"
+                 "journal:off\n"
+                 "end\n"
+                 "start CommandArguments\n"
+                 "sample:(list)a,s\n"
+                 "help:(list)s,c\n"
+                 "test:(list)r\n"
+                 "end\n"
+                 "start HelpStrings\n"
+                 "default:Tweet sample(n) to see sample n\n"
+                 "bad:No help for that\n"
+                 "sample:sample(n) -a -s\n"
+                 "s:The syntax is cmd(n, m) -x\n"
+                 "c:The commands are sample and help\n"
+                 "end\n"
+                 "start TestWhiteList\n"
+                 "1:pellinglab\n"
+                 "end\n")
+
+#registered before the logger's flush, so it runs after it
+atexit.register(shutil.rmtree, temp_dir, True)
@@ -0,0 +1,137 @@
+'''
+Tests of the order the camera captures several samples in, and of the homing
+that keeps its drift within the budget, against the fake Arduino board.
+'''
+
+import math
+import unittest
+
+from benchmarks.fake_arduino import FakeArduino
+from production_files.receivers import motion_planner
+from production_files.receivers.camera_communicator import (BoardCommunicator,
+        CameraCommunicator, CameraPosition, Lights)
+
+class NullLogger(object):
+
+    def log(self, *messages):
+        pass
+
+class RecordingCamera(object):
+    """
+    Stands in for the Camera, keeping the samples it is asked for.
+    """
+    
+    def __init__(self):
+        
+        self.samples = []
+    
+    def get_image(self, sample_num):
+        
+        self.samples.append(sample_num)
+        return "now", "image%d" %sample_num
+    
+    def idle(self):
+        pass
+    
+    def release(self):
+        pass
+
+class CapturePlanTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.board = FakeArduino()
+        board_comm = BoardCommunicator(self.board.port, boot_delay = 0,
+                                       request_terminator = "\n")
+        
+        #the handshake, and the homing done on connecting
+        del self.board.received[:]
+        
+        self.camera = CameraCommunicator.__new__(CameraCommunicator)
+        self.camera._logger = NullLogger()
+        self.camera._board_comm = board_comm
+        self.camera._lights = Lights(board_comm)
+        self.camera._camera_positions = CameraPosition(board_comm, 1000, 1000, 1000)
+        self.camera.cam = RecordingCamera()
+        self.camera.path_strategy = "nearest"
+        self.camera.drift_budget = 0
+    
+    def tearDown(self):
+        
+        self.camera.cleanup()
+        self.board.close()
+    
+    def test_plans(self):
+        
+        self.camera.sample_positions = [(10, 0, 0), (0, 12, 0), (100, 0, 0),
+                                        (0, 100, 0)]
+        samples = [1, 2, 3, 4]
+        
+        #1, 2 and 3 are close together, 4 is far from them
+        short = math.hypot(10, 12)
+        diagonal = math.hypot(100, 100)
+        
+        for strategy, order, travel in (
+                ("given", [1, 2, 3, 4], 10 + short + math.hypot(100, 12) +
+                                        diagonal + 100),
+                ("nearest", [1, 2, 4, 3], 10 + short + 88 + diagonal + 100),
+                ("two_opt", [1, 3, 4, 2], 10 + 90 + diagonal + 88 + 12)):
+            planned_order, planned_travel = self.camera.plan_captures(samples,
+                                                                      strategy)
+            
+            self.assertEqual(planned_order, order, strategy)
+            self.assertAlmostEqual(planned_travel, travel)
+        
+        #the configured strategy is used if none is given
+        self.assertEqual(self.camera.plan_captures(samples)[0], [1, 2, 4, 3])
+    
+    def test_duplicates_planned_once(self):
+        
+        self.camera.sample_positions = [(30, 0, 0), (10, 0, 0), (20, 0, 0)]
+        
+        self.assertEqual(self.camera.plan_captures([1, 3, 1, 2, 3]),
+                         ([2, 3, 1], 60))
+    
+    def test_capture_in_planned_order(self):
+        
+        self.camera.sample_positions = [(30, 0, 0), (10, 0, 0), (20, 0, 0)]
+        
+        images = self.camera.get_sample_images([1, 2, 3])
+        
+        self.assertEqual(images, [(2, "now", "image2"), (3, "now", "image3"),
+                                  (1, "now", "image1")])
+        self.assertEqual(self.board.received,
+                         ["m a 10 0 0", "l i 1", "l o",
+                          "m a 20 0 0", "l i 2", "l o",
+                          "m a 30 0 0", "l i 0", "l o", "h"])
+    
+    def test_drift_budget(self):
+        
+        self.camera.sample_positions = [(30, 0, 0), (10, 0, 0), (20, 0, 0)]
+        self.camera.drift_budget = 25
+        
+        self.camera.get_sample_images([1, 2, 3])
+        
+        #20 has been travelled by sample 3, and sample 1 is 10 further
+        self.assertEqual(self.board.received,
+                         ["m a 10 0 0", "l i 1", "l o",
+                          "m a 20 0 0", "l i 2", "l o",
+                          "h", "m a 30 0 0", "l i 0", "l o", "h"])
+        self.assertEqual(self.camera._camera_positions.get_position(),
+                         motion_planner.home)
+    
+    def test_drift_budget_per_sample(self):
+        
+        self.camera.sample_positions = [(30, 0, 0), (10, 0, 0), (20, 0, 0)]
+        self.camera.drift_budget = 5
+        
+        self.camera.get_sample_images([1, 2, 3])
+        
+        #every move is over budget, but the first from home is never homed
+        self.assertEqual([command for command in self.board.received
+                          if command[0] in "hm"],
+                         ["m a 10 0 0", "h", "m a 20 0 0", "h", "m a 30 0 0",
+                          "h"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+'''
+Tests of the FrameGrabber, with a fake capture that replays the frames its
+driver buffered before the camera moved.
+'''
+
+import numpy
+import threading
+import unittest
+
+from production_files.receivers.frame_grabber import (FrameGrabber, brightness,
+                                                      CaptureFailedException)
+
+class ReplayCapture(object):
+    """
+    A VideoCapture stand-in that returns the frames it is given, at the
+    brightness of each, then the last one for ever. Frames can be buffered
+    again with replay(), like the frames a driver takes while the stream is
+    idle.
+    """
+    
+    def __init__(self, levels, shape = (48, 64)):
+        
+        self.shape = shape
+        self.reads = 0
+        self._levels = list(levels)
+        self._lock = threading.Lock()
+    
+    def replay(self, levels):
+        
+        with self._lock:
+            self._levels = list(levels)
+    
+    def read(self, image = None):
+        
+        with self._lock:
+            self.reads += 1
+            
+            if len(self._levels) > 1:
+                level = self._levels.pop(0)
+            else:
+                level = self._levels[0]
+        
+        if level is None:
+            return False, None
+        
+        if image is None:
+            image = numpy.empty(self.shape, numpy.uint8)
+        
+        image.fill(level)
+        
+        return True, image
+
+class FrameGrabberTest(unittest.TestCase):
+
+    def tearDown(self):
+        
+        self.grabber.stop()
+    
+    def test_stale_frames_flushed(self):
+        
+        #four dark frames taken before the light came on, then the lit ones
+        capture = ReplayCapture([20, 20, 20, 20, 180])
+        self.grabber = FrameGrabber(capture, flush_frames = 4)
+        
+        frame = self.grabber.capture(2)
+        
+        self.assertEqual(brightness(frame), 180)
+        self.assertEqual(self.grabber.discarded, 5)
+    
+    def test_stale_frames_flushed_after_idle(self):
+        
+        capture = ReplayCapture([180])
+        self.grabber = FrameGrabber(capture, flush_frames = 4)
+        
+        self.assertEqual(brightness(self.grabber.capture(2)), 180)
+        self.grabber.idle()
+        
+        #taken at the last sample while idle, and the move to a darker one
+        capture.replay([180, 180, 180, 90, 60, 60])
+        
+        self.assertEqual(brightness(self.grabber.capture(2)), 60)
+    
+    def test_settles(self):
+        
+        capture = ReplayCapture([20, 100, 150, 170, 171, 171])
+        self.grabber = FrameGrabber(capture, flush_frames = 0)
+        
+        self.assertEqual(brightness(self.grabber.capture(2)), 171)
+        self.assertEqual(self.grabber.discarded, 4)
+    
+    def test_max_frames(self):
+        
+        capture = ReplayCapture(range(10, 250, 10))
+        self.grabber = FrameGrabber(capture, flush_frames = 2, max_frames = 5)
+        
+        #the latest frame once max_frames have been judged
+        self.assertEqual(brightness(self.grabber.capture(2)), 70)
+        self.assertEqual(self.grabber.discarded, 6)
+    
+    def test_failed_reads(self):
+        
+        capture = ReplayCapture([None])
+        self.grabber = FrameGrabber(capture, max_failures = 3)
+        
+        self.assertRaises(CaptureFailedException, self.grabber.capture, 2)
+
+if __name__ == "__main__":
+    unittest.main()
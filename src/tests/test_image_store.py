@@ -0,0 +1,130 @@
+'''
+Tests of the image store's index, and of its eviction of images once they
+pass the disk budget.
+'''
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from production_files.image_store import ImageStore
+
+#The bytes of every test image, and a budget that holds two of them
+image_size = 400
+budget_mb = 1000.0 / (1024 * 1024)
+
+class ImageStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.store = ImageStore(self.directory, budget_mb)
+        self.taken = datetime.datetime(2026, 10, 17, 14, 25, 1)
+    
+    def tearDown(self):
+        
+        self.store.close()
+        shutil.rmtree(self.directory)
+    
+    def capture(self, sample = 1, written = True):
+        """
+        Adds an image to the store and writes it, as the camera does.
+        """
+        
+        filename = self.store.new_image(sample, self.taken, "jpg")
+        self.taken += datetime.timedelta(seconds = 1)
+        
+        with open(filename, 'wb') as image:
+            image.write("x" * image_size)
+        
+        if written:
+            self.store.written(filename)
+        
+        #so the images are used in the order they are captured
+        time.sleep(0.01)
+        
+        return filename
+    
+    def kept(self, filenames):
+        
+        return [self.store.contains(filename) and os.path.isfile(filename)
+                for filename in filenames]
+    
+    def test_index(self):
+        
+        self.store.budget = 10 * image_size
+        first = self.capture(3)
+        second = self.capture(3)
+        self.capture(4)
+        
+        self.assertTrue(first.startswith(self.directory))
+        self.assertTrue("/sample03/" in first)
+        self.assertEqual([filename for taken, filename in self.store.find(3)],  #@UnusedVariable
+                         [first, second])
+        self.assertEqual(self.store.latest(3)[1], second)
+        self.assertEqual(self.store.latest(5), None)
+    
+    def test_evicts_least_recently_used(self):
+        
+        images = [self.capture() for i in range(2)]
+        
+        #the first image is used again, so the second is evicted instead
+        self.store.touch(images[0])
+        images.append(self.capture())
+        
+        self.assertEqual(self.kept(images), [True, False, True])
+        self.assertEqual(self.store.usage(), 2 * image_size)
+    
+    def test_usage_is_kept_across_stores(self):
+        
+        for i in range(5):
+            self.capture()
+        
+        self.assertEqual(self.store.usage(), 2 * image_size)
+        
+        #an image written twice is only counted once
+        self.store.written(self.store.find(1)[-1][1])
+        self.assertEqual(self.store.usage(), 2 * image_size)
+        
+        self.store.close()
+        self.store = ImageStore(self.directory, budget_mb)
+        
+        self.assertEqual(self.store.usage(), 2 * image_size)
+    
+    def test_skips_images_waiting_for_upload(self):
+        
+        uploading = set()
+        self.store.uploading = uploading.__contains__
+        
+        images = [self.capture() for i in range(2)]
+        uploading.update(images)
+        
+        #an uploaded image is evicted even if its upload is not yet reported
+        self.store.set_link(images[1], "link")
+        time.sleep(0.01)
+        
+        images.append(self.capture())
+        
+        self.assertEqual(self.kept(images), [True, False, True])
+        
+        #once uploaded, the image waiting is evicted like any other
+        uploading.clear()
+        images.append(self.capture())
+        
+        self.assertEqual(self.kept(images), [False, False, True, True])
+    
+    def test_evict_everything(self):
+        
+        images = [self.capture() for i in range(2)]
+        being_written = self.capture(written = False)
+        
+        self.assertEqual(self.store.evict(0), 2)
+        self.assertEqual(self.kept(images), [False, False])
+        self.assertTrue(self.store.contains(being_written))
+        self.assertEqual(self.store.usage(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
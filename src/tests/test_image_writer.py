@@ -0,0 +1,84 @@
+'''
+Tests of the image writer's handling of images that could not be written,
+and of failing written callbacks.
+'''
+
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from production_files.receivers import image_writer
+from production_files.receivers.image_writer import ImageWriter, ImageWriteError
+
+class ImageWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.writer = ImageWriter({'encode_workers' : 1})
+        self.frame = numpy.zeros((8, 8, 3), numpy.uint8)
+    
+    def tearDown(self):
+        
+        self.writer.close()
+        shutil.rmtree(self.directory)
+    
+    def filename(self, name, directory = None):
+        
+        return os.path.join(directory or self.directory, name + ".jpg")
+    
+    def test_written(self):
+        
+        written = []
+        filename = self.filename("a")
+        
+        self.writer.submit(filename, self.frame, written.append).result(5)
+        
+        self.assertEqual(image_writer.wait_for(filename), filename)
+        self.assertTrue(os.path.isfile(filename))
+        self.assertEqual(written, [filename])
+        self.assertFalse(filename in image_writer._pending)
+    
+    def test_failing_callback_does_not_fail_the_image(self):
+        
+        def written(filename):
+            raise OSError("The index is locked")
+        
+        filename = self.filename("a")
+        pending = self.writer.submit(filename, self.frame, written)
+        
+        self.assertEqual(pending.result(5), filename)
+        self.assertEqual(image_writer.wait_for(filename, 5), filename)
+    
+    def test_failed_image_raises_for_waiters(self):
+        
+        filename = self.filename("a", os.path.join(self.directory, "missing"))
+        written = []
+        
+        pending = self.writer.submit(filename, self.frame, written.append)
+        
+        self.assertRaises(ImageWriteError, pending.result, 5)
+        self.assertRaises(ImageWriteError, image_writer.wait_for, filename, 5)
+        self.assertEqual(written, [])
+    
+    def test_failed_images_are_bounded(self):
+        
+        missing = os.path.join(self.directory, "missing")
+        first = self.filename("0", missing)
+        
+        for i in range(image_writer.failed_kept + 1):
+            self.assertRaises(ImageWriteError, self.writer.submit(
+                    self.filename(str(i), missing), self.frame).result, 5)
+        
+        self.assertEqual(len(image_writer._failed), image_writer.failed_kept)
+        self.assertFalse(first in image_writer._pending)
+        
+        #the oldest failure is forgotten, so waiting for it returns at once
+        self.assertEqual(image_writer.wait_for(first), first)
+        self.assertRaises(ImageWriteError, image_writer.wait_for, 
+                          self.filename(str(image_writer.failed_kept), missing))
+
+if __name__ == "__main__":
+    unittest.main()
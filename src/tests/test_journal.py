@@ -0,0 +1,192 @@
+'''
+Tests of the transaction journal: replaying the unfinished transactions,
+compaction, and reading a journal whose last write was cut off.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from production_files.journal import Journal
+from production_files.transaction import Transaction
+
+def transaction(i):
+
+    return Transaction(None, "camera", "get_image", i, "user%d" %i)
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "test.journal")
+        self.journals = []
+    
+    def tearDown(self):
+        
+        for journal in self.journals:
+            journal.close()
+        
+        shutil.rmtree(self.directory)
+    
+    def open(self, **kwargs):
+        
+        kwargs.setdefault('commit_interval', 0)
+        journal = Journal(self.filename, **kwargs)
+        self.journals.append(journal)
+        
+        return journal
+    
+    def recovered_args(self, journal):
+        
+        return [record['command_args'] for key, record in journal.recovered]  #@UnusedVariable
+    
+    def test_replays_unfinished_in_queued_order(self):
+        
+        journal = self.open()
+        transactions = [transaction(i) for i in range(4)]
+        
+        for t in transactions:
+            journal.put(t)
+        
+        journal.complete(transactions[1])
+        
+        #a transaction queued again keeps its key, and its place
+        transactions[0].attempts = 2
+        journal.put(transactions[0])
+        journal.close()
+        
+        journal = self.open()
+        
+        self.assertEqual(self.recovered_args(journal), [0, 2, 3])
+        self.assertEqual([key for key, record in journal.recovered],   #@UnusedVariable
+                         [transactions[i].journal_key for i in (0, 2, 3)])
+        self.assertEqual(journal.recovered[0][1]['attempts'], 2)
+        self.assertEqual(journal.recovered[0][1]['id'], transactions[0].id)
+        self.assertEqual(journal.pending(), 3)
+    
+    def test_new_keys_follow_recovered(self):
+        
+        journal = self.open()
+        old = transaction(0)
+        journal.put(old)
+        journal.close()
+        
+        new = transaction(1)
+        self.open().put(new)
+        
+        self.assertTrue(new.journal_key > old.journal_key)
+    
+    def test_complete_of_unjournaled_is_ignored(self):
+        
+        journal = self.open()
+        journal.complete(transaction(0))
+        journal.close()
+        
+        self.assertEqual(os.path.getsize(self.filename), 0)
+    
+    def test_group_commit_written_on_close(self):
+        
+        journal = self.open(commit_interval = 60)
+        journal.put(transaction(0))
+        journal.close()
+        
+        self.assertEqual(self.recovered_args(self.open()), [0])
+    
+    def test_compacts_to_live_transactions(self):
+        
+        journal = self.open(compact_min = 10, compact_ratio = 2)
+        kept = transaction(-1)
+        journal.put(kept)
+        
+        for i in range(50):
+            t = transaction(i)
+            journal.put(t)
+            journal.complete(t)
+        
+        #the journal was rewritten more than once, so it never held all 101
+        #entries
+        self.assertTrue(journal._entries < 10)
+        
+        journal.close()
+        journal = self.open()
+        
+        self.assertEqual(self.recovered_args(journal), [-1])
+    
+    def test_opening_compacts(self):
+        
+        journal = self.open()
+        transactions = [transaction(i) for i in range(5)]
+        
+        for t in transactions:
+            journal.put(t)
+        for t in transactions[:4]:
+            journal.complete(t)
+        
+        journal.close()
+        written = os.path.getsize(self.filename)
+        
+        self.open().close()
+        
+        self.assertTrue(os.path.getsize(self.filename) < written)
+        self.assertEqual(self.recovered_args(self.open()), [4])
+    
+    def write_three(self):
+        """
+        Journals three transactions, and returns the offset each entry ends at.
+        """
+        
+        journal = self.open()
+        ends = []
+        
+        for i in range(3):
+            journal.put(transaction(i))
+            ends.append(os.path.getsize(self.filename))
+        
+        journal.close()
+        
+        return ends
+    
+    def test_stops_at_bad_crc(self):
+        
+        ends = self.write_three()
+        
+        with open(self.filename, 'r+b') as journal_file:
+            journal_file.seek(ends[1] + 20)
+            byte = journal_file.read(1)
+            journal_file.seek(ends[1] + 20)
+            journal_file.write(chr(ord(byte) ^ 0xff))
+        
+        self.assertEqual(self.recovered_args(self.open()), [0, 1])
+    
+    def test_stops_at_cut_off_entry(self):
+        
+        ends = self.write_three()
+        
+        with open(self.filename, 'r+b') as journal_file:
+            journal_file.truncate(ends[2] - 3)
+        
+        journal = self.open()
+        self.assertEqual(self.recovered_args(journal), [0, 1])
+        
+        #the cut off entry is dropped when the journal is compacted, so entries
+        #appended after it are read back
+        journal.put(transaction(3))
+        journal.close()
+        
+        self.assertEqual(self.recovered_args(self.open()), [0, 1, 3])
+    
+    def test_closed_journal_raises(self):
+        
+        journal = self.open()
+        t = transaction(0)
+        journal.put(t)
+        journal.close()
+        
+        self.assertRaises(ValueError, journal.put, transaction(1))
+        self.assertRaises(ValueError, journal.complete, t)
+        self.assertEqual(self.recovered_args(self.open()), [0])
+
+if __name__ == "__main__":
+    unittest.main()
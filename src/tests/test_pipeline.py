@@ -0,0 +1,172 @@
+'''
+Tests of the pipeline executor, and of how often a Router in pipeline mode
+polls the twitter receiver.
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from production_files.dead_letters import DeadLetterStore
+from production_files.router import Router
+from production_files.session import SessionManager
+from production_files.receivers.receiver import Receiver
+
+class NullLogger(object):
+
+    def log(self, *messages):
+        pass
+
+class PollReceiver(Receiver):
+    """
+    Counts its polls, and schedules the next one interval seconds after the
+    last, as the twitter receiver does.
+    """
+    
+    interval = 10
+    
+    def __init__(self, router, r_id):
+        
+        super(PollReceiver, self).__init__(router, r_id)
+        
+        self.polls = 0
+        self._polled = 0
+    
+    def process_transaction(self, transaction):
+        
+        if transaction.command == "update":
+            self.polls += 1
+            self._polled = time.time()
+        
+        transaction.process(success = True, allow_log = False)
+    
+    def next_work_time(self):
+        
+        return self._polled + self.interval
+
+class StageReceiver(Receiver):
+    """
+    Passes a request on to the next stage, once the release event is set.
+    """
+    
+    stages = {'translator' : "camera", 'camera' : None}
+    
+    def __init__(self, router, r_id, release):
+        
+        super(StageReceiver, self).__init__(router, r_id)
+        
+        self.release = release
+        self.finished = 0
+    
+    def process_transaction(self, transaction):
+        
+        self.release.wait(5)
+        
+        if self.stages[self.r_id] is None:
+            self.finished += 1
+            transaction.process(success = True, allow_log = False)
+        else:
+            transaction.process(success = True, finished = False, allow_log = False)
+            transaction.to_id = self.stages[self.r_id]
+
+class StubRouter(Router):
+
+    def __init__(self, release, **kwargs):
+        
+        self.release = release
+        super(StubRouter, self).__init__(**kwargs)
+    
+    def _create_receivers(self, gui_communicator):
+        
+        self._add_receiver(PollReceiver(self, "twitter"))
+        
+        for r_id in StageReceiver.stages:
+            self._add_receiver(StageReceiver(self, r_id, self.release))
+    
+    def receiver(self, r_id):
+        
+        return self._route(r_id)[0]
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.release = threading.Event()
+        self.release.set()
+        self.dead_letters = DeadLetterStore(os.path.join(self.directory, 
+                                                         "dead_letters.sqlite"))
+        self.router = StubRouter(self.release, logger = NullLogger(), 
+                                 pipeline = True, journal = False, max_idle = 0.05,
+                                 sessions = SessionManager(),
+                                 dead_letter_store = self.dead_letters)
+    
+    def tearDown(self):
+        
+        self.release.set()
+        self.router.close()
+        self.dead_letters.close()
+        shutil.rmtree(self.directory)
+    
+    def queue(self, num):
+        
+        for i in range(num):
+            self.router.create_transaction(to_id = "translator", command = "stage",
+                                           command_args = i, origin = "user%d" %i)
+    
+    def run_router(self, seconds):
+        
+        end = time.time() + seconds
+        
+        while time.time() < end:
+            self.router.next()
+    
+    def test_completions_do_not_poll_twitter(self):
+        
+        self.queue(50)
+        self.run_router(0.3)
+        
+        self.assertEqual(self.router.receiver("camera").finished, 50)
+        self.assertEqual(self.router.receiver("twitter").polls, 1)
+    
+    def test_polls_are_scheduled_by_time(self):
+        
+        PollReceiver.interval = 0.1
+        
+        try:
+            self.run_router(0.45)
+        finally:
+            PollReceiver.interval = 10
+        
+        polls = self.router.receiver("twitter").polls
+        self.assertTrue(3 <= polls <= 6, polls)
+    
+    def test_join(self):
+        
+        self.release.clear()
+        self.queue(3)
+        
+        self.assertFalse(self.router._executor.join(0.05))
+        self.assertTrue(self.router._executor.pending() > 0)
+        
+        self.release.set()
+        
+        self.assertTrue(self.router._executor.join(5))
+        self.assertEqual(self.router._executor.pending(), 0)
+        self.assertEqual(self.router.receiver("camera").finished, 3)
+    
+    def test_join_returns_once_stopped(self):
+        
+        self.release.clear()
+        self.queue(3)
+        
+        threading.Timer(0.05, self.router._executor.stop, 
+                        kwargs = {'wait' : False}).start()
+        
+        self.assertFalse(self.router._executor.join(5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+'''
+Tests of the Router's retries of failed transactions after a backoff, and of
+the dead letters it keeps of the transactions it gives up on.
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from production_files.dead_letters import DeadLetterStore
+from production_files.journal import Journal
+from production_files.router import Router
+from production_files.session import SessionManager
+from production_files.receivers.receiver import Receiver
+
+class NullLogger(object):
+
+    def log(self, *messages):
+        pass
+
+class IdleReceiver(Receiver):
+    """
+    Takes the router's polls.
+    """
+    
+    def process_transaction(self, transaction):
+        
+        transaction.process(success = True, allow_log = False)
+
+class FailingReceiver(Receiver):
+    """
+    Fails a transaction until it has been attempted failures times, or raises
+    if its command is "raise". Hands a "translate" transaction on as a 
+    "get_image" one, calling requeue() as the translator does, and a "parse"
+    one as a "translate" one without processing it. Keeps the time of every
+    attempt, by command arguments.
+    """
+    
+    retry_backoff = 0.05
+    retry_backoff_max = 0.2
+    
+    def __init__(self, router, r_id):
+        
+        super(FailingReceiver, self).__init__(router, r_id)
+        
+        self.failures = 0
+        self.attempts = {}
+        self.processed = []
+    
+    def process_transaction(self, transaction):
+        
+        tries = self.attempts.setdefault(transaction.command_args, [])
+        tries.append(time.time())
+        
+        if transaction.command == "raise":
+            raise ValueError("The camera is unplugged")
+        
+        if transaction.command == "translate":
+            transaction.command = "get_image"
+            transaction.requeue()
+            return
+        
+        if transaction.command == "parse":
+            transaction.command = "translate"
+            return
+        
+        if len(tries) <= self.failures:
+            transaction.process(success = False)
+        else:
+            self.processed.append(transaction.command_args)
+            transaction.process(success = True, allow_log = False)
+
+class StubRouter(Router):
+
+    def _create_receivers(self, gui_communicator):
+        
+        self._add_receiver(IdleReceiver(self, "twitter"))
+        self._add_receiver(FailingReceiver(self, "camera"))
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.dead_letters = DeadLetterStore(os.path.join(self.directory, 
+                                                         "dead_letters.sqlite"))
+        self.router = StubRouter(logger = NullLogger(), pipeline = False,
+                                 attempt_threshold = 3, max_idle = 0.05,
+                                 sessions = SessionManager(),
+                                 dead_letter_store = self.dead_letters,
+                                 journal = Journal(os.path.join(self.directory, 
+                                                                "test.journal"),
+                                                   commit_interval = 0))
+        self.camera = self.router._route("camera")[0]
+    
+    def tearDown(self):
+        
+        self.router.close()
+        self.dead_letters.close()
+        shutil.rmtree(self.directory)
+    
+    def queue(self, command_args, command = "get_image", to_id = "camera"):
+        
+        self.router.create_transaction(to_id = to_id, command = command, 
+                                       command_args = command_args, 
+                                       origin = "user")
+    
+    def run_router(self, seconds):
+        
+        end = time.time() + seconds
+        
+        while time.time() < end:
+            self.router.next()
+    
+    def test_retried_after_backoff(self):
+        
+        self.camera.failures = 1
+        self.queue(1)
+        self.router.next()
+        
+        #held back, not queued again at once
+        self.assertEqual(len(self.router._transactions), 0)
+        self.assertEqual(len(self.router._delayed), 1)
+        
+        #others are processed while it waits
+        self.camera.failures = 0
+        self.queue(2)
+        self.router.next()
+        
+        self.assertEqual(self.camera.processed, [2])
+        
+        self.camera.failures = 1
+        self.run_router(0.3)
+        
+        self.assertEqual(self.camera.processed, [2, 1])
+        
+        first, second = self.camera.attempts[1]
+        self.assertTrue(second - first >= self.camera.retry_backoff * 0.5)
+        self.assertEqual(self.router._journal.pending(), 0)
+        self.assertEqual(len(self.dead_letters), 0)
+    
+    def test_hand_off_not_delayed(self):
+        
+        self.queue(1, command = "parse")
+        
+        for i in range(3):
+            self.router.next()
+        
+        self.assertEqual(self.camera.processed, [1])
+        self.assertEqual(len(self.router._delayed), 0)
+        
+        tries = self.camera.attempts[1]
+        self.assertEqual(len(tries), 3)
+        self.assertTrue(tries[-1] - tries[0] < self.camera.retry_backoff * 0.5)
+        self.assertEqual(self.router._journal.pending(), 0)
+        self.assertEqual(len(self.dead_letters), 0)
+    
+    def test_failure_after_hand_off_delayed(self):
+        
+        self.camera.failures = 3
+        self.queue(1, command = "translate")
+        self.router.next()
+        self.router.next()
+        
+        #the hand off was not a failure, the attempt after it was
+        self.assertEqual(len(self.router._transactions), 0)
+        self.assertEqual(len(self.router._delayed), 1)
+        self.assertEqual(self.router._delayed[0][2].attempts, 1)
+    
+    def test_dead_letter_after_threshold(self):
+        
+        self.camera.failures = 10
+        self.queue(1)
+        self.run_router(1)
+        
+        self.assertEqual(len(self.camera.attempts[1]), 3)
+        
+        letters = self.dead_letters.letters()
+        self.assertEqual(len(letters), 1)
+        self.assertEqual((letters[0].receiver, letters[0].command, letters[0].origin,
+                          letters[0].attempts), ("camera", "get_image", "user", 3))
+        self.assertTrue("too many" in letters[0].reason)
+        self.assertEqual(self.router._journal.pending(), 0)
+    
+    def test_backoff_doubles(self):
+        
+        self.camera.failures = 10
+        self.queue(1)
+        self.run_router(1)
+        
+        tries = self.camera.attempts[1]
+        
+        #each wait is at least half the backoff for its attempt
+        self.assertTrue(tries[1] - tries[0] >= 0.025)
+        self.assertTrue(tries[2] - tries[1] >= 0.05)
+    
+    def test_unrouted_is_dead_letter(self):
+        
+        self.queue(1, to_id = "microscope")
+        self.router.next()
+        
+        letters = self.dead_letters.letters()
+        self.assertEqual([(letter.receiver, letter.reason) for letter in letters],
+                         [("microscope", "Transaction routed to no receiver")])
+    
+    def test_exceptions_count_as_attempts(self):
+        
+        self.queue(1, command = "raise")
+        transaction = self.router._transactions.pop()
+        self.router._transactions.push(transaction)
+        
+        for attempts in (1, 2):
+            self.assertRaises(ValueError, self.router.next)
+            self.assertEqual(transaction.attempts, attempts)
+            
+            #journaled with its attempts, for the router that replaces this one
+            self.assertEqual(self.router._journal.pending(), 1)
+            self.assertEqual(len(self.dead_letters), 0)
+            
+            #queued again, as that router does from the journal
+            self.router._transactions.push(transaction)
+        
+        self.assertRaises(ValueError, self.router.next)
+        
+        self.assertEqual(len(self.dead_letters), 1)
+        self.assertEqual(self.router._journal.pending(), 0)
+    
+    def test_replay_dead_letters(self):
+        
+        self.camera.failures = 3
+        self.queue(1)
+        self.run_router(1)
+        
+        self.assertEqual(len(self.dead_letters), 1)
+        
+        self.assertEqual(self.router.replay_dead_letters(), 1)
+        self.assertEqual(len(self.dead_letters), 0)
+        
+        self.run_router(0.2)
+        
+        self.assertEqual(self.camera.processed, [1])
+    
+    def test_retry_delay(self):
+        
+        for attempts, backoff in ((1, 0.05), (2, 0.1), (3, 0.2), (8, 0.2)):
+            for i in range(20):
+                delay = self.camera.retry_delay(attempts)
+                self.assertTrue(backoff * 0.5 <= delay <= backoff, (attempts, delay))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,248 @@
+'''
+Tests of the Router, with stub receivers in place of the hardware and web
+services.
+'''
+
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from production_files.dead_letters import DeadLetterStore
+from production_files.journal import Journal
+from production_files.router import Router, RouterClosedError
+from production_files.session import SessionManager
+from production_files.receivers.receiver import Receiver
+from production_files.receivers.upload_pool import UploadPool, UploadJob
+
+class NullLogger(object):
+
+    def log(self, *messages):
+        pass
+
+class PostReceiver(Receiver):
+    """
+    Takes the posts of the uploaded images, as the twitter receiver does, and
+    keeps their links.
+    """
+    
+    def __init__(self, router, r_id):
+        
+        super(PostReceiver, self).__init__(router, r_id)
+        
+        self.posted = []
+    
+    def process_transaction(self, transaction):
+        
+        if transaction.command == "post":
+            self.posted.append(transaction.command_args)
+            
+        transaction.process(success = True, allow_log = False)
+
+class UploadReceiver(Receiver):
+    """
+    Uploads images on an upload pool kept in the router's sessions, and queues
+    a post of each link once the upload is done, as the flickr receiver does.
+    Each upload waits for the release event.
+    """
+    
+    def __init__(self, router, r_id, retry_file, release):
+        
+        super(UploadReceiver, self).__init__(router, r_id)
+        
+        self.release = release
+        self.uploads = router.sessions.get("uploads", 
+                                           lambda: UploadPool(self.upload, 
+                                                              workers = 1,
+                                                              retry_file = retry_file))
+        self.uploads.bind(self.uploaded)
+    
+    def upload(self, filename, sample, timestamp):
+        
+        self.release.wait(5)
+        return "link/" + filename
+    
+    def uploaded(self, job, link):
+        
+        self.router.create_transaction(origin = job.origin, to_id = "twitter",
+                                       command = "post", command_args = link)
+    
+    def process_transaction(self, transaction):
+        
+        self.uploads.submit(UploadJob(transaction.command_args, 1, 
+                                      datetime.datetime(2026, 10, 17),
+                                      transaction.origin))
+        transaction.process(success = True, allow_log = False)
+    
+    def drain(self):
+        
+        return self.uploads.pending()
+    
+    def cleanup(self):
+        
+        self.router.sessions.release("uploads")
+
+class StubRouter(Router):
+
+    def __init__(self, test, **kwargs):
+        
+        self.test = test
+        
+        kwargs.setdefault('logger', NullLogger())
+        kwargs.setdefault('sessions', test.sessions)
+        kwargs.setdefault('dead_letter_store', test.dead_letters)
+        kwargs.setdefault('pipeline', False)
+        kwargs.setdefault('max_idle', 0.05)
+        
+        super(StubRouter, self).__init__(**kwargs)
+    
+    def _create_receivers(self, gui_communicator):
+        
+        self._add_receiver(PostReceiver(self, "twitter"))
+        self._add_receiver(UploadReceiver(self, "flickr", self.test.retry_file,
+                                          self.test.release))
+
+class RouterTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.directory, "test.journal")
+        self.retry_file = os.path.join(self.directory, "upload_queue.json")
+        self.dead_letters = DeadLetterStore(os.path.join(self.directory, 
+                                                         "dead_letters.sqlite"))
+        self.sessions = SessionManager()
+        self.release = threading.Event()
+    
+    def tearDown(self):
+        
+        self.release.set()
+        self.sessions.release_all()
+        self.dead_letters.close()
+        shutil.rmtree(self.directory)
+    
+    def router(self, **kwargs):
+        
+        return StubRouter(self, journal = Journal(self.journal_file, 
+                                                  commit_interval = 0), **kwargs)
+    
+    def journaled(self):
+        """
+        Returns the (command, command arguments) of the transactions left in
+        the journal.
+        """
+        
+        journal = Journal(self.journal_file)
+        journal.close()
+        
+        return [(record['command'], record['command_args']) 
+                for key, record in journal.recovered]           #@UnusedVariable
+    
+    def test_shutdown_journals_replies_of_pending_uploads(self):
+        
+        router = self.router()
+        router.create_transaction(to_id = "flickr", command = "store", 
+                                  command_args = "a.jpg", origin = "user")
+        router.next()
+        
+        #the upload is only done once the router is shutting down
+        threading.Timer(0.1, self.release.set).start()
+        router.shutdown()
+        
+        self.assertEqual(self.journaled(), [("post", "link/a.jpg")])
+        self.assertEqual(self.sessions.names(), [])
+        
+        #the upload was reported, so it is not kept for the next pool
+        self.assertEqual(UploadPool(None, workers = 0, 
+                                    retry_file = self.retry_file).pending(), 0)
+    
+    def drain_upload(self, **kwargs):
+        """
+        Drains a router with one upload pending, which is done after 0.1 s.
+        Returns the router and the number left.
+        """
+        
+        router = self.router(**kwargs)
+        router.create_transaction(to_id = "flickr", command = "store", 
+                                  command_args = "a.jpg", origin = "user")
+        router.create_transaction(to_id = "twitter", command = "update")
+        
+        if router._executor is None:
+            router.next()
+        
+        threading.Timer(0.1, self.release.set).start()
+        
+        return router, router.drain(5)
+    
+    def test_drain_waits_for_uploads(self):
+        
+        router, left = self.drain_upload()
+        
+        self.assertEqual(left, 0)
+        self.assertEqual(router._route("twitter")[0].posted, ["link/a.jpg"])
+        self.assertEqual(router._journal.pending(), 0)
+        
+        router.shutdown()
+    
+    def test_pipeline_drain_waits_for_uploads(self):
+        
+        router, left = self.drain_upload(pipeline = True)
+        
+        self.assertEqual(left, 0)
+        self.assertEqual(router._route("twitter")[0].posted, ["link/a.jpg"])
+        
+        router.shutdown()
+    
+    def test_drain_times_out_with_upload_held(self):
+        
+        router = self.router()
+        router.create_transaction(to_id = "flickr", command = "store", 
+                                  command_args = "a.jpg", origin = "user")
+        
+        self.assertEqual(router.drain(0.2), 1)
+        
+        self.release.set()
+        router.shutdown()
+        
+        self.assertEqual(self.journaled(), [("post", "link/a.jpg")])
+    
+    def test_closed_router_raises(self):
+        
+        router = self.router()
+        router.close()
+        
+        self.assertRaises(RouterClosedError, router.create_transaction,
+                          to_id = "twitter", command = "post", origin = "user")
+    
+    def test_replies_of_a_closed_router_go_to_the_next(self):
+        
+        router = self.router()
+        router.create_transaction(to_id = "flickr", command = "store", 
+                                  command_args = "a.jpg", origin = "user")
+        router.next()
+        
+        #closed as startup.py does after an error, leaving the sessions open
+        router.close()
+        self.release.set()
+        
+        uploads = self.sessions.get("uploads", None)
+        while uploads._ready or uploads._unreported == []:
+            self.release.wait(0.01)
+        
+        self.assertEqual(uploads.pending(), 1)
+        
+        router = self.router()
+        
+        self.assertEqual(uploads.pending(), 0)
+        self.assertEqual(len(router._transactions), 1)
+        self.assertEqual(router._journal.pending(), 1)
+        
+        router.next()
+        router.close()
+        
+        self.assertEqual(self.journaled(), [])
+
+if __name__ == "__main__":
+    unittest.main()
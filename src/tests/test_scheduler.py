@@ -0,0 +1,141 @@
+'''
+Tests of the order the schedulers take transactions in.
+'''
+
+import threading
+import unittest
+
+from production_files.scheduler import FairScheduler, FifoScheduler
+from production_files.transaction import Transaction
+
+def transaction(command, origin, command_args = None):
+
+    return Transaction(None, "camera", command, command_args, origin)
+
+def drain(scheduler):
+    """
+    Returns the transactions of a scheduler in the order it takes them.
+    """
+    
+    taken = []
+    while len(scheduler) > 0:
+        taken.append(scheduler.pop())
+    
+    return taken
+
+class FifoSchedulerTest(unittest.TestCase):
+
+    def test_takes_in_queued_order(self):
+        
+        scheduler = FifoScheduler()
+        queued = [transaction("get_image", "user%d" %(i % 3)) for i in range(6)]
+        
+        for t in queued:
+            scheduler.push(t)
+        
+        self.assertEqual(drain(scheduler), queued)
+    
+    def test_pop_when_empty_raises(self):
+        
+        self.assertRaises(IndexError, FifoScheduler().pop)
+
+class FairSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.scheduler = FairScheduler()
+    
+    def push(self, *transactions):
+        
+        for t in transactions:
+            self.scheduler.push(t)
+    
+    def test_priority_classes(self):
+        
+        capture = transaction("get_image", "a", 1)
+        other = transaction("translate", "a", "image(1)")
+        admin = transaction("translate", "a", "test(1)")
+        reply = transaction("post", "a", "done")
+        
+        self.push(capture, other, admin, reply)
+        
+        self.assertEqual(drain(self.scheduler), [reply, admin, other, capture])
+    
+    def test_origin_keeps_its_order(self):
+        
+        queued = [transaction("get_image", "a", i) for i in range(5)]
+        self.push(*queued)
+        
+        self.assertEqual(drain(self.scheduler), queued)
+    
+    def test_origins_are_interleaved(self):
+        
+        first = [transaction("get_image", "a", i) for i in range(3)]
+        second = [transaction("get_image", "b", i) for i in range(3)]
+        self.push(*(first + second))
+        
+        self.assertEqual(drain(self.scheduler), [first[0], second[0], first[1],
+                                                 second[1], first[2], second[2]])
+    
+    def test_share_is_weighted_by_cost(self):
+        
+        plan = transaction("get_images", "a", range(12))
+        single = transaction("get_image", "b", 1)
+        later = transaction("get_image", "a", 2)
+        self.push(plan, later, single)
+        
+        #the twelve sample plan is not taken before the single capture asked
+        #for after it
+        self.assertEqual(drain(self.scheduler), [single, plan, later])
+    
+    def test_new_origin_does_not_jump_virtual_time(self):
+        
+        self.push(*[transaction("get_image", "a", i) for i in range(4)])
+        drain(self.scheduler)
+        
+        #the virtual time has moved on, so a user that has been served does
+        #not get ahead of one that has just arrived
+        early = transaction("get_image", "a", 5)
+        late = transaction("get_image", "b", 1)
+        self.push(early, late)
+        
+        self.assertEqual(drain(self.scheduler), [early, late])
+        self.assertEqual(self.scheduler._finish, {})
+    
+    def test_pop_when_empty_raises(self):
+        
+        self.assertRaises(IndexError, self.scheduler.pop)
+    
+    def test_concurrent_push_and_pop(self):
+        
+        per_thread = 2000
+        taken = []
+        
+        def push(origin):
+            for i in xrange(per_thread):
+                self.scheduler.push(transaction("post", origin, i))
+        
+        threads = [threading.Thread(target = push, args = ("user%d" %i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        
+        while any(thread.is_alive() for thread in threads) or len(self.scheduler):
+            try:
+                taken.append(self.scheduler.pop())
+            except IndexError:
+                pass
+        
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(taken), 4 * per_thread)
+        self.assertEqual(len(set(t.id for t in taken)), 4 * per_thread)
+        
+        #every user's transactions are still taken in the order they were queued
+        for i in range(4):
+            args = [t.command_args for t in taken if t.origin == "user%d" %i]
+            self.assertEqual(args, range(per_thread))
+
+if __name__ == "__main__":
+    unittest.main()
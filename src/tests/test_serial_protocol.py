@@ -0,0 +1,216 @@
+'''
+Tests of the serial request/response engine, and of the batches of board
+commands sent with it, against the fake Arduino board on a pseudo-terminal.
+'''
+
+import serial
+import time
+import unittest
+
+from benchmarks.fake_arduino import FakeArduino
+from production_files.receivers import serial_protocol
+from production_files.receivers.camera_communicator import (BoardCommunicator,
+        CameraCommunicator, CameraPosition, FatalCameraException, Lights)
+from production_files.receivers.serial_protocol import SerialProtocolEngine
+
+class SerialProtocolTest(unittest.TestCase):
+
+    def start(self, **kwargs):
+        """
+        Starts an engine connected to a fake board made with the given 
+        arguments.
+        """
+        
+        self.board = FakeArduino(**kwargs)
+        self.connection = serial.Serial(self.board.port, 9600)
+        
+        #the fake board reads a command per line
+        self.engine = SerialProtocolEngine(self.connection, request_terminator = "\n")
+        self.engine.start()
+    
+    def tearDown(self):
+        
+        self.engine.stop()
+        self.connection.close()
+        self.board.close()
+    
+    def test_send(self):
+        
+        self.start()
+        
+        self.assertEqual(self.engine.send("connection", 2), "main")
+        self.assertEqual(self.engine.send("l i 3", 2), "0")
+        self.assertEqual(self.engine.send("x", 2), "1")
+    
+    def test_responses_matched_in_order(self):
+        
+        self.start(response_delay = 0.01)
+        commands = ["h", "x", "m a 1 2 3", "y", "l c"]
+        
+        #every request is sent before the first response arrives
+        pending = [self.engine.request(command, 2) for command in commands]
+        
+        self.assertEqual([response.result() for response in pending],
+                         ["0", "1", "0", "1", "0"])
+        self.assertEqual([response.seq for response in pending], range(1, 6))
+        self.assertEqual(self.board.received, commands)
+    
+    def test_timeout(self):
+        
+        self.start(response_delay = 0.3)
+        pending = self.engine.request("x", 0.1)
+        
+        self.assertRaises(serial.SerialTimeoutException, pending.result)
+        self.assertTrue(pending.expired)
+        
+        #the late response is dropped with its request, not given to the next
+        self.assertEqual(self.engine.send("h", 2), "0")
+    
+    def test_timeouts_by_command(self):
+        
+        self.start()
+        
+        self.assertEqual(self.engine.request("m a 1 2 3").timeout, 
+                         serial_protocol.command_timeouts['m'])
+        self.assertEqual(self.engine.request("l o").timeout, 
+                         serial_protocol.command_timeouts['l'])
+        self.assertEqual(self.engine.request("x").timeout, 
+                         serial_protocol.default_timeout)
+        self.assertEqual(self.engine.request("x", 0.5).timeout, 0.5)
+    
+    def test_unterminated_responses(self):
+        
+        self.start(terminator = "")
+        
+        #complete once the line has been quiet for a poll
+        self.assertEqual(self.engine.send("h", 2), "0")
+        self.assertEqual(self.engine.send("x", 2), "1")
+    
+    def test_stop_fails_waiting_requests(self):
+        
+        self.start(response_delay = 1)
+        pending = self.engine.request("h", 5)
+        self.engine.stop()
+        
+        self.assertRaises(serial.SerialException, pending.result)
+        self.assertRaises(serial.SerialException, self.engine.request, "h")
+        self.assertFalse(self.engine.is_running())
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.board = FakeArduino(response_delay = 0.05)
+        self.board_comm = BoardCommunicator(self.board.port, boot_delay = 0,
+                                            request_terminator = "\n")
+        
+        #the handshake, and the homing done on connecting
+        del self.board.received[:]
+        
+        #the time each command is written
+        self.written = []
+        request = self.board_comm._engine.request
+        
+        def timed_request(message, timeout = None):
+            self.written.append((message, time.time()))
+            return request(message, timeout)
+        
+        self.board_comm._engine.request = timed_request
+    
+    def tearDown(self):
+        
+        self.board_comm.close()
+        self.board.close()
+    
+    def gaps(self):
+        
+        return [(self.written[i + 1][1] - self.written[i][1]) 
+                for i in range(len(self.written) - 1)]
+    
+    def test_lights_not_waited_for(self):
+        
+        self.assertEqual(self.board_comm.send_batch(["l i 1", "l i 2", "l o", "h"]),
+                         [0, 0, 0, 0])
+        self.assertEqual(self.board.received, ["l i 1", "l i 2", "l o", "h"])
+        
+        #all written before the board answered the first
+        self.assertTrue(max(self.gaps()) < 0.04, self.gaps())
+    
+    def test_move_waited_for(self):
+        
+        self.assertEqual(self.board_comm.send_batch(["h", "m a 1 2 3", "l i 4"]),
+                         [0, 0, 0])
+        
+        for gap in self.gaps():
+            self.assertTrue(gap >= 0.04, self.gaps())
+    
+    def test_stops_at_failed_move(self):
+        
+        results = self.board_comm.send_batch(["l i 1", "m a 1 2 far", "l i 2", "h"])
+        
+        self.assertEqual(results, [0, 1])
+        self.assertEqual(self.board.received, ["l i 1", "m a 1 2 far"])
+    
+    def test_failed_light_does_not_stop(self):
+        
+        self.assertEqual(self.board_comm.send_batch(["l x", "l i 1", "h"]), 
+                         [1, 0, 0])
+    
+    def test_bare_commands_waited_for(self):
+        
+        #the fake board still needs each command on its own line
+        self.board_comm.request_terminator = ""
+        
+        self.assertEqual(self.board_comm.send_batch(["l i 1", "l i 2"]), [0, 0])
+        self.assertTrue(self.gaps()[0] >= 0.04, self.gaps())
+    
+    def camera(self):
+        """
+        Returns a CameraCommunicator on the fake board, with a camera that
+        only records the samples it is asked for.
+        """
+        
+        camera = CameraCommunicator.__new__(CameraCommunicator)
+        camera._board_comm = self.board_comm
+        camera._lights = Lights(self.board_comm)
+        camera._camera_positions = CameraPosition(self.board_comm, 10, 10, 10)
+        camera.sample_positions = [(1, 2, 3), (1, 2, "far")]
+        camera.cam = RecordingCamera()
+        
+        return camera
+    
+    def test_capture(self):
+        
+        camera = self.camera()
+        
+        self.assertEqual(camera._capture_at(1, home_after = True), ("now", 1))
+        self.assertEqual(self.board.received, ["m a 1 2 3", "l i 0", "l o", "h"])
+        self.assertEqual(camera._camera_positions.get_position(), (0, 0, 0))
+    
+    def test_capture_stops_at_failed_move(self):
+        
+        camera = self.camera()
+        
+        self.assertRaises(FatalCameraException, camera._capture_at, 2)
+        
+        #the sample was not lit, or imaged, as the camera did not get there
+        self.assertEqual(self.board.received, ["m a 1 2 far"])
+        self.assertEqual(camera.cam.samples, [])
+        self.assertFalse(camera._lights.is_on(1))
+
+class RecordingCamera(object):
+    
+    def __init__(self):
+        
+        self.samples = []
+    
+    def get_image(self, sample_num):
+        
+        self.samples.append(sample_num)
+        return "now", sample_num
+    
+    def idle(self):
+        pass
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+'''
+Tests of the command parser, and of the translator's validation of commands,
+its capture plans and its replies.
+'''
+
+import unittest
+
+from production_files.transaction import Transaction
+from production_files.receivers import command_parser
+from production_files.receivers.command_parser import ParsedCommand
+from production_files.receivers.translator_receiver import (TranslatorReceiver,
+                                                            CaptureRequest)
+
+class NullLogger(object):
+
+    def log(self, *messages):
+        pass
+
+class RecordingRouter(object):
+    """
+    Keeps the transactions the translator creates and clones, instead of
+    routing them.
+    """
+    
+    def __init__(self):
+        
+        self.transactions = []
+    
+    def create_transaction(self, to_id = None, command = None,
+                           command_args = None, origin = None):
+        
+        self.transactions.append(Transaction(NullLogger(), to_id, command,
+                                             command_args, origin))
+    
+    def clone_transaction(self, original_transaction, to_id = None,
+                          command = None, command_args = None):
+        
+        self.transactions.append(original_transaction.clone(to_id, command,
+                                                            command_args))
+
+def routing(transactions):
+    """
+    Returns the (origin, to_id, command, command_args) of each transaction.
+    """
+    
+    return [(transaction.origin, transaction.to_id, transaction.command,
+             transaction.command_args) for transaction in transactions]
+
+class CommandParserTest(unittest.TestCase):
+
+    def test_parse(self):
+        
+        self.assertEqual(command_parser.parse("@pellinglab Sample(3) -A please"),
+                         (ParsedCommand("sample", (3,), ("a",), "sample(3) -a"),))
+    
+    def test_parse_several(self):
+        
+        commands = command_parser.parse("sample( 1, 2 ,12 ) -a -s and help()")
+        
+        self.assertEqual([(c.command, c.samples, c.flags) for c in commands],
+                         [("sample", (1, 2, 12), ("a", "s")), ("help", (), ())])
+        self.assertEqual(str(commands[1]), "help()")
+    
+    def test_parse_invalid(self):
+        
+        for content in ("what are you looking at?", "sample(a)", "sample 3",
+                        "sample(-1)"):
+            self.assertEqual(command_parser.parse(content), (), content)
+        
+        #flags must be single letters, apart from the command
+        self.assertEqual(command_parser.parse("sample(2)-a")[0].flags, ())
+        self.assertEqual(command_parser.parse("sample(2) -ab")[0].flags, ("a",))
+    
+    def test_parse_batch(self):
+        
+        self.assertEqual(command_parser.parse_batch([("sample(1)", "amy"),
+                                                     ("hello", "bob")]),
+                         [("sample(1)", "amy",
+                           (ParsedCommand("sample", (1,), (), "sample(1)"),)),
+                          ("hello", "bob", ())])
+
+class TranslatorTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.router = RecordingRouter()
+        self.translator = TranslatorReceiver(self.router, "translator", 12)
+    
+    def transaction(self, command, command_args, origin = "amy"):
+        
+        return Transaction(NullLogger(), "translator", command, command_args,
+                           origin)
+    
+    def translate(self, content):
+        """
+        Translates a command string, and returns the transaction.
+        """
+        
+        transaction = self.transaction("translate",
+                                       command_parser.parse(content)[0])
+        self.translator.process_transaction(transaction)
+        
+        return transaction
+    
+    def test_sample(self):
+        
+        transaction = self.translate("sample(3, 5) -a")
+        
+        self.assertEqual(routing([transaction]),
+                         [("amy", "camera", "get_image", [5, ["a"]])])
+        self.assertEqual(routing(self.router.transactions),
+                         [("amy", "camera", "get_image", [3, ["a"]])])
+    
+    def test_invalid_samples(self):
+        
+        for content in ("sample(0)", "sample(13)", "sample(2, 13)", "sample()"):
+            transaction = self.translate(content)
+            
+            self.assertEqual((transaction.to_id, transaction.command),
+                             ("twitter", "post"), content)
+            self.assertTrue("between 1 and 12" in transaction.command_args, content)
+        
+        self.assertEqual(self.router.transactions, [])
+    
+    def test_invalid_flag(self):
+        
+        transaction = self.translate("sample(3) -z")
+        
+        self.assertEqual((transaction.to_id, transaction.command),
+                         ("twitter", "post"))
+        self.assertEqual(transaction.command_args,
+                         "The sample command does not take z as an argument. "
+                         "sample(n) -a -s")
+    
+    def test_invalid_command(self):
+        
+        transaction = self.translate("zoom(3)")
+        
+        self.assertEqual(routing([transaction]),
+                         [("amy", "twitter", "post",
+                           "'zoom(3)' contains no valid command. Please tweet "
+                           "help() -c for a list of commands")])
+    
+    def test_help(self):
+        
+        transaction = self.translate("help()")
+        
+        self.assertEqual(routing([transaction]),
+                         [("amy", "twitter", "post",
+                           "Tweet sample(n) to see sample n")])
+        
+        transaction = self.translate("help() -s -c")
+        
+        self.assertEqual(routing([transaction] + self.router.transactions),
+                         [("amy", "twitter", "post", "The syntax is cmd(n, m) -x"),
+                          ("amy", "twitter", "post",
+                           "The commands are sample and help")])
+    
+    def test_parse(self):
+        
+        transaction = self.transaction("parse", "sample(3) -a and help() -s")
+        self.translator.process_transaction(transaction)
+        
+        #the last command string goes on in the transaction, the rest in clones
+        self.assertEqual((transaction.command, transaction.command_args.text),
+                         ("translate", "help() -s"))
+        self.assertEqual([(clone.command, clone.command_args.text)
+                          for clone in self.router.transactions],
+                         [("translate", "sample(3) -a")])
+    
+    def test_parse_nothing(self):
+        
+        transaction = self.transaction("parse", "good morning")
+        self.translator.process_transaction(transaction)
+        
+        self.assertEqual((transaction.to_id, transaction.command),
+                         ("twitter", "post"))
+        self.assertTrue(transaction.command_args.startswith("I cannot understand"))
+    
+    def batch(self, tweets):
+        
+        transaction = self.transaction("batch", tweets, origin = "twitter")
+        self.translator.process_transaction(transaction)
+        
+        self.assertTrue(transaction.processed and transaction.finished)
+        
+        return self.router.transactions
+    
+    def test_batch_coalesces_samples(self):
+        
+        transactions = self.batch([("sample(3) -a", "amy"),
+                                   ("sample(3, 5)", "bob"),
+                                   ("sample(3) -s and sample(3) -a", "amy"),
+                                   ("sample(5) -s", "cat")])
+        
+        #one capture of each sample, with everyone who asked for it, split
+        #between the users who first asked
+        self.assertEqual(routing(transactions),
+                         [("amy", "camera", "get_images",
+                           (CaptureRequest(3, (("amy", ("a", "s")),
+                                               ("bob", ()))),)),
+                          ("bob", "camera", "get_images",
+                           (CaptureRequest(5, (("bob", ()),
+                                               ("cat", ("s",)))),))])
+    
+    def test_batch_one_plan_per_first_requester(self):
+        
+        transactions = self.batch([("sample(1, 2) -a", "amy"),
+                                   ("sample(2)", "bob")])
+        
+        self.assertEqual(routing(transactions),
+                         [("amy", "camera", "get_images",
+                           (CaptureRequest(1, (("amy", ("a",)),)),
+                            CaptureRequest(2, (("amy", ("a",)), ("bob", ())))))])
+    
+    def test_batch_errors_and_help(self):
+        
+        transactions = self.batch([("good morning", "amy"),
+                                   ("sample(13) and sample(4)", "bob"),
+                                   ("sample(4) -z", "cat"),
+                                   ("help() -s", "dan")])
+        
+        self.assertEqual(routing(transactions),
+                         [("amy", "twitter", "post",
+                           "I cannot understand your tweet. Please tweet "
+                           "'help() -s' for my command syntax"),
+                          ("bob", "twitter", "post",
+                           "Your tweet contains invalid sample numbers. Please "
+                           "use sample numbers between 1 and 12"),
+                          ("cat", "twitter", "post",
+                           "The sample command does not take z as an argument. "
+                           "sample(n) -a -s"),
+                          ("dan", "translator", "translate",
+                           command_parser.parse("help() -s")[0]),
+                          ("bob", "camera", "get_images",
+                           (CaptureRequest(4, (("bob", ()),)),))])
+    
+    def test_batch_nothing(self):
+        
+        self.assertEqual(self.batch([]), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+'''
+Tests that the upload pool only forgets an upload once it has been reported.
+'''
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from production_files.receivers.upload_pool import UploadPool, UploadJob
+
+class UploadPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.directory = tempfile.mkdtemp()
+        self.retry_file = os.path.join(self.directory, "upload_queue.json")
+        self.uploaded = []
+        self.reported = []
+        self.done_event = threading.Event()
+    
+    def tearDown(self):
+        
+        shutil.rmtree(self.directory)
+    
+    def upload(self, filename, sample, timestamp):
+        
+        self.uploaded.append(filename)
+        return "link/" + filename
+    
+    def done(self, job, link):
+        
+        self.reported.append((job.filename, link))
+        self.done_event.set()
+    
+    def closed(self, job, link):
+        
+        self.done_event.set()
+        raise RuntimeError("The router is closed")
+    
+    def job(self, filename):
+        
+        return UploadJob(filename, 1, datetime.datetime(2026, 10, 17), "user")
+    
+    def saved(self):
+        
+        with open(self.retry_file, 'r') as retries:
+            return json.load(retries)
+    
+    def test_reported_job_is_removed(self):
+        
+        pool = UploadPool(self.upload, workers = 1, retry_file = self.retry_file)
+        pool.bind(self.done)
+        pool.submit(self.job("a.jpg"))
+        self.assertTrue(self.done_event.wait(5))
+        pool.close()
+        
+        self.assertEqual(self.reported, [("a.jpg", "link/a.jpg")])
+        self.assertEqual(pool.pending(), 0)
+        self.assertEqual(self.saved(), [])
+    
+    def test_unreported_job_is_kept_with_its_link(self):
+        
+        pool = UploadPool(self.upload, workers = 1, retry_file = self.retry_file)
+        pool.bind(self.closed)
+        pool.submit(self.job("a.jpg"))
+        self.assertTrue(self.done_event.wait(5))
+        pool.close()
+        
+        self.assertEqual(pool.pending(), 1)
+        self.assertEqual([values['link'] for values in self.saved()], 
+                         ["link/a.jpg"])
+        
+        #the next pool reports it without uploading it again
+        pool = UploadPool(self.upload, workers = 1, retry_file = self.retry_file)
+        pool.bind(self.done)
+        pool.close()
+        
+        self.assertEqual(self.uploaded, ["a.jpg"])
+        self.assertEqual(self.reported, [("a.jpg", "link/a.jpg")])
+        self.assertEqual(self.saved(), [])
+    
+    def test_users_merged_while_reporting(self):
+        
+        pool = UploadPool(self.upload, workers = 1, retry_file = self.retry_file)
+        merged = []
+        
+        def done(job, link):
+            #another user asks for the image while the first are replied to
+            if not merged:
+                merged.append(True)
+                pool.submit(UploadJob("a.jpg", 1, datetime.datetime(2026, 10, 17),
+                                      "bob", [("cat", ("a",))]))
+            
+            self.done(job, link)
+            self.reported.append((job.origin, job.requesters))
+        
+        pool.bind(done)
+        pool.submit(self.job("a.jpg"))
+        self.assertTrue(self.done_event.wait(5))
+        
+        #waits for the worker to finish reporting
+        pool.close()
+        
+        self.assertEqual(self.uploaded, ["a.jpg"])
+        self.assertEqual(self.reported, [("a.jpg", "link/a.jpg"), ("user", ()),
+                                         ("a.jpg", "link/a.jpg"), 
+                                         ("bob", (("cat", ("a",)),))])
+        self.assertEqual(pool.pending(), 0)
+        self.assertEqual(self.saved(), [])
+    
+    def test_bind_reports_to_new_function(self):
+        
+        pool = UploadPool(self.upload, workers = 1)
+        pool.submit(self.job("a.jpg"))
+        pool.submit(self.job("b.jpg"))
+        
+        #nothing is bound, so the uploads wait for a done function
+        while len(self.uploaded) < 2 or pool._ready:
+            self.done_event.wait(0.01)
+        
+        pool.bind(self.done)
+        pool.close()
+        
+        self.assertEqual(sorted(self.reported), [("a.jpg", "link/a.jpg"), 
+                                                 ("b.jpg", "link/b.jpg")])
+        self.assertEqual(pool.pending(), 0)
+
+if __name__ == "__main__":
+    unittest.main()